@@ -0,0 +1,194 @@
+"""
+archive builds ZIP archives as they are sent, without a temporary file.
+
+Entries are stored uncompressed, since audio does not compress, and their
+CRCs and sizes follow the data in data descriptors, so nothing has to be
+known before the first byte is sent. ZIP64 records are added when an entry
+or the archive outgrows the classic format.
+"""
+import struct
+import time
+import zlib
+
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_COUNT_LIMIT = 0xFFFF
+
+_FLAGS = 0x08 | 0x800  # data descriptor, UTF-8 names
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+def dos_time(timestamp):
+    """Convert a timestamp to the date and time fields of a ZIP entry.
+
+    Args:
+        timestamp (float): Seconds since the epoch.
+
+    Returns:
+        Tuple[int, int]: The DOS time and date.
+
+    """
+    local = time.localtime(timestamp)
+
+    if local.tm_year < 1980:
+        return 0, (1 << 5) | 1
+
+    return ((local.tm_hour << 11) | (local.tm_min << 5) | (local.tm_sec // 2),
+            ((local.tm_year - 1980) << 9) | (local.tm_mon << 5) |
+            local.tm_mday)
+
+
+class _Entry(object):
+    """What the central directory needs to know about a written entry."""
+
+    def __init__(self, name, mtime, offset, zip64):
+        self.name = name.encode("utf-8")
+        self.time, self.date = dos_time(mtime)
+        self.offset = offset
+        self.zip64 = zip64
+        self.crc = 0
+        self.size = 0
+
+    @property
+    def version(self):
+        return 45 if self.zip64 else 20
+
+    def local_header(self):
+        extra = b""
+        size_field = 0
+
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            size_field = ZIP32_LIMIT
+
+        return struct.pack("<IHHHHHIIIHH", 0x04034b50, self.version, _FLAGS,
+                           0, self.time, self.date, 0, size_field, size_field,
+                           len(self.name), len(extra)) + self.name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074b50, self.crc, self.size,
+                               self.size)
+
+        return struct.pack("<IIII", 0x08074b50, self.crc, self.size,
+                           self.size)
+
+    def central_header(self):
+        zip64_fields = []
+        size = self.size
+        offset = self.offset
+
+        if self.zip64 or size >= ZIP32_LIMIT:
+            zip64_fields.extend([size, size])
+            size = ZIP32_LIMIT
+
+        if offset >= ZIP32_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP32_LIMIT
+
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack("<HH", 0x0001, 8 * len(zip64_fields))
+            extra += struct.pack("<%dQ" % len(zip64_fields), *zip64_fields)
+
+        version = 45 if zip64_fields else self.version
+
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | 45,
+                           version, _FLAGS, 0, self.time, self.date,
+                           self.crc, size, size, len(self.name), len(extra),
+                           0, 0, 0, _EXTERNAL_ATTR, offset) + self.name + extra
+
+
+def _end_records(count, directory_offset, directory_size):
+    records = b""
+
+    if (count >= ZIP32_COUNT_LIMIT or directory_offset >= ZIP32_LIMIT or
+            directory_size >= ZIP32_LIMIT):
+        zip64_offset = directory_offset + directory_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0,
+                               count, count, directory_size,
+                               directory_offset)
+        records += struct.pack("<IIQI", 0x07064b50, 0, zip64_offset, 1)
+
+    records += struct.pack("<IHHHHIIH", 0x06054b50, 0, 0,
+                           min(count, ZIP32_COUNT_LIMIT),
+                           min(count, ZIP32_COUNT_LIMIT),
+                           min(directory_size, ZIP32_LIMIT),
+                           min(directory_offset, ZIP32_LIMIT), 0)
+
+    return records
+
+
+def stream_zip(files):
+    """Build a ZIP archive while it is being sent.
+
+    Args:
+        files (Iterable[Tuple[str, float, int, Iterable[bytes]]]): The name,
+            modification time, size and contents of each file. The size may
+            be None if it is not known in advance, in which case the file
+            must be smaller than 4 GiB.
+
+    Yields:
+        bytes: The archive.
+
+    Raises:
+        ValueError: If a file of unknown size turns out to be 4 GiB or
+            larger.
+
+    """
+    entries = []
+    offset = 0
+
+    for name, mtime, size, contents in files:
+        entry = _Entry(name, mtime, offset,
+                       zip64=size is not None and size >= ZIP32_LIMIT)
+        entries.append(entry)
+
+        crc = 0
+        try:
+            header = entry.local_header()
+            offset += len(header)
+            yield header
+
+            for chunk in contents:
+                crc = zlib.crc32(chunk, crc)
+                entry.size += len(chunk)
+                offset += len(chunk)
+
+                if not entry.zip64 and entry.size >= ZIP32_LIMIT:
+                    raise ValueError("%s is too large for a ZIP entry" % name)
+
+                yield chunk
+        finally:
+            if hasattr(contents, "close"):
+                contents.close()
+
+        entry.crc = crc & 0xFFFFFFFF
+
+        descriptor = entry.data_descriptor()
+        offset += len(descriptor)
+        yield descriptor
+
+    directory_offset = offset
+    directory_size = 0
+    for entry in entries:
+        header = entry.central_header()
+        directory_size += len(header)
+        yield header
+
+    yield _end_records(len(entries), directory_offset, directory_size)
+
+
+def archive_name(name):
+    """Make a string safe to use as a file name in an archive.
+
+    Args:
+        name (str): The name, e.g. a track or album title.
+
+    """
+    name = name.replace("/", "-").replace("\\", "-").strip()
+
+    if not name or name in (".", ".."):
+        return "_"
+
+    return name
@@ -0,0 +1,210 @@
+"""
+response_cache keeps encoded responses of the library's read endpoints in
+memory, so they can be sent again without querying or serializing, until
+the library changes.
+"""
+from collections import OrderedDict
+
+from common.streaming import gzip_stream
+
+
+class CachedResponse(object):
+    """The encoded body and headers of a response."""
+
+    def __init__(self, body, headers, compressed=None):
+        """Create a cache entry.
+
+        Args:
+            body (bytes): The response body.
+            headers (List[Tuple[str, str]]): The headers to send with it.
+            compressed (bytes): The body compressed with gzip, or None if it
+                is not worth compressing.
+
+        """
+        self.body = body
+        self.headers = headers
+        self.compressed = compressed
+
+    @property
+    def size(self):
+        """The bytes the entry takes up, roughly."""
+        size = len(self.body) + len(self.compressed or b"")
+
+        for name, value in self.headers:
+            size += len(name) + len(value)
+
+        return size
+
+
+class ResponseCache(object):
+    """A size-bounded, least recently used cache of responses.
+
+    Every entry is built from the library as it was at one generation of its
+    change counter, so the whole cache is dropped as soon as a request sees
+    the counter move on.
+
+    """
+
+    def __init__(self, max_size, compress_level=6, compress_min_size=500):
+        """Create the response cache.
+
+        Args:
+            max_size (int): The maximum size of the cache in bytes.
+            compress_level (int): The gzip level to compress bodies with.
+            compress_min_size (int): The smallest body worth compressing.
+
+        """
+        self.max_size = max_size
+        self.compress_level = compress_level
+        self.compress_min_size = compress_min_size
+        self.generation = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.__entries = OrderedDict()
+
+    @staticmethod
+    def key(path, args):
+        """Create the cache key for a request.
+
+        Args:
+            path (str): The path requested.
+            args (werkzeug.datastructures.MultiDict): The query arguments.
+                The api_key argument is left out, since it does not change
+                the response.
+
+        Returns:
+            Tuple: The cache key.
+
+        """
+        # the order of the values of one argument can matter, e.g. for
+        # conditions, but the order of the arguments does not
+        return path, tuple((name, tuple(values)) for (name, values) in
+                           sorted(args.lists()) if name != "api_key")
+
+    def __check_generation(self, generation):
+        if generation != self.generation:
+            if self.__entries:
+                self.invalidations += 1
+
+            self.__entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def get(self, key, generation):
+        """Look up a cached response.
+
+        Args:
+            key (Tuple): The cache key.
+            generation (int): The library's current change counter.
+
+        Returns:
+            CachedResponse: The cached response, or None if it is not cached.
+
+        """
+        self.__check_generation(generation)
+
+        entry = self.__entries.pop(key, None)
+
+        if entry is None:
+            self.misses += 1
+
+            return None
+
+        # mark the entry as the most recently used
+        self.__entries[key] = entry
+        self.hits += 1
+
+        return entry
+
+    def put(self, key, generation, body, headers):
+        """Cache a response, compressing its body.
+
+        Args:
+            key (Tuple): The cache key.
+            generation (int): The library's change counter when the response
+                was built.
+            body (bytes): The response body.
+            headers (List[Tuple[str, str]]): The headers to send with it.
+
+        Returns:
+            CachedResponse: The cache entry, even if it was too large to
+                keep.
+
+        """
+        compressed = None
+        if len(body) >= self.compress_min_size:
+            compressed = b"".join(gzip_stream([body], self.compress_level))
+
+            if len(compressed) >= len(body):
+                compressed = None
+
+        entry = CachedResponse(body, headers, compressed)
+
+        if self.generation is not None and generation < self.generation:
+            # the library changed while the response was built
+            return entry
+
+        self.__check_generation(generation)
+
+        if key in self.__entries:
+            self.size -= self.__entries.pop(key).size
+
+        if entry.size <= self.max_size:
+            self.__entries[key] = entry
+            self.size += entry.size
+            self.evict()
+
+        return entry
+
+    def tee(self, chunks, key, generation, headers):
+        """Cache a streamed response once it has been sent in full.
+
+        Args:
+            chunks (Iterable[bytes]): The response body.
+            key (Tuple): The cache key.
+            generation (int): The library's change counter when the response
+                was started.
+            headers (List[Tuple[str, str]]): The headers to send with it.
+
+        Yields:
+            bytes: The response body.
+
+        """
+        body = []
+        size = 0
+
+        for chunk in chunks:
+            if body is not None:
+                body.append(chunk)
+                size += len(chunk)
+
+                if size > self.max_size:
+                    # too large to keep, so stop collecting it
+                    body = None
+
+            yield chunk
+
+        if body is not None:
+            self.put(key, generation, b"".join(body), headers)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        while self.size > self.max_size and self.__entries:
+            dummy, entry = self.__entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    def stats(self):
+        """Return the cache's statistics as a dict."""
+        lookups = self.hits + self.misses
+
+        return dict(entries=len(self.__entries), size=self.size,
+                    max_size=self.max_size, hits=self.hits,
+                    misses=self.misses, evictions=self.evictions,
+                    invalidations=self.invalidations,
+                    hit_ratio=round(float(self.hits) / lookups, 3)
+                    if lookups else 0.0)
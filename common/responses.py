@@ -0,0 +1,243 @@
+"""Helpers to build HTTP responses for audio files."""
+import calendar
+import os
+
+from flask import Response
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a requested byte range lies outside of the file."""
+    pass
+
+
+def parse_range(header, size):
+    """Parse a Range header for a single byte range.
+
+    Args:
+        header (str): The value of the Range header.
+        size (int): The size of the requested file in bytes.
+
+    Returns:
+        Tuple[int, int]: The first and last byte of the range (inclusive), or
+            None if the header is missing or asks for more than one range.
+
+    Raises:
+        RangeNotSatisfiable: If the range does not overlap the file.
+
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+
+    byte_range = header[len("bytes="):].strip()
+
+    if "," in byte_range or "-" not in byte_range:
+        return None
+
+    first, last = byte_range.split("-", 1)
+
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # a suffix range such as "bytes=-500" is the last 500 bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+
+    if start > end:
+        return None
+
+    return start, min(end, size - 1)
+
+
+def read_range(fileobj, length, chunk_size=8192):
+    """Yield length bytes from a file, starting at its current position.
+
+    Args:
+        fileobj (file): The file to read.
+        length (int): The number of bytes to read.
+        chunk_size (int): The maximum size of each chunk.
+
+    """
+    try:
+        while length > 0:
+            chunk = fileobj.read(min(chunk_size, length))
+            if not chunk:
+                break
+
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def read_file(filename, chunk_size=8192):
+    """Yield a whole file. It is not opened until the first chunk is read.
+
+    Args:
+        filename (str): The path of the file.
+        chunk_size (int): The maximum size of each chunk.
+
+    """
+    fileobj = open(filename, "rb")
+
+    for chunk in read_range(fileobj, os.path.getsize(filename), chunk_size):
+        yield chunk
+
+
+def file_etag(file_stat):
+    """Return a strong entity tag identifying a version of a file.
+
+    Args:
+        file_stat (os.stat_result): The file's status.
+
+    """
+    return "%x-%x-%x" % (file_stat.st_ino, int(file_stat.st_mtime * 1000000),
+                         file_stat.st_size)
+
+
+def http_timestamp(date):
+    """Convert a date parsed from an HTTP header to seconds since the epoch.
+
+    Args:
+        date (datetime.datetime): The date, in UTC.
+
+    """
+    return calendar.timegm(date.utctimetuple())
+
+
+def matching_etag(req, etag):
+    """Find the entity tag in a request's If-None-Match that matches etag.
+
+    flask_compress appends the content coding to the entity tags of
+    responses it compresses, e.g. "1f-2a:gzip", so that suffix is ignored.
+
+    Args:
+        req (flask.Request): The request object.
+        etag (str): The current entity tag of the resource.
+
+    Returns:
+        str: The matching tag as the client sent it, or None.
+
+    """
+    if req.if_none_match.star_tag:
+        return etag
+
+    for tag in req.if_none_match.as_set(include_weak=True):
+        if tag == etag or tag.startswith(etag + ":"):
+            return tag
+
+    return None
+
+
+def not_modified(req, etag, last_modified=None):
+    """Build a 304 response if the client's copy of a resource is current.
+
+    If-None-Match is checked if it was sent, otherwise If-Modified-Since.
+
+    Args:
+        req (flask.Request): The request object.
+        etag (str): The current entity tag of the resource.
+        last_modified (float): When the resource last changed, in seconds
+            since the epoch.
+
+    Returns:
+        flask.Response: The 304 response, or None if the resource should be
+            sent.
+
+    """
+    if req.method not in ("GET", "HEAD"):
+        return None
+
+    if req.if_none_match:
+        matched = matching_etag(req, etag)
+
+        if not matched:
+            return None
+    elif (last_modified is not None and req.if_modified_since and
+          int(last_modified) <= http_timestamp(req.if_modified_since)):
+        matched = etag
+    else:
+        return None
+
+    resp = Response(status=304)
+    resp.set_etag(matched)
+
+    if last_modified is not None:
+        resp.last_modified = int(last_modified)
+
+    return resp
+
+
+def send_file_range(req, filename, mimetype, chunk_size=8192):
+    """Send a file, honouring a single byte range in the request.
+
+    Ranges reaching the end of the file are handed to the server's
+    wsgi.file_wrapper so they can be sent with sendfile. The response's
+    entity tag is derived from the file's identity, so conditional requests
+    for an unchanged file get a 304.
+
+    Args:
+        req (flask.Request): The request object.
+        filename (str): The path of the file to send.
+        mimetype (str): The content type of the file.
+        chunk_size (int): The block size used when reading the file.
+
+    Returns:
+        flask.Response: A 200, 206, 304 or 416 response.
+
+    """
+    file_stat = os.stat(filename)
+    size = file_stat.st_size
+    etag = file_etag(file_stat)
+
+    unchanged = not_modified(req, etag, file_stat.st_mtime)
+    if unchanged:
+        return unchanged
+
+    range_header = req.headers.get("Range")
+
+    # a range of an older version of the file is no use, send all of it
+    if range_header and req.headers.get("If-Range"):
+        if req.if_range.etag:
+            if req.if_range.etag != etag:
+                range_header = None
+        elif (not req.if_range.date or int(file_stat.st_mtime) >
+              http_timestamp(req.if_range.date)):
+            range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        resp = Response(status=416)
+        resp.headers["Content-Range"] = "bytes */%d" % size
+        return resp
+
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+
+    sent_file = open(filename, "rb")
+    sent_file.seek(start)
+
+    file_wrapper = req.environ.get("wsgi.file_wrapper")
+    if file_wrapper and end == size - 1:
+        body = file_wrapper(sent_file, chunk_size)
+    else:
+        body = read_range(sent_file, length, chunk_size)
+
+    resp = Response(body, mimetype=mimetype, direct_passthrough=True)
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.content_length = length
+    resp.set_etag(etag)
+    resp.last_modified = int(file_stat.st_mtime)
+
+    if byte_range:
+        resp.status_code = 206
+        resp.headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+
+    return resp
@@ -0,0 +1,137 @@
+"""
+streaming serializes large responses piece by piece, so they are sent as
+they are built and never held in memory whole.
+"""
+import itertools
+import tempfile
+import zlib
+
+from flask import json
+
+
+def json_array(items, chunk_size=65536):
+    """Serialize items as a JSON array, a chunk at a time.
+
+    The opening bracket is sent straight away, so the first byte does not
+    wait for the first chunk to fill.
+
+    Args:
+        items (Iterable): The JSON serializable items.
+        chunk_size (int): How many bytes to collect before yielding them.
+
+    Yields:
+        bytes: The array.
+
+    """
+    yield b"["
+
+    buffered = []
+    buffered_size = 0
+    separator = b""
+
+    for item in items:
+        encoded = separator + json.dumps(item).encode("utf-8")
+        separator = b","
+
+        buffered.append(encoded)
+        buffered_size += len(encoded)
+
+        if buffered_size >= chunk_size:
+            yield b"".join(buffered)
+            buffered = []
+            buffered_size = 0
+
+    buffered.append(b"]")
+    yield b"".join(buffered)
+
+
+def json_columns(fields, rows, chunk_rows=10000, spool_size=1048576,
+                 chunk_size=65536):
+    """Serialize rows as a JSON object holding an array of each field's
+    values.
+
+    No key name is repeated for every row, and each column is encoded a
+    slice at a time rather than a value at a time, so it is much smaller
+    and faster to build than an array of objects.
+
+    The rows are read in a single pass before the first byte is sent, so
+    every column comes from the same rows. Each column is encoded into a
+    spool of its own as they are read, which moves to a temporary file once
+    it grows past spool_size, so the rows are never held in memory whole.
+
+    Args:
+        fields (List[str]): The names of the fields.
+        rows (Iterable[Sequence]): The rows, starting with the values of the
+            fields in that order.
+        chunk_rows (int): How many values to encode at once.
+        spool_size (int): How many bytes of each column to keep in memory.
+        chunk_size (int): The most bytes of a column to send at once.
+
+    Yields:
+        bytes: The object.
+
+    """
+    spools = [tempfile.SpooledTemporaryFile(max_size=spool_size)
+              for field in fields]
+
+    try:
+        rows = iter(rows)
+        values_separator = b""
+        batch = list(itertools.islice(rows, chunk_rows))
+
+        while batch:
+            for index, spool in enumerate(spools):
+                spool.write(values_separator + json.dumps(
+                    [row[index] for row in batch],
+                    separators=(",", ":"))[1:-1].encode("utf-8"))
+
+            values_separator = b","
+            batch = list(itertools.islice(rows, chunk_rows))
+
+        separator = "{"
+
+        for field, spool in zip(fields, spools):
+            yield (separator + json.dumps(field) + ":[").encode("utf-8")
+            separator = ","
+
+            spool.seek(0)
+            chunk = spool.read(chunk_size)
+
+            while chunk:
+                yield chunk
+                chunk = spool.read(chunk_size)
+
+            yield b"]"
+
+        if separator == "{":
+            yield b"{"
+
+        yield b"}"
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream with gzip as it is sent.
+
+    Every chunk is flushed from the compressor, so the client can start
+    decoding before the stream ends.
+
+    Args:
+        chunks (Iterable[bytes]): The stream.
+        level (int): The compression level.
+
+    Yields:
+        bytes: The compressed stream.
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressed
+
+    yield compressor.flush()
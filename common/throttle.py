@@ -0,0 +1,202 @@
+"""
+throttle limits how fast responses are sent, for each user and in total,
+with token buckets that wait by sleeping the sending greenlet.
+"""
+import time
+
+import gevent
+
+
+class TokenBucket(object):
+    """A token bucket counting bytes."""
+
+    def __init__(self, rate, burst):
+        """Create a full token bucket.
+
+        Args:
+            rate (float): The bytes added to the bucket each second.
+            burst (int): The most bytes the bucket can hold.
+
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.time()
+
+    def reserve(self, amount):
+        """Take bytes from the bucket, going into debt if there are too few.
+
+        Args:
+            amount (int): The number of bytes to take.
+
+        Returns:
+            float: The seconds to wait before sending them.
+
+        """
+        now = time.time()
+        self.__tokens = min(self.burst, self.__tokens +
+                            (now - self.__updated) * self.rate)
+        self.__updated = now
+        self.__tokens -= amount
+
+        if self.__tokens >= 0:
+            return 0.0
+
+        return -self.__tokens / self.rate
+
+
+class BandwidthShaper(object):
+    """Share the upload bandwidth between users and kinds of stream.
+
+    Interactive streams, i.e. playback, may use the whole global rate.
+    While any are active, bulk streams, i.e. downloads, are together held to
+    a share of it, so downloads cannot starve playback.
+
+    """
+
+    def __init__(self, global_rate=0, user_rate=0, bulk_share=0.25,
+                 burst=262144):
+        """Create a bandwidth shaper.
+
+        Args:
+            global_rate (int): The most bytes per second to send in total,
+                or 0 for no limit.
+            user_rate (int): The most bytes per second to send to each user,
+                or 0 for no limit.
+            bulk_share (float): The share of the global rate left to bulk
+                streams while interactive streams are active.
+            burst (int): The most bytes sent at once before limits apply.
+
+        """
+        self.global_rate = global_rate
+        self.user_rate = user_rate
+        self.bulk_share = bulk_share
+        self.burst = burst
+        self.delayed = 0.0
+
+        self.__global = None
+        self.__bulk = None
+        if global_rate:
+            self.__global = TokenBucket(global_rate, burst)
+            self.__bulk = TokenBucket(global_rate * bulk_share, burst)
+
+        self.__users = {}
+        self.__streams = {}
+        self.__active = {True: 0, False: 0}
+
+    def shape(self, stream, user_id, interactive=True):
+        """Wrap a response body to send it within the limits.
+
+        Args:
+            stream (Iterable[bytes]): The response body.
+            user_id: The id of the user the response is sent to.
+            interactive (bool): False for bulk downloads.
+
+        Returns:
+            ShapedStream: The wrapped response body.
+
+        """
+        if self.user_rate and user_id not in self.__users:
+            self.__users[user_id] = TokenBucket(self.user_rate, self.burst)
+
+        self.__streams[user_id] = self.__streams.get(user_id, 0) + 1
+        self.__active[interactive] += 1
+
+        return ShapedStream(stream, self, user_id, interactive)
+
+    def reserve(self, amount, user_id, interactive=True):
+        """Take bytes from every bucket a stream is limited by.
+
+        Args:
+            amount (int): The number of bytes to send.
+            user_id: The id of the user they are sent to.
+            interactive (bool): False for bulk downloads.
+
+        Returns:
+            float: The seconds to wait before sending them.
+
+        """
+        delay = 0.0
+
+        if user_id in self.__users:
+            delay = self.__users[user_id].reserve(amount)
+
+        if self.__global:
+            delay = max(delay, self.__global.reserve(amount))
+
+            if not interactive and self.__active[True]:
+                delay = max(delay, self.__bulk.reserve(amount))
+
+        self.delayed += delay
+
+        return delay
+
+    def finish(self, user_id, interactive=True):
+        """Forget a finished stream.
+
+        Args:
+            user_id: The id of the user it was sent to.
+            interactive (bool): False for bulk downloads.
+
+        """
+        self.__active[interactive] -= 1
+        self.__streams[user_id] -= 1
+
+        if not self.__streams[user_id]:
+            del self.__streams[user_id]
+            self.__users.pop(user_id, None)
+
+    def stats(self):
+        """Return the shaper's statistics as a dict."""
+        return dict(interactive=self.__active[True],
+                    bulk=self.__active[False],
+                    global_rate=self.global_rate, user_rate=self.user_rate,
+                    delayed=round(self.delayed, 3))
+
+
+class ShapedStream(object):
+    """A response body sent within a BandwidthShaper's limits."""
+
+    def __init__(self, stream, shaper, user_id, interactive):
+        """Wrap a response body.
+
+        Args:
+            stream (Iterable[bytes]): The response body.
+            shaper (BandwidthShaper): The shaper the stream is counted in.
+            user_id: The id of the user the response is sent to.
+            interactive (bool): False for bulk downloads.
+
+        """
+        self.__stream = stream
+        self.__iterator = iter(stream)
+        self.__shaper = shaper
+        self.__user_id = user_id
+        self.__interactive = interactive
+        self.__closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.__iterator)
+
+        delay = self.__shaper.reserve(len(chunk), self.__user_id,
+                                      self.__interactive)
+        if delay:
+            gevent.sleep(delay)
+
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        """Close the wrapped body and stop counting the stream."""
+        if self.__closed:
+            return
+
+        self.__closed = True
+
+        if hasattr(self.__stream, "close"):
+            self.__stream.close()
+
+        self.__shaper.finish(self.__user_id, self.__interactive)
@@ -1,3 +1,8 @@
+import base64
+import json
+import re
+
+
 def make_where_clause(params, join_operator="AND"):
     """Create a where clause from the param.
 
@@ -65,3 +70,129 @@ def update_clause_from_dict(data):
         pass
 
     return set_statement
+
+
+# maps mutagen's file types to their container format and audio codec
+_STREAM_FORMATS = {
+    "AAC": ("aac", "aac"),
+    "AIFF": ("aiff", "pcm"),
+    "EasyMP3": ("mp3", "mp3"),
+    "EasyMP4": ("mp4", "aac"),
+    "EasyTrueAudio": ("tta", "tta"),
+    "FLAC": ("flac", "flac"),
+    "MonkeysAudio": ("ape", "ape"),
+    "MP3": ("mp3", "mp3"),
+    "MP4": ("mp4", "aac"),
+    "OggFLAC": ("ogg", "flac"),
+    "OggOpus": ("ogg", "opus"),
+    "OggSpeex": ("ogg", "speex"),
+    "OggVorbis": ("ogg", "vorbis"),
+    "WAVE": ("wav", "pcm"),
+    "WavPack": ("wv", "wavpack"),
+}
+
+
+def stream_info(metadata):
+    """Describe the audio stream of a file read by mutagen.
+
+    Args:
+        metadata: The object returned by mutagen.File().
+
+    Returns:
+        dict: The container format, audio codec, bitrate (in kbit/s) and
+            duration (in seconds) of the file. Values that cannot be
+            determined are None.
+    """
+
+    container_format, codec = _STREAM_FORMATS.get(type(metadata).__name__,
+                                                  (None, None))
+    bitrate = None
+    duration = None
+
+    info = getattr(metadata, "info", None)
+    if info is not None:
+        if getattr(info, "bitrate", None):
+            bitrate = int(info.bitrate // 1000)
+
+        duration = getattr(info, "length", None)
+
+        # MP4 files may hold ALAC instead of AAC
+        if str(getattr(info, "codec", "")).startswith("alac"):
+            codec = "alac"
+
+    return {"format": container_format, "codec": codec, "bitrate": bitrate,
+            "duration": duration}
+
+
+def encode_cursor(*values):
+    """Encode values into an opaque pagination cursor.
+
+    Args:
+        *values: JSON serializable values, e.g. the sort key of a row.
+
+    Returns:
+        str: The cursor, safe to use in a URL.
+
+    """
+    encoded = base64.urlsafe_b64encode(json.dumps(values).encode("utf-8"))
+
+    return encoded.decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        list: The values encoded in it.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+            padded.encode("ascii")).decode("utf-8"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+
+    return values
+
+
+def search_words(text):
+    """Split a search into words, as the search index splits names.
+
+    Args:
+        text (str): The search.
+
+    Returns:
+        List[str]: The words, lowercased.
+    """
+
+    return re.findall(r"[^\W_]+", text.lower(), re.UNICODE)
+
+
+def match_query(text):
+    """Create a full-text query matching names with words starting with
+    each word of a search, so that it matches while it is being typed.
+
+    Args:
+        text (str): The search.
+
+    Returns:
+        str: The FTS5 query, or None if the search has no words.
+    """
+
+    words = search_words(text)
+
+    if not words:
+        return None
+
+    return " ".join('"%s"*' % word for word in words)
@@ -2,9 +2,11 @@
 db_manager exposes a DbManager class to make interacting with sqlite
 databases easier.
 """
+import contextlib
 import logging
 import os
 import sqlite3
+import time
 
 import six
 
@@ -34,8 +36,28 @@ class DbManager(object):
         "REFERENCES artist(id), FOREIGN KEY(track_id) REFERENCES track(id))"
     create_track_table = "CREATE TABLE IF NOT EXISTS track (id INTEGER, "\
         "tracknumber INTEGER, name TEXT(2000000000), grouping "\
-        "TEXT(2000000000), filename TEXT(2000000000), CONSTRAINT TRACK_PK "\
-        "PRIMARY KEY (id))"
+        "TEXT(2000000000), filename TEXT(2000000000), format TEXT, codec "\
+        "TEXT, bitrate INTEGER, duration REAL, CONSTRAINT TRACK_PK PRIMARY "\
+        "KEY (id))"
+    # a single row counting changes to the library, so that responses built
+    # from it can be cached until it changes
+    create_library_state_table = "CREATE TABLE IF NOT EXISTS library_state "\
+        "(id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT "\
+        "NULL, modified REAL NOT NULL)"
+    # columns added since the first release, with their types, which are
+    # added to existing databases when they are opened
+    added_columns = {
+        "track": [("format", "TEXT"), ("codec", "TEXT"),
+                  ("bitrate", "INTEGER"), ("duration", "REAL")],
+    }
+    create_album_date_index = "CREATE INDEX IF NOT EXISTS album_date_IDX ON "\
+        "album(date)"
+    create_album_name_index = "CREATE INDEX IF NOT EXISTS album_name_IDX ON "\
+        "album(name)"
+    create_artist_name_index = "CREATE INDEX IF NOT EXISTS artist_name_IDX "\
+        "ON artist(name)"
+    create_artist_sortname_index = "CREATE INDEX IF NOT EXISTS "\
+        "artist_sortname_IDX ON artist(sortname)"
     create_musicbrainz_artist_index = "CREATE UNIQUE INDEX IF NOT EXISTS "\
         "artist_musicbrainz_artistid ON artist(musicbrainz_artistid ASC)"
     create_track_filename_index = "CREATE INDEX IF NOT EXISTS "\
@@ -47,6 +69,51 @@ class DbManager(object):
     create_track_number_index = "CREATE INDEX IF NOT EXISTS "\
         "track_tracknumber_IDX ON track(tracknumber)"
 
+    # the rows whose names were added, changed or deleted, so that indexes
+    # kept outside the database can catch up with changes made by any
+    # connection. Only the latest changes are kept.
+    create_library_changes_table = "CREATE TABLE IF NOT EXISTS "\
+        "library_changes (id INTEGER PRIMARY KEY AUTOINCREMENT, "\
+        "table_name TEXT NOT NULL, row_id INTEGER NOT NULL)"
+    kept_changes = 100000
+    create_change_triggers = [
+        "CREATE TRIGGER IF NOT EXISTS {0}_change_insert AFTER INSERT ON {0} "
+        "BEGIN INSERT INTO library_changes (table_name, row_id) VALUES "
+        "('{0}', new.id); END",
+        "CREATE TRIGGER IF NOT EXISTS {0}_change_delete AFTER DELETE ON {0} "
+        "BEGIN INSERT INTO library_changes (table_name, row_id) VALUES "
+        "('{0}', old.id); END",
+        "CREATE TRIGGER IF NOT EXISTS {0}_change_update AFTER UPDATE OF name "
+        "ON {0} BEGIN INSERT INTO library_changes (table_name, row_id) "
+        "VALUES ('{0}', new.id); END",
+    ]
+    create_change_prune_trigger = "CREATE TRIGGER IF NOT EXISTS "\
+        "library_changes_prune AFTER INSERT ON library_changes BEGIN DELETE "\
+        "FROM library_changes WHERE id <= new.id - %d; END" % kept_changes
+
+    # full-text indexes of the names searched for, which read their text
+    # from the tables they index and are kept up to date by triggers, so
+    # every change to a name is indexed however it is made
+    search_tables = {
+        "album": ("name",),
+        "artist": ("name", "sortname"),
+        "track": ("name",),
+    }
+    create_search_table = "CREATE VIRTUAL TABLE IF NOT EXISTS {0}_fts USING "\
+        "fts5({1}, content='{0}', content_rowid='id', tokenize='unicode61 "\
+        "remove_diacritics 2', prefix='1 2 3')"
+    create_search_triggers = [
+        "CREATE TRIGGER IF NOT EXISTS {0}_fts_insert AFTER INSERT ON {0} "
+        "BEGIN INSERT INTO {0}_fts (rowid, {1}) VALUES (new.id, {3}); END",
+        "CREATE TRIGGER IF NOT EXISTS {0}_fts_delete AFTER DELETE ON {0} "
+        "BEGIN INSERT INTO {0}_fts ({0}_fts, rowid, {1}) VALUES ('delete', "
+        "old.id, {2}); END",
+        "CREATE TRIGGER IF NOT EXISTS {0}_fts_update AFTER UPDATE OF {1} ON "
+        "{0} BEGIN INSERT INTO {0}_fts ({0}_fts, rowid, {1}) VALUES "
+        "('delete', old.id, {2}); INSERT INTO {0}_fts (rowid, {1}) VALUES "
+        "(new.id, {3}); END",
+    ]
+
     @staticmethod
     def iterdump(connection):
         """Iterates through the database, creating commands to dump all the
@@ -61,8 +128,19 @@ class DbManager(object):
                 ORDER BY "name";
             """
         schema_res = cursor.execute(query).fetchall()
+        virtual_tables = [table_name for table_name, dummy, sql in schema_res
+                          if sql.startswith("CREATE VIRTUAL TABLE")]
+
         for table_name, dummy, sql in schema_res:
-            if table_name == "sqlite_sequence":
+            if table_name in virtual_tables:
+                # creating it creates its shadow tables, and its contents
+                # are rebuilt once everything else has been copied
+                yield six.u("{0};").format(sql)
+                continue
+            elif any(table_name.startswith(virtual_table + "_")
+                     for virtual_table in virtual_tables):
+                continue
+            elif table_name == "sqlite_sequence":
                 yield "DELETE FROM \"sqlite_sequence\";"
             elif table_name == "sqlite_stat1":
                 yield "ANALYZE \"sqlite_master\";"
@@ -96,8 +174,13 @@ class DbManager(object):
         for dummy, dummy2, sql in schema_res.fetchall():
             yield six.u("{0};").format(sql)
 
+        for table_name in virtual_tables:
+            yield six.u("INSERT INTO \"{0}\" (\"{0}\") VALUES "
+                        "('rebuild');").format(table_name)
+
     def __init__(self, db_file):
         new_db = False
+        self.has_search_index = False
         cache_size_kb = 9766
         self.db_file = db_file
 
@@ -117,6 +200,8 @@ class DbManager(object):
             cursor.execute("pragma cache_size=-%s" % cache_size_kb)
             cursor.close()
 
+            self.upgrade_tables()
+
         self.conn.row_factory = sqlite3.Row
 
     def export(self):
@@ -163,6 +248,26 @@ class DbManager(object):
         """Interrupt the connection"""
         return self.conn.interrupt()
 
+    @contextlib.contextmanager
+    def time_limit(self, seconds):
+        """Interrupt the statements run in a with block once it has taken
+        too long, which makes them raise sqlite3.OperationalError.
+
+        Args:
+            seconds (float): How long the block may take.
+
+        """
+        deadline = time.time() + seconds
+
+        # called every few thousand virtual machine instructions, and
+        # interrupts the statement by returning True
+        self.conn.set_progress_handler(lambda: time.time() > deadline, 1000)
+
+        try:
+            yield
+        finally:
+            self.conn.set_progress_handler(None, 1000)
+
     def create_tables(self):
         """Create the database tables"""
         with self.conn:
@@ -177,3 +282,133 @@ class DbManager(object):
             self.conn.execute(DbManager.create_track_grouping_index)
             self.conn.execute(DbManager.create_track_name_index)
             self.conn.execute(DbManager.create_track_number_index)
+            self.create_sort_indexes()
+            self.create_library_state()
+            self.create_library_changes()
+            self.create_search_index()
+
+    def upgrade_tables(self):
+        """Add any columns missing from tables created by older versions"""
+        with self.conn:
+            for (table, columns) in six.iteritems(DbManager.added_columns):
+                existing_columns = [
+                    row[1] for row in self.conn.execute(
+                        "PRAGMA table_info(%s)" % table)]
+
+                for (column, column_type) in columns:
+                    if column not in existing_columns:
+                        self.conn.execute("ALTER TABLE %s ADD COLUMN %s %s" %
+                                          (table, column, column_type))
+
+            self.create_sort_indexes()
+            self.create_library_state()
+            self.create_library_changes()
+            self.create_search_index()
+
+    def create_sort_indexes(self):
+        """Create the indexes on the columns listings can be sorted by"""
+        self.conn.execute(DbManager.create_album_date_index)
+        self.conn.execute(DbManager.create_album_name_index)
+        self.conn.execute(DbManager.create_artist_name_index)
+        self.conn.execute(DbManager.create_artist_sortname_index)
+
+    def create_library_state(self):
+        """Create the library state table and its row, if they are missing"""
+        self.conn.execute(DbManager.create_library_state_table)
+        self.conn.execute("INSERT OR IGNORE INTO library_state (id, "
+                          "generation, modified) VALUES (0, 0, ?)",
+                          (time.time(),))
+
+    def create_library_changes(self):
+        """Create the table recording changed names, and its triggers"""
+        self.conn.execute(DbManager.create_library_changes_table)
+        self.conn.execute(DbManager.create_change_prune_trigger)
+
+        for table in sorted(DbManager.search_tables):
+            for trigger in DbManager.create_change_triggers:
+                self.conn.execute(trigger.format(table))
+
+    def last_change(self):
+        """Return the id of the latest change recorded, or 0 if there is
+        none."""
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name "
+                                "= 'library_changes'").fetchone()
+
+        return row[0] if row else 0
+
+    def changes_since(self, change_id):
+        """Return the names changed after a change.
+
+        Args:
+            change_id (int): The id of the change, e.g. the latest one seen
+                when an index was built.
+
+        Returns:
+            List[Tuple[int, str, int]]: The id, table and row id of each
+                later change, in order, or None if some of them are no
+                longer recorded.
+
+        """
+        changes = [tuple(row) for row in self.conn.execute(
+            "SELECT id, table_name, row_id FROM library_changes WHERE id > ? "
+            "ORDER BY id", (change_id,))]
+
+        # ids are never reused and the oldest changes are pruned first, so
+        # a gap after the change means the ones in it were pruned
+        if changes and changes[0][0] > change_id + 1:
+            return None
+
+        return changes
+
+    def create_search_index(self):
+        """Create the full-text search tables and the triggers that update
+        them, indexing the library if they are new.
+
+        Searches fall back to LIKE if SQLite was built without FTS5.
+
+        """
+        for (table, columns) in sorted(DbManager.search_tables.items()):
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?",
+                (table + "_fts",)).fetchone()
+
+            try:
+                self.conn.execute(DbManager.create_search_table.format(
+                    table, ", ".join(columns)))
+            except sqlite3.OperationalError as exc:
+                _LOGGER.warning("Cannot create the search index: %s", exc)
+                return
+
+            for trigger in DbManager.create_search_triggers:
+                self.conn.execute(trigger.format(
+                    table, ", ".join(columns),
+                    ", ".join("old." + column for column in columns),
+                    ", ".join("new." + column for column in columns)))
+
+            if not exists:
+                self.conn.execute("INSERT INTO {0}_fts ({0}_fts) VALUES "
+                                  "('rebuild')".format(table))
+
+        self.has_search_index = True
+
+    def generation(self):
+        """Return the library's change counter and when it last changed.
+
+        Returns:
+            Tuple[int, float]: The counter, and the time of the last change
+                in seconds since the epoch.
+
+        """
+        row = self.conn.execute("SELECT generation, modified FROM "
+                                "library_state WHERE id = 0").fetchone()
+
+        return row[0], row[1]
+
+    def bump_generation(self):
+        """Record a change to the library.
+
+        Call it in the transaction that makes the change.
+
+        """
+        self.conn.execute("UPDATE library_state SET generation = generation "
+                          "+ 1, modified = ? WHERE id = 0", (time.time(),))
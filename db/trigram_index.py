@@ -0,0 +1,354 @@
+"""
+trigram_index keeps the names in the library in memory, indexed by their
+trigrams, so they can be searched for despite typos.
+"""
+from array import array
+import bisect
+from collections import Counter
+import logging
+import math
+import re
+import unicodedata
+
+from models.base import BATCH_SIZE
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# the lowest similarity a name must have to a search to be returned
+DEFAULT_THRESHOLD = 0.3
+
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase text and strip its accents and punctuation.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The words of the text, separated by single spaces.
+
+    """
+    text = text.lower()
+
+    try:
+        text.encode("ascii")
+    except UnicodeError:
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in decomposed
+                       if not unicodedata.combining(char))
+
+    return " ".join(_WORD.findall(text))
+
+
+def trigrams(text):
+    """Split text into the trigrams of its words.
+
+    Each word is padded with two spaces before it and one after it, so the
+    start of a word, which is typed first, weighs more than its end.
+
+    Args:
+        text (str): The normalized text.
+
+    Returns:
+        Set[str]: The trigrams.
+
+    """
+    grams = set()
+
+    for word in text.split():
+        padded = "  %s " % word
+        grams.update([padded[start:start + 3]
+                      for start in range(len(padded) - 2)])
+
+    return grams
+
+
+def similarity(shared, grams, other_grams):
+    """Return the Jaccard similarity of two sets of trigrams.
+
+    Args:
+        shared (int): The number of trigrams in both sets.
+        grams (int): The size of one set.
+        other_grams (int): The size of the other set.
+
+    """
+    return float(shared) / (grams + other_grams - shared)
+
+
+class TrigramIndex(object):
+    """An inverted index from trigrams to the names they are in.
+
+    Each distinct name is a document, shared by all the rows with that
+    name. A trigram's postings are split by the number of trigrams of the
+    documents, since the more trigrams a name has, the more of them it must
+    share with a search to be similar enough. Each list of postings stays
+    sorted because documents are only ever appended. A document whose rows
+    have all been removed or renamed is skipped until the index is
+    compacted.
+
+    """
+
+    def __init__(self):
+        self.__documents = {}
+        self.__row_documents = {}
+        self.__names = []
+        self.__rows = []
+        self.__sizes = array("l")
+        self.__postings = {}
+        self.__live_postings = 0
+        self.__dead_postings = 0
+
+    def __len__(self):
+        return len(self.__row_documents)
+
+    def add(self, row_id, name):
+        """Index a name, replacing the one indexed for its row before.
+
+        Args:
+            row_id (int): The id of the row the name belongs to.
+            name (str): The name.
+
+        """
+        self.remove(row_id)
+
+        name = normalize(name or "")
+        if not name:
+            return
+
+        doc = self.__documents.get(name)
+
+        if doc is None:
+            grams = trigrams(name)
+            size = len(grams)
+            doc = len(self.__names)
+
+            self.__documents[name] = doc
+            self.__names.append(name)
+            self.__rows.append([])
+            self.__sizes.append(size)
+            self.__live_postings += size
+
+            for gram in grams:
+                by_size = self.__postings.get(gram)
+                if by_size is None:
+                    by_size = self.__postings[gram] = {}
+
+                postings = by_size.get(size)
+                if postings is None:
+                    postings = by_size[size] = []
+
+                postings.append(doc)
+
+        self.__rows[doc].append(row_id)
+        self.__row_documents[row_id] = doc
+
+    def remove(self, row_id):
+        """Stop finding a row's name.
+
+        Args:
+            row_id (int): The id of the row the name belongs to.
+
+        """
+        doc = self.__row_documents.pop(row_id, None)
+        if doc is None:
+            return
+
+        rows = self.__rows[doc]
+        rows.remove(row_id)
+
+        if not rows:
+            del self.__documents[self.__names[doc]]
+            self.__live_postings -= self.__sizes[doc]
+            self.__dead_postings += self.__sizes[doc]
+            self.__sizes[doc] = 0
+
+            if self.__dead_postings > self.__live_postings + 1024:
+                self.compact()
+
+    def compact(self):
+        """Rebuild the index without the documents no row has any more."""
+        live = [(row_id, self.__names[doc]) for (row_id, doc) in
+                self.__row_documents.items()]
+
+        self.__init__()
+
+        for row_id, name in sorted(live):
+            self.add(row_id, name)
+
+    def search(self, text, limit=None, threshold=DEFAULT_THRESHOLD):
+        """Find the names most similar to a search.
+
+        Args:
+            text (str): The search.
+            limit (int): The most rows to return, or None for all of them.
+            threshold (float): The lowest similarity to return.
+
+        Returns:
+            List[Tuple[int, float]]: The ids of the rows and the similarity
+                of their names to the search, most similar first.
+
+        """
+        grams = trigrams(normalize(text))
+        if not grams:
+            return []
+
+        by_size = [self.__postings.get(gram, {}) for gram in grams]
+        found = []
+
+        # only names with about as many trigrams as the search can be
+        # similar enough
+        for size in range(int(math.ceil(threshold * len(grams))),
+                          int(len(grams) / threshold) + 1):
+            # the trigrams a name of this size must share with the search
+            least_shared = int(math.ceil(
+                threshold * (len(grams) + size) / (1 + threshold) - 1e-9))
+
+            postings = sorted((postings.get(size, ()) for postings in
+                               by_size), key=len)
+
+            # a name sharing that many trigrams shares at least one of the
+            # rarest ones, so only their postings are counted, and the
+            # common ones are only searched for the names found
+            rare = len(grams) - least_shared + 1
+            counts = Counter()
+            for documents in postings[:rare]:
+                counts.update(documents)
+
+            common = postings[rare:]
+
+            for doc, shared in counts.items():
+                # the common trigrams a name may lack and still be similar
+                allowed_misses = len(common) + shared - least_shared
+
+                for documents in common:
+                    if allowed_misses < 0:
+                        break
+
+                    position = bisect.bisect_left(documents, doc)
+                    if (position < len(documents) and
+                            documents[position] == doc):
+                        shared += 1
+                    else:
+                        allowed_misses -= 1
+
+                if allowed_misses >= 0 and self.__sizes[doc]:
+                    found.append((-similarity(shared, len(grams), size),
+                                  len(self.__names[doc]), doc))
+
+        found.sort()
+
+        results = []
+        for score, dummy, doc in found:
+            for row_id in sorted(self.__rows[doc]):
+                if len(results) == limit:
+                    return results
+
+                results.append((row_id, -score))
+
+        return results
+
+
+class LibraryTrigramIndex(object):
+    """Trigram indexes of the names of a library's tracks, albums and
+    artists, kept up to date with the changes DbManager records.
+
+    """
+
+    tables = ("album", "artist", "track")
+
+    def __init__(self, database):
+        """Index the library.
+
+        Args:
+            database (DbManager): The library.
+
+        """
+        self.database = database
+        self.last_change = 0
+        self.builds = 0
+        self.updates = 0
+        self.__indexes = {}
+
+        self.build()
+
+    def build(self):
+        """Index every name in the library from scratch."""
+        # read before the names, so a change made while they are read is
+        # applied again by the next refresh rather than missed
+        self.last_change = self.database.last_change()
+
+        for table in self.tables:
+            index = TrigramIndex()
+
+            for row in self.database.execute(
+                    "SELECT id, name FROM %s" % table):
+                index.add(row[0], row[1])
+
+            self.__indexes[table] = index
+
+        self.builds += 1
+
+        _LOGGER.info("Indexed %d names for fuzzy search",
+                     sum(len(index) for index in self.__indexes.values()))
+
+    def refresh(self):
+        """Apply the changes made to the library since it was indexed."""
+        changes = self.database.changes_since(self.last_change)
+
+        if changes is None:
+            # the changes were recorded so long ago they have been dropped
+            self.build()
+            return
+
+        changed = {}
+        for change_id, table, row_id in changes:
+            changed.setdefault(table, set()).add(row_id)
+            self.last_change = change_id
+
+        for table, row_ids in changed.items():
+            if table not in self.__indexes:
+                continue
+
+            index = self.__indexes[table]
+            row_ids = list(row_ids)
+
+            for start in range(0, len(row_ids), BATCH_SIZE):
+                batch = row_ids[start:start + BATCH_SIZE]
+                names = dict(self.database.execute(
+                    "SELECT id, name FROM %s WHERE id IN (%s)" % (
+                        table, ", ".join("?" * len(batch))), batch))
+
+                for row_id in batch:
+                    if row_id in names:
+                        index.add(row_id, names[row_id])
+                    else:
+                        index.remove(row_id)
+
+            self.updates += len(row_ids)
+
+    def search(self, table, text, limit=None):
+        """Find the names in a table most similar to a search.
+
+        Args:
+            table (str): "track", "album" or "artist".
+            text (str): The search.
+            limit (int): The most ids to return, or None for all of them.
+
+        Returns:
+            List[int]: The ids of the rows, most similar first.
+
+        """
+        self.refresh()
+
+        return [name_id for (name_id, dummy) in
+                self.__indexes[table].search(text, limit)]
+
+    def stats(self):
+        """Return the index's statistics as a dict."""
+        return dict(names=dict((table, len(index)) for (table, index) in
+                               self.__indexes.items()),
+                    builds=self.builds, updates=self.updates,
+                    last_change=self.last_change)
@@ -1,16 +1,23 @@
 #!/usr/bin/env python
 """This module implements a library for storing information on audio tracks."""
+import argparse
 import logging
+import multiprocessing
 import os
+import time
 
-from gevent import monkey, queue
-from gevent.pool import Group
+from gevent import GreenletExit, monkey, queue
+from gevent.pool import Group, Pool
 import mutagen
 import six
 from six.moves import configparser, range
 
 from db.db_manager import DbManager
 from models.track import Track
+from transcode.cache import TranscodeCache
+from transcode.profiles import TranscodeProfile
+from transcode.stream import (remove_output, start_transcode, stop_process,
+                              wait_process)
 
 
 logging.basicConfig(format="%(asctime)s %(message)s", level=logging.DEBUG)
@@ -158,15 +165,194 @@ class MediaLibrary(object):
         track.filename = _u(newpath)
         track.save()
 
+    def transcode_track_task(self, filename, profile, cache, counters,
+                             pipe_output=None):
+        """Transcode a track into the transcode cache.
+
+        Args:
+            filename (str): The path of the track.
+            profile (TranscodeProfile): The profile to transcode with.
+            cache (TranscodeCache): The transcode cache.
+            counters (Dict[str, int]): The progress counters to update.
+            pipe_output (str): If set, the transcoder writes to stdout and
+                {output} is replaced by this placeholder.
+
+        """
+        try:
+            key = TranscodeCache.key(filename, profile.identity())
+        except OSError:
+            _LOGGER.error("Missing file %s", filename)
+            counters["failed"] += 1
+            return
+
+        if cache.contains(key):
+            counters["skipped"] += 1
+            return
+
+        temp_filename = cache.temp_path(key)
+        proc = None
+
+        try:
+            proc = start_transcode(profile, filename, temp_filename,
+                                   pipe_output=pipe_output)
+            returncode = wait_process(proc)
+        except OSError as exc:
+            _LOGGER.error(exc)
+            returncode = None
+        except GreenletExit:
+            # interrupted, the transcode is picked up again on the next run
+            if proc:
+                stop_process(proc)
+            remove_output(temp_filename)
+            raise
+
+        if returncode == 0:
+            counters["bytes"] += os.path.getsize(temp_filename)
+            cache.put(key, temp_filename)
+            counters["transcoded"] += 1
+        else:
+            _LOGGER.error("Problem transcoding %s with %s", filename,
+                          profile.name)
+            remove_output(temp_filename)
+            counters["failed"] += 1
+
+    def transcoded_size(self, profiles):
+        """Estimate the size of the library transcoded with some profiles.
+
+        Args:
+            profiles (List[TranscodeProfile]): The profiles.
+
+        Returns:
+            int: The estimated size in bytes, from the duration of the tracks
+                and the bitrate of the profiles that have one.
+
+        """
+        duration = self.__database.execute(
+            "SELECT TOTAL(duration) FROM track").fetchone()[0]
+
+        return int(sum(duration * profile.bitrate * 1000 / 8
+                       for profile in profiles if profile.bitrate))
+
+    def transcode(self, profiles, cache, processes=None, pipe_output=None,
+                  report_interval=10):
+        """Transcode every track in the library into the transcode cache.
+
+        Tracks that are already cached are skipped, so an interrupted run
+        continues where it left off.
+
+        Args:
+            profiles (List[TranscodeProfile]): The profiles to transcode with.
+            cache (TranscodeCache): The transcode cache.
+            processes (int): How many transcoders to run at once. Defaults to
+                the number of CPU cores.
+            pipe_output (str): If set, transcoders write to stdout and
+                {output} is replaced by this placeholder.
+            report_interval (float): How often, in seconds, to log progress.
+
+        Returns:
+            Dict[str, int]: The number of tracks transcoded, skipped and
+                failed, and the number of bytes written.
+
+        """
+        if not processes:
+            processes = multiprocessing.cpu_count()
+
+        needed = self.transcoded_size(profiles)
+        if needed > cache.max_size:
+            _LOGGER.warning("The tracks need about %d MB when transcoded, "
+                            "more than the %d MB the transcode cache holds, "
+                            "so the first ones will be evicted again",
+                            needed // 1024 // 1024,
+                            cache.max_size // 1024 // 1024)
+
+        counters = dict(transcoded=0, skipped=0, failed=0, bytes=0)
+        total = self.__database.execute(
+            "SELECT COUNT(*) FROM track").fetchone()[0] * len(profiles)
+        started = time.time()
+        last_report = started
+
+        _LOGGER.info("Transcoding %d tracks with %d processes", total,
+                     processes)
+
+        tasks = Pool(processes)
+        try:
+            for row in self.__database.execute("SELECT filename FROM track "
+                                               "ORDER BY id").fetchall():
+                for profile in profiles:
+                    tasks.spawn(self.transcode_track_task, row["filename"],
+                                profile, cache, counters, pipe_output)
+
+                    if time.time() - last_report >= report_interval:
+                        last_report = time.time()
+                        self.__report_transcode(counters, total, started)
+
+            tasks.join()
+        except KeyboardInterrupt:
+            tasks.kill()
+            _LOGGER.info("Interrupted")
+
+        self.__report_transcode(counters, total, started)
+
+        return counters
+
+    @staticmethod
+    def __report_transcode(counters, total, started):
+        elapsed = max(time.time() - started, 0.001)
+        done = counters["transcoded"] + counters["skipped"] + \
+            counters["failed"]
+
+        _LOGGER.info("%d/%d done (%d transcoded, %d skipped, %d failed), "
+                     "%.2f tracks/s, %.2f MB/s", done, total,
+                     counters["transcoded"], counters["skipped"],
+                     counters["failed"], counters["transcoded"] / elapsed,
+                     counters["bytes"] / elapsed / 1024 / 1024)
+
 
 if __name__ == "__main__":
     monkey.patch_all(thread=False)
     __CONFIG = configparser.ConfigParser()
     __CONFIG.read("mach2.ini")
 
+    parser = argparse.ArgumentParser(description="Manage the media library.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("scan", help="store all tracks in the media "
+                          "directory (the default), and fill in the format, "
+                          "codec, bitrate and duration of tracks stored "
+                          "without them")
+    transcode_parser = subparsers.add_parser(
+        "transcode", help="transcode every track into the transcode cache")
+    transcode_parser.add_argument("-p", "--profile", action="append",
+                                  required=True, dest="profiles",
+                                  help="a transcode profile to use, may be "
+                                  "given more than once")
+    transcode_parser.add_argument("-j", "--processes", type=int,
+                                  help="how many transcoders to run at once, "
+                                  "defaults to the number of CPU cores")
+    args = parser.parse_args()
+
     db = DbManager(__CONFIG.get("DEFAULT", "library"))
     media_path = __CONFIG.get("DEFAULT", "media_dir")
 
     media_library = MediaLibrary(media_path, db)
 
-    media_library.run()
+    if args.command == "transcode":
+        all_profiles = TranscodeProfile.from_config(__CONFIG)
+
+        for profile_name in args.profiles:
+            if profile_name not in all_profiles:
+                parser.error("unknown transcode profile %s" % profile_name)
+
+        transcode_cache = TranscodeCache(
+            __CONFIG.get("transcode_cache", "directory"),
+            __CONFIG.getint("transcode_cache", "max_size_mb") * 1024 * 1024)
+
+        transcode_pipe_output = None
+        if __CONFIG.get("transcode", "mode") == "pipe":
+            transcode_pipe_output = __CONFIG.get("transcode", "pipe_output")
+
+        media_library.transcode(
+            [all_profiles[profile_name] for profile_name in args.profiles],
+            transcode_cache, processes=args.processes,
+            pipe_output=transcode_pipe_output)
+    else:
+        media_library.run()
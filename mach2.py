@@ -1,24 +1,48 @@
 """An app to serve a music library."""
 import base64
+import functools
+import itertools
 import os
 import subprocess
 import sqlite3
 import tempfile
+import time
 
 import mimetypes
 
 from flask import (Blueprint, Flask, Response, abort, current_app, g, jsonify,
-                   redirect, render_template, request, url_for)
+                   redirect, render_template, request, stream_with_context,
+                   url_for)
 from flask_compress import Compress
 from flask_login import (LoginManager, current_user, login_required,
                          login_user, logout_user)
+import six
 from six.moves import configparser
-
+from six.moves.urllib.parse import quote, urlencode
+
+from common.archive import archive_name, stream_zip
+from common.response_cache import ResponseCache
+from common.responses import not_modified, read_file, send_file_range
+from common.streaming import gzip_stream, json_array, json_columns
+from common.throttle import BandwidthShaper
+from common.utils import decode_cursor, encode_cursor
 from db.db_manager import DbManager
+from db.trigram_index import LibraryTrigramIndex
 from models.album import Album
 from models.artist import Artist
+from models.base import BATCH_SIZE, BaseModel
 from models.track import Track
 from models.user import User
+from transcode.adaptive import (ThroughputTracker, bandwidth_hint,
+                                choose_profile, log_choice)
+from transcode.cache import TranscodeCache
+from transcode.flight import TranscodeFlights
+from transcode.prefetch import Prefetcher
+from transcode.profiles import TranscodeProfile
+from transcode.scheduler import SchedulerBusy, TranscodeScheduler
+from transcode.segments import (PLAYLIST_MIMETYPE, master_playlist,
+                                media_playlist, segment_bounds)
+from transcode.stream import stream_file, stream_transcode
 
 
 _CONFIG = configparser.ConfigParser()
@@ -41,6 +65,24 @@ def get_db():
     return database
 
 
+def upgrade_db(database):
+    """Add any columns missing from an application database.
+
+    Args:
+        database (str): The path of the application database.
+
+    """
+    conn = sqlite3.connect(database)
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(user)")]
+
+    if columns and "transcode_profile" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE user ADD COLUMN transcode_profile TEXT")
+
+    conn.close()
+
+
 @MACH2.teardown_app_request
 def close_connection(exception):
     """Close the database connection."""
@@ -91,7 +133,8 @@ def load_user_from_request(req):
                         authenticated=0,
                         active=result[4],
                         anonymous=result[5],
-                        transcode_command=result[7])
+                        transcode_command=result[7],
+                        transcode_profile=result[8])
 
         if user:
             return user
@@ -100,6 +143,587 @@ def load_user_from_request(req):
     return None
 
 
+# the relationships each listing can include with ?include=, and the batch
+# loaders that fetch them for a whole page at once
+ALBUM_INCLUDES = {"artists": Album.load_artists, "tracks": Album.load_tracks}
+ARTIST_INCLUDES = {"albums": Artist.load_albums, "tracks": Artist.load_tracks}
+TRACK_INCLUDES = {"album": Track.load_albums, "artists": Track.load_artists}
+
+
+def include_names(loaders):
+    """Read the relationships requested with ?include=.
+
+    Args:
+        loaders (Dict[str, Callable]): The batch loader of each relationship
+            that can be included.
+
+    Returns:
+        List[str]: The names of the relationships.
+
+    Raises:
+        ValueError: If an unknown relationship was requested.
+
+    """
+    names = []
+    for value in request.args.getlist("include"):
+        for name in value.split(","):
+            if name and name not in names:
+                if name not in loaders:
+                    raise ValueError("Unknown relationship %s" % name)
+
+                names.append(name)
+
+    return names
+
+
+def field_names(model):
+    """Read the fields requested with ?fields=.
+
+    Args:
+        model (type): The model class listed.
+
+    Returns:
+        List[str]: The names of the fields, or None if all of them were
+            requested.
+
+    Raises:
+        ValueError: If an unknown field was requested, or relationships were
+            requested with ?include= as well.
+
+    """
+    fields = []
+    for value in request.args.getlist("fields"):
+        for name in value.split(","):
+            if name and name not in fields:
+                fields.append(name)
+
+    if not fields:
+        return None
+
+    model.check_fields(fields)
+
+    if request.args.get("include"):
+        raise ValueError("fields cannot be combined with include")
+
+    return fields
+
+
+def serialize(objects, names, loaders):
+    """Serialize models with some of their relationships.
+
+    Args:
+        objects (List[BaseModel]): The models to serialize.
+        names (List[str]): The relationships to include.
+        loaders (Dict[str, Callable]): The batch loader of each relationship.
+
+    Returns:
+        List[dict]: The serialized models.
+
+    """
+    for name in names:
+        loaders[name](current_app.config["LIBRARY"], objects)
+
+    results = []
+    for model in objects:
+        result = model.as_dict()
+
+        for name in names:
+            related = getattr(model, name)
+
+            if isinstance(related, list):
+                result[name] = [item.as_dict() for item in related]
+            else:
+                result[name] = related.as_dict() if related else None
+
+        results.append(result)
+
+    return results
+
+
+def with_includes(objects, loaders, fields=None):
+    """Serialize models with the relationships requested in ?include=.
+
+    Args:
+        objects (List): The models to serialize, or the dicts of the fields
+            already selected from them.
+        loaders (Dict[str, Callable]): The batch loader of each relationship
+            that can be included.
+        fields (List[str]): The only fields to serialize, or None for all of
+            them.
+
+    Returns:
+        List[dict]: The serialized models.
+
+    Raises:
+        ValueError: If an unknown relationship was requested.
+
+    """
+    if fields:
+        # listings that cannot select the fields in SQL load whole models
+        return [item if isinstance(item, dict) else
+                BaseModel.project(item.as_dict(), fields) for item in objects]
+
+    return serialize(objects, include_names(loaders), loaders)
+
+
+def use_streaming(model, default_order):
+    """Check whether a listing request should be streamed.
+
+    Whole listings, without a limit, are streamed as they are read from the
+    database, as long as they are sorted by a column the model can page by.
+
+    Args:
+        model (type): The model class listed.
+        default_order (str): The column sorted by if none is requested.
+
+    """
+    order = request.args.get("order") or default_order
+
+    return (not request.args.get("limit") and
+            not request.args.get("offset") and
+            not request.args.get("cursor") and
+            model.sort_column(order) is not None)
+
+
+def stream_listing(model, default_order, loaders, fields=None):
+    """Stream a whole listing as a JSON array.
+
+    Rows are read from the database cursor and serialized a batch at a
+    time, so memory use does not grow with the size of the library. The
+    output is compressed here when the client accepts gzip, as
+    flask_compress would otherwise buffer or skip the stream.
+
+    Args:
+        model (type): The model class to list.
+        default_order (str): The column to sort by if none is requested.
+        loaders (Dict[str, Callable]): The batch loader of each relationship
+            that can be included.
+        fields (List[str]): The only fields to select, or None for whole
+            models.
+
+    Returns:
+        flask.Response: The streamed response.
+
+    Raises:
+        ValueError: If the sort order or a requested relationship is not
+            valid.
+
+    """
+    names = include_names(loaders)
+    models = model.iterate(current_app.config["LIBRARY"],
+                           request.args.get("order") or default_order,
+                           request.args.get("direction") or "ASC", fields)
+
+    def results():
+        if fields:
+            # the rows are serialized straight from the cursor
+            for result in models:
+                yield result
+
+            return
+
+        batch = list(itertools.islice(models, BATCH_SIZE))
+
+        while batch:
+            for result in serialize(batch, names, loaders):
+                yield result
+
+            batch = list(itertools.islice(models, BATCH_SIZE))
+
+    return stream_response(json_array(results()), "application/json")
+
+
+def stream_columns(model, default_order, fields):
+    """Stream a whole listing in the columns format.
+
+    The values are read from the database cursor as they are, without
+    creating models or a dict for each row. The query is run once the
+    response is sent, and all of it is read before the first byte, so the
+    columns line up even if the library changes meanwhile.
+
+    Args:
+        model (type): The model class to list.
+        default_order (str): The column to sort by if none is requested.
+        fields (List[str]): The fields to send.
+
+    Returns:
+        flask.Response: The streamed response.
+
+    Raises:
+        ValueError: If the sort order or a field is not valid.
+
+    """
+    select_string, parameters, dummy = model.sorted_query(
+        request.args.get("order") or default_order,
+        request.args.get("direction") or "ASC", fields=fields)
+    database = current_app.config["LIBRARY"]
+
+    def rows():
+        for row in database.execute(select_string, parameters):
+            yield row
+
+    return stream_response(json_columns(fields, rows()), COLUMNS_MIMETYPE)
+
+
+def stream_response(body, mimetype):
+    """Build a streamed response, caching and compressing it on the way.
+
+    Args:
+        body (Iterable[bytes]): The response body.
+        mimetype (str): The media type of the body.
+
+    Returns:
+        flask.Response: The streamed response.
+
+    """
+    resp = Response(mimetype=mimetype)
+    resp.headers["Vary"] = "Accept-Encoding"
+
+    cache_key = getattr(g, "response_cache_key", None)
+    if cache_key:
+        body = current_app.config["RESPONSE_CACHE"].tee(
+            body, cache_key[0], cache_key[1],
+            [("Content-Type", resp.headers["Content-Type"])])
+
+    if request.accept_encodings["gzip"]:
+        body = gzip_stream(body, current_app.config.get("COMPRESS_LEVEL", 6))
+        resp.headers["Content-Encoding"] = "gzip"
+
+    resp.response = stream_with_context(body)
+
+    return resp
+
+
+# the media type of listings sent as one array of values per field, for
+# clients that fetch whole listings and do not need the key names repeated
+COLUMNS_MIMETYPE = "application/vnd.mach2.columns+json"
+
+
+def use_columns():
+    """Check whether a listing should be sent in the columns format.
+
+    It is asked for with ?format=columns, or by preferring its media type
+    to JSON in the Accept header.
+
+    """
+    if request.args.get("format"):
+        return request.args["format"] == "columns"
+
+    return request.accept_mimetypes.best_match(
+        ["application/json", COLUMNS_MIMETYPE]) == COLUMNS_MIMETYPE
+
+
+def column_names(model, fields):
+    """Return the fields a listing sends as columns.
+
+    Args:
+        model (type): The model class listed.
+        fields (List[str]): The fields requested with ?fields=, or None.
+
+    Returns:
+        List[str]: The fields, or None if the listing is not sent in the
+            columns format.
+
+    Raises:
+        ValueError: If relationships were requested with ?include=.
+
+    """
+    if not use_columns():
+        return None
+
+    if request.args.get("include"):
+        raise ValueError("include cannot be used with the columns format")
+
+    return fields or list(model.columns)
+
+
+def columns_response(results, fields):
+    """Send serialized models in the columns format.
+
+    Args:
+        results (List[dict]): The serialized models.
+        fields (List[str]): The fields to send.
+
+    Returns:
+        flask.Response: The response.
+
+    """
+    rows = [[result[field] for field in fields] for result in results]
+
+    return Response(b"".join(json_columns(fields, rows)),
+                    mimetype=COLUMNS_MIMETYPE)
+
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def search_limit(default=DEFAULT_PAGE_SIZE, maximum=None):
+    """Read the most results a search should return from ?limit=.
+
+    Args:
+        default (int): The limit if none was requested.
+        maximum (int): The highest limit allowed, or None for no cap.
+
+    Returns:
+        int: The limit, capped at the maximum.
+
+    Raises:
+        ValueError: If the limit is not positive.
+
+    """
+    limit = request.args.get("limit", default, type=int)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    if maximum:
+        limit = min(limit, maximum)
+
+    return limit
+
+
+def use_fuzzy():
+    """Check whether a search asked for similar names with ?fuzzy=1."""
+    return request.args.get("fuzzy", "0").lower() in ("1", "true", "yes")
+
+
+def find(model, text, limit):
+    """Search for models by name.
+
+    Names starting with the words searched for are found with the full-text
+    index, or, with ?fuzzy=1, names similar to the search are found with
+    the trigram index, which tolerates typos.
+
+    Args:
+        model (type): The model class to search.
+        text (str): The search.
+        limit (int): The most models to return.
+
+    Returns:
+        List[BaseModel]: The models, best matches first.
+
+    Raises:
+        ValueError: If fuzzy search was requested but is not enabled.
+
+    """
+    database = current_app.config["LIBRARY"]
+
+    if not use_fuzzy():
+        return model.match(database, text, limit)
+
+    index = current_app.config["FUZZY_INDEX"]
+    if not index:
+        raise ValueError("Fuzzy search is not enabled")
+
+    return model.by_ids(database, index.search(model.table, text, limit))
+
+
+def use_keyset(model, default_order):
+    """Check whether a listing request should be paged with a cursor.
+
+    That is the case when it continues from a cursor, or asks for a limit
+    without an offset, sorted by a column the model can page by.
+
+    Args:
+        model (type): The model class listed.
+        default_order (str): The column sorted by if none is requested.
+
+    """
+    if request.args.get("cursor"):
+        return True
+
+    order = request.args.get("order") or default_order
+
+    return (bool(request.args.get("limit")) and
+            not request.args.get("offset") and
+            model.sort_column(order) is not None)
+
+
+def keyset_page(model, default_order, fields=None):
+    """Fetch a page of a listing, continuing from ?cursor= if it is given.
+
+    Args:
+        model (type): The model class to list.
+        default_order (str): The column to sort by if none is requested.
+        fields (List[str]): The only fields to select, or None for whole
+            models.
+
+    Returns:
+        Tuple[List, str]: The models, or dicts of their fields, and the
+            cursor of the next page or None if this is the last one.
+
+    Raises:
+        ValueError: If the cursor, sort column or limit is not valid.
+
+    """
+    cursor = request.args.get("cursor")
+    after = None
+
+    if cursor:
+        try:
+            order, direction, value, last_id = decode_cursor(cursor)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+        # it comes from the client, so it may hold anything
+        if not (isinstance(order, six.string_types) and
+                isinstance(direction, six.string_types) and
+                isinstance(value, (six.string_types, six.integer_types,
+                                   float, type(None))) and
+                isinstance(last_id, six.integer_types)):
+            raise ValueError("Invalid cursor")
+
+        after = (value, last_id)
+    else:
+        order = request.args.get("order") or default_order
+        direction = request.args.get("direction") or "ASC"
+
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    models, last = model.page(current_app.config["LIBRARY"], order, direction,
+                              limit, after, fields)
+
+    if not last:
+        return models, None
+
+    return models, encode_cursor(order, direction, *last)
+
+
+def link_next_page(resp, cursor):
+    """Point a listing response to its next page.
+
+    Args:
+        resp (flask.Response): The response.
+        cursor (str): The cursor of the next page, or None.
+
+    Returns:
+        flask.Response: The response.
+
+    """
+    if cursor:
+        args = [(key, value) for (key, value) in request.args.items(True)
+                if key not in ("cursor", "order", "direction", "offset")]
+        args.append(("cursor", cursor))
+
+        resp.headers["Link"] = '<%s?%s>; rel="next"' % (request.base_url,
+                                                        urlencode(args))
+        resp.headers["X-Next-Cursor"] = cursor
+
+    return resp
+
+
+# headers that are set again for every response rather than cached
+UNCACHED_HEADERS = frozenset(("content-length", "content-encoding", "etag",
+                              "last-modified", "cache-control", "vary",
+                              "set-cookie"))
+
+
+def cached_response(entry):
+    """Build a response from the response cache.
+
+    Args:
+        entry (CachedResponse): The cached response.
+
+    Returns:
+        flask.Response: The response, compressed if the client accepts gzip.
+
+    """
+    resp = Response(entry.body, headers=entry.headers)
+    resp.vary.add("Accept-Encoding")
+
+    if entry.compressed and request.accept_encodings["gzip"]:
+        resp.set_data(entry.compressed)
+        resp.headers["Content-Encoding"] = "gzip"
+
+    return resp
+
+
+def cached_view(view, generation, *args, **kwargs):
+    """Answer a request from the response cache, building it on a miss.
+
+    Args:
+        view (Callable): The view function.
+        generation (int): The library's change counter.
+
+    Returns:
+        flask.Response: The response.
+
+    """
+    cache = current_app.config["RESPONSE_CACHE"]
+    if cache is None:
+        return current_app.make_response(view(*args, **kwargs))
+
+    # listings can be sent in the columns format as asked for in the Accept
+    # header, which the arguments do not cover
+    key = ResponseCache.key(request.path, request.args) + (use_columns(),)
+
+    entry = cache.get(key, generation)
+    if entry:
+        return cached_response(entry)
+
+    # lets streamed listings cache themselves once they have been sent
+    setattr(g, "response_cache_key", (key, generation))
+
+    resp = current_app.make_response(view(*args, **kwargs))
+
+    # streamed responses are cached as they are sent, if at all, and
+    # responses compressed by the view are only right for some clients
+    if (resp.status_code != 200 or resp.is_streamed or
+            resp.cache_control.no_store or
+            "Content-Encoding" in resp.headers):
+        return resp
+
+    headers = [(name, value) for (name, value) in resp.headers.items()
+               if name.lower() not in UNCACHED_HEADERS]
+
+    return cached_response(cache.put(key, generation, resp.get_data(),
+                                     headers))
+
+
+def library_conditional(view):
+    """Answer conditional requests for a view built from the library.
+
+    The entity tag and Last-Modified date come from the library's change
+    counter, so clients get a 304 until a track, album or artist changes.
+    Responses are also kept in the response cache until then.
+
+    Args:
+        view (Callable): The view function.
+
+    """
+    @functools.wraps(view)
+    def conditional_view(*args, **kwargs):
+        generation, modified = current_app.config["LIBRARY"].generation()
+        etag = "library-%d" % generation
+
+        if use_columns():
+            etag += "-columns"
+
+        unchanged = not_modified(request, etag, modified)
+        if unchanged:
+            return unchanged
+
+        resp = cached_view(view, generation, *args, **kwargs)
+
+        if resp.status_code == 200:
+            # a response the view compressed itself is a different
+            # representation, tagged the way flask_compress tags them
+            if "Content-Encoding" in resp.headers:
+                etag = "%s:%s" % (etag, resp.headers["Content-Encoding"])
+
+            resp.set_etag(etag)
+            resp.last_modified = int(modified)
+            resp.vary.add("Accept")
+            # revalidate every time rather than guessing from Last-Modified
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+
+        return resp
+
+    return conditional_view
+
+
 @MACH2.route("/")
 @login_required
 def index():
@@ -109,9 +733,16 @@ def index():
 
 @MACH2.route("/albums")
 @login_required
+@library_conditional
 def albums():
     returned_albums = []
-    result_albums = []
+
+    try:
+        fields = field_names(Album)
+        columns = column_names(Album, fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
     order_by = request.args.get("order", None)
     order_direction = request.args.get("direction", None)
@@ -145,20 +776,47 @@ def albums():
     all_params = params.copy()
     all_params.update(search_params)
 
+    next_cursor = None
+
     if search_params:
         returned_albums = Album.search(current_app.config["LIBRARY"],
                                        **all_params)
+    elif use_keyset(Album, "id"):
+        try:
+            returned_albums, next_cursor = keyset_page(
+                Album, "id", columns or fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
+    elif use_streaming(Album, "id"):
+        try:
+            if columns:
+                return stream_columns(Album, "id", columns)
+
+            return stream_listing(Album, "id", ALBUM_INCLUDES, fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
     else:
         returned_albums = Album.all(current_app.config["LIBRARY"], **params)
 
-    for returned_album in returned_albums:
-        result_albums.append(returned_album.as_dict())
+    try:
+        result_albums = with_includes(returned_albums, ALBUM_INCLUDES,
+                                      columns or fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
-    return jsonify(result_albums)
+    if columns:
+        return link_next_page(columns_response(result_albums, columns),
+                              next_cursor)
+
+    return link_next_page(jsonify(result_albums), next_cursor)
 
 
 @MACH2.route("/albums/<int:album_id>/tracks")
 @login_required
+@library_conditional
 def album_tracks(album_id):
     result_tracks = []
     returned_album = Album(current_app.config["LIBRARY"], id=album_id)
@@ -171,6 +829,7 @@ def album_tracks(album_id):
 
 @MACH2.route("/albums/<int:album_id>/artists")
 @login_required
+@library_conditional
 def album_artists(album_id):
     result_artists = []
     returned_album = Album(current_app.config["LIBRARY"], id=album_id)
@@ -183,20 +842,124 @@ def album_artists(album_id):
 
 @MACH2.route("/albums/<int:album_id>")
 @login_required
+@library_conditional
 def album(album_id):
+    try:
+        fields = field_names(Album)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    if fields:
+        for returned_album in Album.by_ids(current_app.config["LIBRARY"],
+                                           [album_id], fields):
+            return jsonify(returned_album)
+
+        return jsonify({})
+
     returned_album = Album(current_app.config["LIBRARY"], id=album_id)
 
     return jsonify(returned_album.as_dict())
 
 
+@MACH2.route("/albums/<int:album_id>/download")
+@login_required
+def album_download(album_id):
+    returned_album = Album(current_app.config["LIBRARY"], id=album_id)
+
+    if not hasattr(returned_album, "name"):
+        abort(404)
+
+    profile = None
+    if request.args.get("profile"):
+        try:
+            profile = current_app.config["TRANSCODE_PROFILES"][
+                request.args["profile"]]
+        except KeyError:
+            error = dict(message="Unknown transcode profile")
+            return jsonify(error), 400
+
+    chunk_size = current_app.config["TRANSCODE_CHUNK_SIZE"]
+    cache = current_app.config["TRANSCODE_CACHE"]
+    logger = current_app.logger
+    album_name = archive_name(returned_album.name or "Album %d" % album_id)
+
+    pipe_output = None
+    if current_app.config["TRANSCODE_MODE"] == "pipe":
+        pipe_output = current_app.config["TRANSCODE_PIPE_OUTPUT"]
+
+    album_tracks = [album_track for album_track in returned_album.tracks
+                    if os.path.isfile(album_track.filename)]
+    transcoded = set(album_track.id for album_track in album_tracks
+                     if profile and not profile.satisfied_by(album_track))
+
+    # the tracks are transcoded one after another in a slot taken before
+    # anything is sent, so a busy server replies 503 rather than breaking
+    # off the archive
+    slot = None
+    if transcoded and not (cache and all(
+            cache.contains(TranscodeCache.key(album_track.filename,
+                                              profile.identity()))
+            for album_track in album_tracks
+            if album_track.id in transcoded)):
+        try:
+            slot = current_app.config["TRANSCODE_SCHEDULER"].acquire(
+                current_user.id)
+        except SchedulerBusy:
+            return scheduler_busy()
+
+    def album_files():
+        """Yield each file of the archive once the archive reaches it."""
+        for album_track in album_tracks:
+            extension = os.path.splitext(album_track.filename)[1]
+            size = os.path.getsize(album_track.filename)
+            contents = read_file(album_track.filename, chunk_size)
+
+            if album_track.id in transcoded:
+                try:
+                    contents = stream_transcode(
+                        profile, album_track.filename, slot, cache=cache,
+                        chunk_size=chunk_size, pipe_output=pipe_output)
+                    extension = "." + (profile.container or "bin")
+                    size = None
+                except (OSError, ValueError) as exc:
+                    # the original file is sent instead, since the archive
+                    # has already started
+                    logger.error("Could not transcode %s: %s",
+                                 album_track.filename, exc)
+
+            name = "%s/%s%s" % (album_name, archive_name("%s - %s" % (
+                str(album_track.tracknumber or 0).zfill(2),
+                album_track.name or "")), extension)
+
+            yield (name, os.path.getmtime(album_track.filename), size,
+                   contents)
+
+    body = stream_zip(album_files())
+    if slot:
+        body = slot.hold(body)
+
+    resp = Response(body, mimetype="application/zip")
+    resp.headers["Content-Disposition"] = (
+        "attachment; filename*=UTF-8''%s.zip" % quote(album_name.encode(
+            "utf-8")))
+
+    return limit_bandwidth(resp, interactive=False)
+
+
 @MACH2.route("/albums/<album_name>")
 @login_required
+@library_conditional
 def album_search(album_name):
     result_albums = []
 
-    for returned_album in Album.search(current_app.config["LIBRARY"],
-                                       name={"data": album_name,
-                                             "operator": "LIKE"}):
+    try:
+        returned_albums = find(Album, album_name, search_limit())
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    for returned_album in returned_albums:
         result_albums.append(returned_album.as_dict())
 
     return jsonify(result_albums)
@@ -204,13 +967,20 @@ def album_search(album_name):
 
 @MACH2.route("/artists")
 @login_required
+@library_conditional
 def artists():
     order_by = None
-    order_direction = None
+    order_direction = "ASC"
     lim = None
     off = None
     returned_artists = []
-    result_artists = []
+
+    try:
+        fields = field_names(Artist)
+        columns = column_names(Artist, fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
     if request.args.get("order"):
         order_by = request.args.get("order")
@@ -224,7 +994,25 @@ def artists():
     if request.args.get("offset"):
         off = request.args.get("offset")
 
-    if order_by:
+    next_cursor = None
+
+    if use_keyset(Artist, "sortname"):
+        try:
+            returned_artists, next_cursor = keyset_page(
+                Artist, "sortname", columns or fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
+    elif use_streaming(Artist, "sortname"):
+        try:
+            if columns:
+                return stream_columns(Artist, "sortname", columns)
+
+            return stream_listing(Artist, "sortname", ARTIST_INCLUDES, fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
+    elif order_by:
         returned_artists = Artist.all(current_app.config["LIBRARY"],
                                       order=order_by,
                                       direction=order_direction, limit=lim,
@@ -233,14 +1021,23 @@ def artists():
         returned_artists = Artist.all(current_app.config["LIBRARY"], limit=lim,
                                       offset=off)
 
-    for returned_artist in returned_artists:
-        result_artists.append(returned_artist.as_dict())
+    try:
+        result_artists = with_includes(returned_artists, ARTIST_INCLUDES,
+                                       columns or fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
-    return jsonify(result_artists)
+    if columns:
+        return link_next_page(columns_response(result_artists, columns),
+                              next_cursor)
+
+    return link_next_page(jsonify(result_artists), next_cursor)
 
 
 @MACH2.route("/artists/<int:artist_id>/tracks")
 @login_required
+@library_conditional
 def artist_tracks(artist_id):
     result_tracks = []
     returned_artist = Artist(current_app.config["LIBRARY"], id=artist_id)
@@ -253,6 +1050,7 @@ def artist_tracks(artist_id):
 
 @MACH2.route("/artists/<int:artist_id>/albums")
 @login_required
+@library_conditional
 def artist_albums(artist_id):
     result_albums = []
     returned_artist = Artist(current_app.config["LIBRARY"], id=artist_id)
@@ -265,7 +1063,21 @@ def artist_albums(artist_id):
 
 @MACH2.route("/artists/<int:artist_id>")
 @login_required
+@library_conditional
 def artist_info(artist_id):
+    try:
+        fields = field_names(Artist)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    if fields:
+        for artist in Artist.by_ids(current_app.config["LIBRARY"],
+                                    [artist_id], fields):
+            return jsonify(artist)
+
+        return jsonify({})
+
     artist = Artist(current_app.config["LIBRARY"], id=artist_id)
 
     return jsonify(artist.as_dict())
@@ -273,27 +1085,38 @@ def artist_info(artist_id):
 
 @MACH2.route("/artists/<artist_name>")
 @login_required
+@library_conditional
 def artist_search(artist_name):
     result_artists = []
-    for artist in Artist.search(current_app.config["LIBRARY"],
-                                name={
-                                    "data": artist_name,
-                                    "operator": "LIKE"
-    }):
+
+    try:
+        returned_artists = find(Artist, artist_name, search_limit())
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    for artist in returned_artists:
         result_artists.append(artist.as_dict())
 
-    return jsonify(artists)
+    return jsonify(result_artists)
 
 
 @MACH2.route("/tracks")
 @login_required
+@library_conditional
 def tracks():
     order_by = None
-    order_direction = None
+    order_direction = "ASC"
     lim = None
     off = None
     returned_tracks = []
-    result_tracks = []
+
+    try:
+        fields = field_names(Track)
+        columns = column_names(Track, fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
     if request.args.get("order"):
         order_by = request.args.get("order")
@@ -307,7 +1130,25 @@ def tracks():
     if request.args.get("offset"):
         off = request.args.get("offset")
 
-    if order_by:
+    next_cursor = None
+
+    if use_keyset(Track, "id"):
+        try:
+            returned_tracks, next_cursor = keyset_page(
+                Track, "id", columns or fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
+    elif use_streaming(Track, "id"):
+        try:
+            if columns:
+                return stream_columns(Track, "id", columns)
+
+            return stream_listing(Track, "id", TRACK_INCLUDES, fields)
+        except ValueError as exc:
+            error = dict(message=str(exc))
+            return jsonify(error), 400
+    elif order_by:
         returned_tracks = Track.all(current_app.config["LIBRARY"],
                                     order=order_by, direction=order_direction,
                                     limit=lim, offset=off)
@@ -315,14 +1156,23 @@ def tracks():
         returned_tracks = Track.all(current_app.config["LIBRARY"],
                                     limit=lim, offset=off)
 
-    for returned_track in returned_tracks:
-        result_tracks.append(returned_track.as_dict())
+    try:
+        result_tracks = with_includes(returned_tracks, TRACK_INCLUDES,
+                                      columns or fields)
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
 
-    return jsonify(result_tracks)
+    if columns:
+        return link_next_page(columns_response(result_tracks, columns),
+                              next_cursor)
+
+    return link_next_page(jsonify(result_tracks), next_cursor)
 
 
 @MACH2.route("/tracks/<int:track_id>/artists")
 @login_required
+@library_conditional
 def track_artists(track_id):
     result_artists = []
     returned_track = Track(current_app.config["LIBRARY"], id=track_id)
@@ -333,61 +1183,573 @@ def track_artists(track_id):
     return jsonify(result_artists)
 
 
+def get_transcode_profile(user, profile_name=None):
+    """Find the transcode profile to use for a request.
+
+    Args:
+        user (User): The user requesting the track.
+        profile_name (obj:`str`, optional): A profile requested explicitly.
+            Defaults to None, which uses the user's own settings.
+
+    Returns:
+        TranscodeProfile: The profile, or None if the track should be sent
+            without transcoding.
+
+    Raises:
+        KeyError: If profile_name is not a known profile.
+
+    """
+    profiles = current_app.config["TRANSCODE_PROFILES"]
+
+    if profile_name:
+        return profiles[profile_name]
+
+    if getattr(user, "transcode_profile", None) in profiles:
+        return profiles[user.transcode_profile]
+
+    if user.transcode_command:
+        return TranscodeProfile.from_command(user.transcode_command)
+
+    return None
+
+
+def adapt_profile(user, profile, source):
+    """Pick a transcode profile to fit the client's bandwidth.
+
+    The bandwidth comes from the client's hints, or failing those from how
+    fast earlier tracks were sent to the user. The choice is logged.
+
+    Args:
+        user (User): The user requesting the track.
+        profile (TranscodeProfile): The profile the user's settings would
+            use, or None to send the original. Its bitrate is not exceeded.
+        source (Track): The requested track.
+
+    Returns:
+        TranscodeProfile: The profile to use, or None to send the original.
+
+    """
+    bandwidth, reason = bandwidth_hint(request)
+
+    throughput = current_app.config["THROUGHPUT_TRACKER"]
+    if bandwidth is None and throughput:
+        bandwidth = throughput.get(user.id)
+        reason = "measured throughput"
+
+    if bandwidth is None:
+        return profile
+
+    usable = bandwidth * current_app.config["ADAPTIVE_HEADROOM"]
+    reason = "%s of %.0f kbit/s" % (reason, bandwidth)
+
+    source_bitrate = getattr(source, "bitrate", None)
+    if not profile and source_bitrate and source_bitrate <= usable:
+        log_choice(user.id, None, reason)
+        return None
+
+    chosen = choose_profile(current_app.config["TRANSCODE_PROFILES"].values(),
+                            usable, ceiling=profile)
+
+    if not chosen:
+        return profile
+
+    log_choice(user.id, chosen, reason)
+
+    return chosen
+
+
+def can_pass_through(req, profile, source, mimetype):
+    """Check whether a track can be sent without transcoding.
+
+    That is the case when the file already matches the transcode profile, or
+    when the client explicitly accepts the file's type and it does not exceed
+    the profile's bitrate.
+
+    Args:
+        req (flask.Request): The request object.
+        profile (TranscodeProfile): The profile the track would be transcoded
+            with.
+        source (Track): The requested track.
+        mimetype (str): The content type of the track's file.
+
+    """
+    if profile.satisfied_by(source):
+        return True
+
+    accepted = [value for (value, quality) in req.accept_mimetypes
+                if quality > 0 and "*" not in value]
+
+    return (mimetype in accepted and
+            profile.allows_bitrate(getattr(source, "bitrate", None)))
+
+
+@MACH2.route("/profiles")
+@login_required
+def transcode_profiles():
+    """Return the transcode profiles users can choose from."""
+    result_profiles = []
+
+    for profile in current_app.config["TRANSCODE_PROFILES"].values():
+        result_profiles.append(profile.as_dict())
+
+    return jsonify(result_profiles)
+
+
+def scheduler_busy():
+    """Reply that no transcoder became free in time.
+
+    Returns:
+        flask.Response: The 503 response, telling the client when to retry.
+
+    """
+    error = dict(message="Too many transcodes in progress")
+    resp = jsonify(error)
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(
+        current_app.config["TRANSCODE_RETRY_AFTER"])
+
+    return resp
+
+
+def transcode_response(local_track, profile, start=0, length=None,
+                       cache=None):
+    """Transcode a track and stream the output.
+
+    Identical transcodes in progress are shared, and finished ones are kept
+    in the cache when it is given.
+
+    Args:
+        local_track (Track): The track to transcode.
+        profile (TranscodeProfile): The profile to transcode it with.
+        start (float): The offset in seconds to start transcoding at.
+        length (float): The length in seconds to transcode, or None for the
+            rest of the track.
+        cache (TranscodeCache): The cache to keep the output in, if any.
+
+    Returns:
+        flask.Response: The transcoded track.
+
+    """
+    def finish_transcode(returncode):
+        if cache and returncode == 0:
+            cache.put(cache_key, temp_filename)
+        elif temp_filename:
+            os.remove(temp_filename)
+
+    def shared_response():
+        """Send the output of an identical transcode, if there is one."""
+        if cache:
+            cached_filename = cache.get(cache_key)
+
+            if cached_filename:
+                return send_file_range(request, cached_filename,
+                                       profile.mimetype, chunk_size)
+
+        if pipe_mode:
+            # share the output of an identical transcode in progress
+            flight = flights.get(cache_key)
+
+            if flight:
+                return Response(flight.listen(), mimetype=profile.mimetype)
+
+        return None
+
+    pipe_mode = current_app.config["TRANSCODE_MODE"] == "pipe"
+    chunk_size = current_app.config["TRANSCODE_CHUNK_SIZE"]
+
+    try:
+        cache_key = TranscodeCache.key(local_track.filename,
+                                       profile.identity(start, length))
+    except OSError:
+        abort(404)
+
+    flights = current_app.config["TRANSCODE_FLIGHTS"]
+    temp_filename = None
+
+    resp = shared_response()
+    if resp:
+        return resp
+
+    try:
+        slot = current_app.config["TRANSCODE_SCHEDULER"].acquire(
+            current_user.id)
+    except SchedulerBusy:
+        return scheduler_busy()
+
+    # an identical transcode may have started, or finished, while this one
+    # waited for the slot
+    resp = shared_response()
+    if resp:
+        slot.release()
+        return resp
+
+    if cache:
+        temp_filename = cache.temp_path(cache_key)
+    elif not pipe_mode:
+        temp_fd, temp_filename = tempfile.mkstemp()
+        os.close(temp_fd)
+
+    if pipe_mode:
+        transcode_command_items = profile.command_items(
+            local_track.filename, current_app.config["TRANSCODE_PIPE_OUTPUT"],
+            start=start, length=length)
+    else:
+        transcode_command_items = profile.command_items(
+            local_track.filename, temp_filename, start=start, length=length)
+
+    try:
+        if pipe_mode:
+            proc = subprocess.Popen(transcode_command_items,
+                                    stdout=subprocess.PIPE)
+        else:
+            # make sure the file exists before the transcoder has written
+            # to it
+            open(temp_filename, "ab").close()
+
+            proc = subprocess.Popen(transcode_command_items)
+    except OSError:
+        slot.release()
+        raise
+
+    slot.attach(proc)
+
+    if pipe_mode:
+        flight = flights.start(cache_key, proc, slot, chunk_size,
+                               output=temp_filename, finished=finish_transcode)
+        resp = Response(flight.listen(), mimetype=profile.mimetype)
+    else:
+        stream = stream_file(temp_filename, proc, chunk_size,
+                             finished=finish_transcode)
+        resp = Response(slot.hold(stream), mimetype=profile.mimetype)
+
+    duration = getattr(local_track, "duration", None)
+    if length:
+        resp.headers["X-Content-Duration"] = "%.3f" % length
+    elif duration:
+        resp.headers["X-Content-Duration"] = "%.3f" % (duration - start)
+
+    return resp
+
+
 @MACH2.route("/tracks/<int:track_id>")
 @login_required
 def track(track_id):
-    def stream_file(filename, proc, chunksize=8192):
-        with open(filename, "rb") as streamed_file:
-            while True:
-                chunk = streamed_file.read(chunksize)
-                if proc.poll() is None or chunk:
-                    yield chunk
-                elif not chunk:
-                    os.remove(filename)
-                    break
-
     local_track = Track(current_app.config["LIBRARY"], id=track_id)
 
-    dummy, temp_filename = tempfile.mkstemp()
+    if not hasattr(local_track, "filename"):
+        abort(404)
 
-    transcode_tokens = current_user.transcode_command.split()
-    transcode_command_items = []
-    for token in transcode_tokens:
-        if token == "{filename}":
-            transcode_command_items.append(local_track.filename)
-        elif token == "{output}":
-            transcode_command_items.append(temp_filename)
-        else:
-            transcode_command_items.append(token)
+    try:
+        profile = get_transcode_profile(current_user,
+                                        request.args.get("profile"))
+    except KeyError:
+        error = dict(message="Unknown transcode profile")
+        return jsonify(error), 400
+
+    if current_app.config["ADAPTIVE"] and not request.args.get("profile"):
+        profile = adapt_profile(current_user, profile, local_track)
+
+    resp = current_app.make_response(send_track(local_track, profile))
+    resp = limit_bandwidth(resp, interactive="download" not in request.args)
 
-    proc = subprocess.Popen(transcode_command_items)
+    throughput = current_app.config["THROUGHPUT_TRACKER"]
+    if throughput and resp.status_code in (200, 206):
+        resp.response = throughput.meter(resp.response, current_user.id)
+
+    return resp
 
-    mime_string = "application/octet-stream"
 
-    mime = mimetypes.guess_type(temp_filename)
-    if mime[0]:
-        mime_string = mime[0]
+def limit_bandwidth(resp, interactive=True):
+    """Send a response within the configured bandwidth limits.
 
-    resp = Response(stream_file(temp_filename, proc), mimetype=mime_string)
+    Args:
+        resp (flask.Response): The response.
+        interactive (bool): False for bulk downloads, which give way to
+            playback.
 
-    if mime[1]:
-        resp.headers["Content-Encoding"] = mime[1]
+    Returns:
+        flask.Response: The response.
+
+    """
+    shaper = current_app.config["BANDWIDTH_SHAPER"]
+
+    if shaper and resp.status_code in (200, 206):
+        resp.response = shaper.shape(resp.response, current_user.id,
+                                     interactive)
 
     return resp
 
 
+def send_track(local_track, profile):
+    """Send a track, transcoding it if needed.
+
+    Args:
+        local_track (Track): The requested track.
+        profile (TranscodeProfile): The profile to transcode it with, or
+            None to send the original.
+
+    Returns:
+        flask.Response: The response to send.
+
+    """
+    chunk_size = current_app.config["TRANSCODE_CHUNK_SIZE"]
+
+    mime = mimetypes.guess_type(local_track.filename)
+    original_mimetype = mime[0] or "application/octet-stream"
+
+    start = request.args.get("start", 0, type=float)
+
+    if start < 0:
+        error = dict(message="start must not be negative")
+        return jsonify(error), 400
+
+    duration = getattr(local_track, "duration", None)
+    if start and duration and start >= duration:
+        error = dict(message="start is past the end of the track")
+        return jsonify(error), 400
+
+    if start and profile and not profile.seekable:
+        error = dict(message="The transcode profile does not support seeking")
+        return jsonify(error), 400
+
+    if not profile or (not start and can_pass_through(
+            request, profile, local_track, original_mimetype)):
+        if not os.path.isfile(local_track.filename):
+            abort(404)
+
+        return send_file_range(request, local_track.filename,
+                               original_mimetype, chunk_size)
+
+    prefetcher = current_app.config["TRANSCODE_PREFETCHER"]
+    if prefetcher:
+        prefetcher.prefetch(local_track, profile)
+
+    # only whole tracks are worth keeping in the cache
+    cache = None
+    if not start:
+        cache = current_app.config["TRANSCODE_CACHE"]
+
+    return transcode_response(local_track, profile, start=start, cache=cache)
+
+
+def get_segmented_track(track_id):
+    """Look up a track and the profile to split it into segments with.
+
+    Args:
+        track_id (int): The id of the track.
+
+    Returns:
+        Tuple[Track, TranscodeProfile, flask.Response]: The track and
+            profile, or an error response to send instead.
+
+    """
+    local_track = Track(current_app.config["LIBRARY"], id=track_id)
+
+    if not hasattr(local_track, "filename"):
+        abort(404)
+
+    try:
+        profile = get_transcode_profile(current_user,
+                                        request.args.get("profile"))
+    except KeyError:
+        error = dict(message="Unknown transcode profile")
+        return None, None, (jsonify(error), 400)
+
+    if not profile or not profile.segmentable:
+        error = dict(message="The transcode profile does not support "
+                     "segments")
+        return None, None, (jsonify(error), 400)
+
+    if not getattr(local_track, "duration", None):
+        error = dict(message="The length of the track is unknown")
+        return None, None, (jsonify(error), 404)
+
+    return local_track, profile, None
+
+
+def segment_query(profile_name):
+    """Return the query string segment and playlist URLs carry over."""
+    args = dict(profile=profile_name)
+
+    if "api_key" in request.args:
+        args["api_key"] = request.args["api_key"]
+
+    return urlencode(sorted(args.items()))
+
+
+@MACH2.route("/tracks/<int:track_id>/playlist.m3u8")
+@login_required
+def track_playlist(track_id):
+    local_track, profile, error = get_segmented_track(track_id)
+
+    if error:
+        return error
+
+    query = segment_query(profile.name)
+    playlist = media_playlist(
+        local_track.duration, current_app.config["SEGMENT_LENGTH"],
+        lambda index: "segments/%d?%s" % (index, query))
+
+    return Response(playlist, mimetype=PLAYLIST_MIMETYPE)
+
+
+@MACH2.route("/tracks/<int:track_id>/master.m3u8")
+@login_required
+def track_master_playlist(track_id):
+    local_track = Track(current_app.config["LIBRARY"], id=track_id)
+
+    if not hasattr(local_track, "filename"):
+        abort(404)
+
+    variants = []
+    for profile in current_app.config["TRANSCODE_PROFILES"].values():
+        if profile.segmentable:
+            variants.append(
+                (profile, "playlist.m3u8?%s" % segment_query(profile.name)))
+
+    if not variants:
+        error = dict(message="No transcode profile supports segments")
+        return jsonify(error), 404
+
+    variants.sort(key=lambda variant: variant[0].bitrate or 0)
+
+    return Response(master_playlist(variants), mimetype=PLAYLIST_MIMETYPE)
+
+
+@MACH2.route("/tracks/<int:track_id>/segments/<int:segment>")
+@login_required
+def track_segment(track_id, segment):
+    local_track, profile, error = get_segmented_track(track_id)
+
+    if error:
+        return error
+
+    try:
+        start, length = segment_bounds(local_track.duration,
+                                       current_app.config["SEGMENT_LENGTH"],
+                                       segment)
+    except IndexError:
+        abort(404)
+
+    # segments are requested again whenever a client seeks, so always keep
+    # them in the cache
+    resp = transcode_response(local_track, profile, start=start,
+                              length=length,
+                              cache=current_app.config["TRANSCODE_CACHE"])
+
+    return limit_bandwidth(current_app.make_response(resp))
+
+
 @MACH2.route("/tracks/<track_name>")
 @login_required
+@library_conditional
 def track_search(track_name):
     result_tracks = []
-    for returned_track in Track.search(current_app.config["LIBRARY"],
-                                       name={"data": track_name,
-                                             "operator": "LIKE"}):
+
+    try:
+        returned_tracks = find(Track, track_name, search_limit())
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    for returned_track in returned_tracks:
         result_tracks.append(returned_track.as_dict())
 
     return jsonify(result_tracks)
 
 
+# the groups /search returns, searched in this order
+SEARCH_GROUPS = (("artists", Artist), ("albums", Album), ("tracks", Track))
+
+
+@MACH2.route("/search")
+@login_required
+@library_conditional
+def search():
+    """Search artists, albums and tracks at once, as the search is typed.
+
+    Each group holds the best ?limit= matches, up to the configured cap,
+    found by similarity instead of prefix with ?fuzzy=1. Groups not searched
+    within the latency budget are returned empty, with complete set to
+    false.
+
+    """
+    database = current_app.config["LIBRARY"]
+    text = request.args.get("q", "")
+
+    try:
+        limit = search_limit(current_app.config["SEARCH_RESULTS"],
+                             current_app.config["SEARCH_MAX_RESULTS"])
+
+        if use_fuzzy() and not current_app.config["FUZZY_INDEX"]:
+            raise ValueError("Fuzzy search is not enabled")
+    except ValueError as exc:
+        error = dict(message=str(exc))
+        return jsonify(error), 400
+
+    results = dict((name, []) for (name, dummy) in SEARCH_GROUPS)
+    results["complete"] = True
+
+    budget = current_app.config["SEARCH_BUDGET"]
+    deadline = time.time() + budget
+
+    with database.time_limit(budget):
+        for (name, model) in SEARCH_GROUPS:
+            try:
+                results[name] = [found.as_dict() for found in
+                                 find(model, text, limit)]
+            except sqlite3.OperationalError:
+                if time.time() <= deadline:
+                    raise
+
+            if time.time() > deadline:
+                results["complete"] = False
+                break
+
+    resp = jsonify(results)
+
+    if not results["complete"]:
+        # a later request may have the time to find everything
+        resp.cache_control.no_store = True
+
+    return resp
+
+
+@MACH2.route("/stats")
+@login_required
+def stats():
+    """Return the server's cache counters."""
+    server_stats = dict(
+        transcode_scheduler=current_app.config["TRANSCODE_SCHEDULER"].stats(),
+        transcode_flights=current_app.config["TRANSCODE_FLIGHTS"].stats())
+
+    cache = current_app.config["TRANSCODE_CACHE"]
+    if cache:
+        server_stats["transcode_cache"] = cache.stats()
+
+    prefetcher = current_app.config["TRANSCODE_PREFETCHER"]
+    if prefetcher:
+        server_stats["prefetch"] = prefetcher.stats()
+
+    throughput = current_app.config["THROUGHPUT_TRACKER"]
+    if throughput:
+        server_stats["throughput"] = throughput.stats()
+
+    shaper = current_app.config["BANDWIDTH_SHAPER"]
+    if shaper:
+        server_stats["bandwidth"] = shaper.stats()
+
+    response_cache = current_app.config["RESPONSE_CACHE"]
+    if response_cache:
+        server_stats["response_cache"] = response_cache.stats()
+
+    fuzzy_index = current_app.config["FUZZY_INDEX"]
+    if fuzzy_index:
+        server_stats["fuzzy_index"] = fuzzy_index.stats()
+
+    return jsonify(server_stats)
+
+
 @MACH2.route("/user", defaults={"user_id": None},
              methods=["GET", "POST", "PUT"])
 @MACH2.route("/user/<int:user_id>", methods=["DELETE", "GET", "PUT"])
@@ -421,7 +1783,7 @@ def users(user_id):
 
             with db_conn:
                 rows_updated = get_db().execute(
-                    update_query, (password_hash, api_key, user.id))
+                    update_query, (password_hash, api_key, user.id)).rowcount
 
             if rows_updated > 0:
                 user.password_hash = password_hash
@@ -438,7 +1800,8 @@ def users(user_id):
 
             with db_conn:
                 rows_updated = db_conn.execute(
-                    update_query, (user_data["transcode_command"], user.id))
+                    update_query,
+                    (user_data["transcode_command"], user.id)).rowcount
 
             if rows_updated > 0:
                 user.transcode_command = user_data[
@@ -447,6 +1810,29 @@ def users(user_id):
                 error = dict(message="Unable to update user")
                 return jsonify(error), 500
 
+        if "transcode_profile" in user_data:
+            profile_name = user_data["transcode_profile"]
+
+            if (profile_name and profile_name not in
+                    current_app.config["TRANSCODE_PROFILES"]):
+                error = dict(message="Unknown transcode profile")
+                return jsonify(error), 400
+
+            update_query = ("UPDATE user SET transcode_profile = ? "
+                            "WHERE id = ?")
+
+            rows_updated = 0
+
+            with db_conn:
+                rows_updated = db_conn.execute(
+                    update_query, (profile_name, user.id)).rowcount
+
+            if rows_updated > 0:
+                user.transcode_profile = profile_name
+            else:
+                error = dict(message="Unable to update user")
+                return jsonify(error), 500
+
         return jsonify(user.to_dict())
 
     if user_id:
@@ -502,7 +1888,7 @@ def load_user(user_id):
         local_user = User(
             id=result[0], username=result[1],password_hash=result[2],
             authenticated=1, active=result[4], anonymous=0,
-            transcode_command=result[7])
+            transcode_command=result[7], transcode_profile=result[8])
 
     return local_user
 
@@ -520,7 +1906,8 @@ def login():
                         authenticated=0,
                         active=result[4],
                         anonymous=result[5],
-                        transcode_command=result[7])
+                        transcode_command=result[7],
+                        transcode_profile=result[8])
 
         password = request.form["password"]
 
@@ -552,6 +1939,8 @@ def create_app(database=None, library=None):
     else:
         app.config["DATABASE"] = _CONFIG.get("DEFAULT", "database")
 
+    upgrade_db(app.config["DATABASE"])
+
     if library:
         app.config["LIBRARY"] = library
     else:
@@ -560,6 +1949,98 @@ def create_app(database=None, library=None):
     app.config["DEBUG"] = _CONFIG.get("DEFAULT", "debug")
     app.config["SECRET_KEY"] = _CONFIG.get("DEFAULT", "secret_key")
 
+    app.config["TRANSCODE_MODE"] = "file"
+    app.config["TRANSCODE_CHUNK_SIZE"] = 8192
+    app.config["TRANSCODE_PIPE_OUTPUT"] = "-"
+    app.config["TRANSCODE_RETRY_AFTER"] = 5
+    app.config["SEGMENT_LENGTH"] = 10.0
+    app.config["ADAPTIVE"] = False
+    app.config["ADAPTIVE_HEADROOM"] = 0.8
+    app.config["THROUGHPUT_TRACKER"] = None
+    app.config["BANDWIDTH_SHAPER"] = None
+    app.config["SEARCH_RESULTS"] = 5
+    app.config["SEARCH_MAX_RESULTS"] = 50
+    app.config["SEARCH_BUDGET"] = 0.05
+    max_processes = 4
+    max_processes_per_user = 2
+    queue_timeout = 10
+    if _CONFIG.has_section("transcode"):
+        app.config["TRANSCODE_MODE"] = _CONFIG.get("transcode", "mode")
+        app.config["TRANSCODE_CHUNK_SIZE"] = _CONFIG.getint("transcode",
+                                                            "chunk_size")
+        app.config["TRANSCODE_PIPE_OUTPUT"] = _CONFIG.get("transcode",
+                                                          "pipe_output")
+        app.config["TRANSCODE_RETRY_AFTER"] = _CONFIG.getint("transcode",
+                                                             "retry_after")
+        app.config["SEGMENT_LENGTH"] = _CONFIG.getfloat("transcode",
+                                                        "segment_length")
+        max_processes = _CONFIG.getint("transcode", "max_processes")
+        max_processes_per_user = _CONFIG.getint("transcode",
+                                                "max_processes_per_user")
+        queue_timeout = _CONFIG.getfloat("transcode", "queue_timeout")
+
+    app.config["TRANSCODE_SCHEDULER"] = TranscodeScheduler(
+        max_processes, max_processes_per_user, queue_timeout)
+    app.config["TRANSCODE_PROFILES"] = TranscodeProfile.from_config(_CONFIG)
+    app.config["TRANSCODE_FLIGHTS"] = TranscodeFlights()
+
+    app.config["TRANSCODE_CACHE"] = None
+    if (_CONFIG.has_section("transcode_cache") and
+            _CONFIG.getboolean("transcode_cache", "enabled")):
+        app.config["TRANSCODE_CACHE"] = TranscodeCache(
+            _CONFIG.get("transcode_cache", "directory"),
+            _CONFIG.getint("transcode_cache", "max_size_mb") * 1024 * 1024)
+
+    app.config["TRANSCODE_PREFETCHER"] = None
+    if (app.config["TRANSCODE_CACHE"] and _CONFIG.has_section("prefetch") and
+            _CONFIG.getboolean("prefetch", "enabled")):
+        pipe_output = None
+        if app.config["TRANSCODE_MODE"] == "pipe":
+            pipe_output = app.config["TRANSCODE_PIPE_OUTPUT"]
+
+        app.config["TRANSCODE_PREFETCHER"] = Prefetcher(
+            app.config["TRANSCODE_CACHE"], app.config["TRANSCODE_SCHEDULER"],
+            _CONFIG.getint("prefetch", "tracks"),
+            niceness=_CONFIG.getint("prefetch", "niceness"),
+            pipe_output=pipe_output)
+
+    if _CONFIG.has_section("adaptive"):
+        app.config["ADAPTIVE"] = _CONFIG.getboolean("adaptive", "enabled")
+        app.config["ADAPTIVE_HEADROOM"] = _CONFIG.getfloat("adaptive",
+                                                           "headroom")
+
+        if (app.config["ADAPTIVE"] and
+                _CONFIG.getboolean("adaptive", "measure")):
+            app.config["THROUGHPUT_TRACKER"] = ThroughputTracker()
+
+    if (_CONFIG.has_section("bandwidth") and
+            _CONFIG.getboolean("bandwidth", "enabled")):
+        app.config["BANDWIDTH_SHAPER"] = BandwidthShaper(
+            _CONFIG.getint("bandwidth", "global_kbps") * 1000 // 8,
+            _CONFIG.getint("bandwidth", "user_kbps") * 1000 // 8,
+            bulk_share=_CONFIG.getfloat("bandwidth", "bulk_share"),
+            burst=_CONFIG.getint("bandwidth", "burst_kb") * 1024)
+
+    if _CONFIG.has_section("search"):
+        app.config["SEARCH_RESULTS"] = _CONFIG.getint("search", "results")
+        app.config["SEARCH_MAX_RESULTS"] = _CONFIG.getint("search",
+                                                          "max_results")
+        app.config["SEARCH_BUDGET"] = _CONFIG.getint("search",
+                                                     "budget_ms") / 1000.0
+
+    app.config["FUZZY_INDEX"] = None
+    if (_CONFIG.has_option("search", "fuzzy") and
+            _CONFIG.getboolean("search", "fuzzy")):
+        app.config["FUZZY_INDEX"] = LibraryTrigramIndex(
+            app.config["LIBRARY"])
+
+    app.config["RESPONSE_CACHE"] = None
+    if (_CONFIG.has_section("response_cache") and
+            _CONFIG.getboolean("response_cache", "enabled")):
+        app.config["RESPONSE_CACHE"] = ResponseCache(
+            _CONFIG.getint("response_cache", "max_size_mb") * 1024 * 1024,
+            compress_level=app.config.get("COMPRESS_LEVEL", 6))
+
     app.register_blueprint(MACH2)
 
     _LOGIN_MANAGER.init_app(app)
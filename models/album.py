@@ -5,6 +5,10 @@ from models.base import BaseModel
 class Album(BaseModel):
     """Represents an album."""
 
+    table = "album"
+    columns = ("id", "name", "date")
+    sort_columns = ("id", "name", "date")
+
     def __init__(self, db, id=None, **kwargs):
         self._db = db
 
@@ -18,6 +22,21 @@ class Album(BaseModel):
             for (key, value) in kwargs.items():
                 setattr(self, key, value)
 
+    @classmethod
+    def from_row(cls, database, row):
+        """Create an album from a row of the album table without querying it
+        again.
+
+        Args:
+            database (DbManager): The database.
+            row (sqlite3.Row): The row.
+
+        """
+        album = cls(database, name=row["name"], date=row["date"])
+        album.id = row["id"]
+
+        return album
+
     def delete(self):
         for track in self.tracks:
             track.delete()
@@ -25,6 +44,7 @@ class Album(BaseModel):
         with self._db.conn:
             delete_album = "DELETE FROM album WHERE id = ?"
             self._db.execute(delete_album, (self.id,))
+            self._db.bump_generation()
 
             delete_track_rel = "DELETE FROM album_track WHERE album_id = ?"
             self._db.execute(delete_track_rel, (self.id,))
@@ -98,6 +118,7 @@ class Album(BaseModel):
 
             with self._db.conn:
                 self._db.execute(sql, dirty_attributes)
+                self._db.bump_generation()
 
     @classmethod
     def search(cls, database, **search_params):
@@ -141,6 +162,42 @@ class Album(BaseModel):
 
         return albums
 
+    @classmethod
+    def load_artists(cls, database, albums):
+        """Load the artists of many albums with one query.
+
+        Args:
+            database (DbManager): The database.
+            albums (List[Album]): The albums.
+
+        """
+        from models.artist import Artist
+
+        cls.load_related(
+            database, albums, "_artists",
+            "SELECT album_artist.album_id AS owner_id, artist.* FROM artist "
+            "INNER JOIN album_artist ON artist.id = album_artist.artist_id "
+            "WHERE album_artist.album_id IN (%s) ORDER BY name ASC",
+            lambda row: Artist.from_row(database, row))
+
+    @classmethod
+    def load_tracks(cls, database, albums):
+        """Load the tracks of many albums with one query.
+
+        Args:
+            database (DbManager): The database.
+            albums (List[Album]): The albums.
+
+        """
+        from models.track import Track
+
+        cls.load_related(
+            database, albums, "_tracks",
+            "SELECT album_track.album_id AS owner_id, track.* FROM track "
+            "INNER JOIN album_track ON track.id = album_track.track_id WHERE "
+            "album_track.album_id IN (%s) ORDER BY tracknumber ASC",
+            lambda row: Track.from_row(database, row))
+
     @classmethod
     def all(cls, database, order="album.id", direction="ASC", limit=None,
             offset=None):
@@ -159,9 +216,6 @@ class Album(BaseModel):
         result = database.execute(select_string)
 
         for row in result:
-            albums.append(
-                Album(id=row["id"], db=database, name=row["name"],
-                      date=row["date"])
-            )
+            albums.append(Album.from_row(database, row))
 
         return albums
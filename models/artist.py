@@ -4,6 +4,10 @@ from models.base import BaseModel
 
 class Artist(BaseModel):
 
+    table = "artist"
+    columns = ("id", "name", "sortname", "musicbrainz_artistid")
+    sort_columns = ("id", "name", "sortname")
+
     def __init__(self, db, id=None, **kwargs):
         self._db = db
 
@@ -16,6 +20,22 @@ class Artist(BaseModel):
             for (key, value) in kwargs.items():
                 setattr(self, key, value)
 
+    @classmethod
+    def from_row(cls, database, row):
+        """Create an artist from a row of the artist table without querying
+        it again.
+
+        Args:
+            database (DbManager): The database.
+            row (sqlite3.Row): The row.
+
+        """
+        artist = cls(database, name=row["name"], sortname=row["sortname"],
+                     musicbrainz_artistid=row["musicbrainz_artistid"])
+        artist.id = row["id"]
+
+        return artist
+
     def delete(self):
         for album in self.albums:
             album.delete()
@@ -23,6 +43,7 @@ class Artist(BaseModel):
         with self._db.conn:
             delete_artist = "DELETE FROM artist WHERE id = ?"
             self._db.execute(delete_artist, (self.id,))
+            self._db.bump_generation()
 
             delete_track_rel = "DELETE FROM artist_track WHERE artist_id = ?"
             self._db.execute(delete_track_rel, (self.id,))
@@ -96,6 +117,7 @@ class Artist(BaseModel):
 
             with self._db.conn:
                 self._db.execute(sql, dirty_attributes)
+                self._db.bump_generation()
 
     @classmethod
     def search(cls, database, **search_params):
@@ -133,6 +155,42 @@ class Artist(BaseModel):
 
         return artists
 
+    @classmethod
+    def load_albums(cls, database, artists):
+        """Load the albums of many artists with one query.
+
+        Args:
+            database (DbManager): The database.
+            artists (List[Artist]): The artists.
+
+        """
+        from models.album import Album
+
+        cls.load_related(
+            database, artists, "_albums",
+            "SELECT album_artist.artist_id AS owner_id, album.* FROM album "
+            "INNER JOIN album_artist ON album.id = album_artist.album_id "
+            "WHERE album_artist.artist_id IN (%s) ORDER BY date ASC",
+            lambda row: Album.from_row(database, row))
+
+    @classmethod
+    def load_tracks(cls, database, artists):
+        """Load the tracks of many artists with one query.
+
+        Args:
+            database (DbManager): The database.
+            artists (List[Artist]): The artists.
+
+        """
+        from models.track import Track
+
+        cls.load_related(
+            database, artists, "_tracks",
+            "SELECT artist_track.artist_id AS owner_id, track.* FROM track "
+            "INNER JOIN artist_track ON track.id = artist_track.track_id "
+            "WHERE artist_track.artist_id IN (%s) ORDER BY name ASC",
+            lambda row: Track.from_row(database, row))
+
     @classmethod
     def all(cls, database, order="sortname", direction="ASC", limit=None,
             offset=None):
@@ -149,10 +207,6 @@ class Artist(BaseModel):
         result = database.execute(select_string)
 
         for row in result:
-            artists.append(
-                Artist(id=row["id"], db=database, name=row["name"],
-                       sortname=row["sortname"],
-                       musicbrainz_artistid=row["musicbrainz_artistid"])
-            )
+            artists.append(Artist.from_row(database, row))
 
         return artists
@@ -1,15 +1,366 @@
 """Implements a base model for other models to inherit."""
 from six import iteritems
 
+from common import utils
+
+# the most ids to put in one IN (...) clause, below SQLite's default limit
+# of 999 variables
+BATCH_SIZE = 500
+
+# the shortest word of a search for which matches are ranked
+RANKED_PREFIX_LENGTH = 2
+
+
 class BaseModel(object):
     """BaseModel is meant to be inherited by other models."""
 
+    # the model's table, the columns it serializes, which can be selected
+    # on their own, and the columns its listings can be sorted by
+    table = None
+    columns = ("id",)
+    sort_columns = ("id",)
+
     def as_dict(self):
-        """Exposes all the object's values as a dict."""
+        """Exposes all the object's values as a dict.
+
+        Attributes starting with an underscore, like the database connection
+        and cached relationships, are left out.
+
+        """
         this_dict = {}
 
         for key, val in iteritems(self.__dict__):
-            if key != "_db":
+            if not key.startswith("_"):
                 this_dict[key] = val
 
         return this_dict
+
+    @classmethod
+    def check_fields(cls, fields):
+        """Check that fields can be selected on their own.
+
+        Args:
+            fields (List[str]): The fields.
+
+        Raises:
+            ValueError: If a field is not one of the model's columns.
+
+        """
+        for field in fields:
+            if field not in cls.columns:
+                raise ValueError("Unknown field %s" % field)
+
+    @staticmethod
+    def project(row, fields):
+        """Serialize some fields of a row, without creating a model.
+
+        Args:
+            row (sqlite3.Row): The row.
+            fields (List[str]): The fields to keep.
+
+        Returns:
+            dict: The fields and their values.
+
+        """
+        return dict((field, row[field]) for field in fields)
+
+    @staticmethod
+    def load_related(database, objects, attribute, select, build,
+                     many=True):
+        """Load a relationship of many objects with one query per batch.
+
+        Sets the attribute the relationship's property caches its value in,
+        so reading the property afterwards does not query the database.
+
+        Args:
+            database (DbManager): The database.
+            objects (List[BaseModel]): The objects to load it for.
+            attribute (str): The attribute to cache the related objects in,
+                e.g. "_artists".
+            select (str): The query, with a placeholder for the IN (...)
+                list of ids. It must select the id of the object each row
+                belongs to as owner_id.
+            build (Callable[[sqlite3.Row], BaseModel]): Creates a related
+                object from a row.
+            many (bool): False if each object has at most one related
+                object, which is cached instead of a list.
+
+        """
+        owners = {}
+        for owner in objects:
+            setattr(owner, attribute, [] if many else None)
+            owners.setdefault(owner.id, []).append(owner)
+
+        related = {}
+        ids = list(owners)
+
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+
+            for row in database.execute(select % placeholders, batch):
+                if row["id"] not in related:
+                    related[row["id"]] = build(row)
+
+                for owner in owners[row["owner_id"]]:
+                    if many:
+                        getattr(owner, attribute).append(related[row["id"]])
+                    elif getattr(owner, attribute) is None:
+                        setattr(owner, attribute, related[row["id"]])
+
+    @classmethod
+    def sort_column(cls, order):
+        """Return the column of the model's table an order sorts by.
+
+        Args:
+            order (str): The column, optionally prefixed with a table name.
+
+        Returns:
+            str: The column, or None if the order is not by one of the
+                model's sort columns, e.g. if it is by a joined table's.
+
+        """
+        table, dummy, column = order.rpartition(".")
+
+        if table not in ("", cls.table) or column not in cls.sort_columns:
+            return None
+
+        return column
+
+    @classmethod
+    def sorted_query(cls, order="id", direction="ASC", after=None,
+                     fields=None):
+        """Build a query listing the table in a stable order.
+
+        Rows are ordered by the sort column and then by id. Each sort column
+        is indexed, so starting after a sort key costs the same however far
+        into the table it is, unlike with OFFSET.
+
+        Args:
+            order (str): The column to sort by, optionally prefixed with the
+                table name.
+            direction (str): "ASC" or "DESC".
+            after (Tuple): The sort value and id of a row to start after, or
+                None to start at the beginning.
+            fields (List[str]): The only columns to select, or None for all
+                of them. The sort column and id are selected as well.
+
+        Returns:
+            Tuple[str, list, str]: The query, its parameters and the name of
+                the sort column.
+
+        Raises:
+            ValueError: If a column or the direction is not supported.
+
+        """
+        column = cls.sort_column(order)
+        direction = direction.upper()
+
+        if column is None:
+            raise ValueError("Cannot sort by %s" % order)
+
+        if direction not in ("ASC", "DESC"):
+            raise ValueError("Unknown direction %s" % direction)
+
+        selected = "*"
+        if fields:
+            cls.check_fields(fields)
+            selected = ", ".join(
+                list(fields) + [name for name in (column, "id")
+                                if name not in fields])
+
+        sort_column = column
+        column = "%s.%s" % (cls.table, column)
+        id_column = "%s.id" % cls.table
+        where_clause = ""
+        parameters = []
+
+        if after is not None:
+            value, last_id = after
+            comparison = ">" if direction == "ASC" else "<"
+
+            if column == id_column:
+                where_clause = "WHERE %s %s ?" % (id_column, comparison)
+                parameters = [last_id]
+            elif value is None:
+                # NULLs sort first, so after them come all the other rows
+                where_clause = "WHERE (%s IS NULL AND %s %s ?)" % (
+                    column, id_column, comparison)
+                parameters = [last_id]
+
+                if direction == "ASC":
+                    where_clause += " OR %s IS NOT NULL" % column
+            else:
+                where_clause = "WHERE (%s, %s) %s (?, ?)" % (
+                    column, id_column, comparison)
+                parameters = [value, last_id]
+
+                if direction == "DESC":
+                    where_clause += " OR %s IS NULL" % column
+
+        order_clause = "ORDER BY %s %s" % (column, direction)
+        if column != id_column:
+            order_clause += ", %s %s" % (id_column, direction)
+
+        select_string = " ".join((
+            "SELECT %s FROM %s" % (selected, cls.table), where_clause,
+            order_clause))
+
+        return select_string, parameters, sort_column
+
+    @classmethod
+    def page(cls, database, order="id", direction="ASC", limit=100,
+             after=None, fields=None):
+        """Return a page of the table, continuing after a sort key.
+
+        Args:
+            database (DbManager): The database.
+            order (str): The column to sort by, optionally prefixed with the
+                table name.
+            direction (str): "ASC" or "DESC".
+            limit (int): The most rows to return.
+            after (Tuple): The sort value and id of the last row of the
+                previous page, or None for the first page.
+            fields (List[str]): The only fields to return, as dicts instead
+                of models, or None for whole models.
+
+        Returns:
+            Tuple[List, Tuple]: The models or dicts, and the sort value and
+                id to continue after, or None if this is the last page.
+
+        Raises:
+            ValueError: If a column or the direction is not supported.
+
+        """
+        select_string, parameters, column = cls.sorted_query(
+            order, direction, after, fields)
+        parameters.append(int(limit) + 1)
+
+        rows = database.execute(select_string + " LIMIT ?",
+                                parameters).fetchall()
+
+        last = None
+        if len(rows) > int(limit):
+            rows = rows[:int(limit)]
+            last = (rows[-1][column], rows[-1]["id"])
+
+        if fields:
+            return [cls.project(row, fields) for row in rows], last
+
+        return [cls.from_row(database, row) for row in rows], last
+
+    @classmethod
+    def iterate(cls, database, order="id", direction="ASC", fields=None):
+        """Iterate over the whole table without loading it all at once.
+
+        Args:
+            database (DbManager): The database.
+            order (str): The column to sort by, optionally prefixed with the
+                table name.
+            direction (str): "ASC" or "DESC".
+            fields (List[str]): The only fields to return, as dicts instead
+                of models, or None for whole models.
+
+        Returns:
+            Iterator: The models or dicts, read from the cursor as they are
+                needed.
+
+        Raises:
+            ValueError: If a column or the direction is not supported.
+
+        """
+        select_string, parameters, dummy = cls.sorted_query(
+            order, direction, fields=fields)
+        cursor = database.execute(select_string, parameters)
+
+        if fields:
+            return (cls.project(row, fields) for row in cursor)
+
+        return (cls.from_row(database, row) for row in cursor)
+
+    @classmethod
+    def by_ids(cls, database, ids, fields=None):
+        """Load models by their ids, in the order of the ids.
+
+        Args:
+            database (DbManager): The database.
+            ids (List[int]): The ids.
+            fields (List[str]): The only fields to return, as dicts instead
+                of models, or None for whole models.
+
+        Returns:
+            List: The models or dicts that exist.
+
+        Raises:
+            ValueError: If a field is not one of the model's columns.
+
+        """
+        selected = "*"
+        if fields:
+            cls.check_fields(fields)
+            selected = ", ".join(list(fields) + (
+                [] if "id" in fields else ["id"]))
+
+        models = {}
+
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            select_string = "SELECT %s FROM %s WHERE id IN (%s)" % (
+                selected, cls.table, ", ".join("?" * len(batch)))
+
+            for row in database.execute(select_string, batch):
+                if fields:
+                    models[row["id"]] = cls.project(row, fields)
+                else:
+                    models[row["id"]] = cls.from_row(database, row)
+
+        return [models[model_id] for model_id in ids if model_id in models]
+
+    @classmethod
+    def match(cls, database, text, limit=None):
+        """Find models whose names have words starting with each word of a
+        search, best matches first.
+
+        Uses the full-text search index, and falls back to scanning the
+        table with LIKE if SQLite cannot provide one.
+
+        Args:
+            database (DbManager): The database.
+            text (str): The search.
+            limit (int): The most models to return, or None for all of them.
+
+        Returns:
+            List[BaseModel]: The models.
+
+        """
+        query = utils.match_query(text)
+        if query is None:
+            return []
+
+        limit = -1 if limit is None else int(limit)
+
+        words = utils.search_words(text)
+
+        if database.has_search_index:
+            select_string = "SELECT {0}.* FROM {0}_fts INNER JOIN {0} ON " \
+                "{0}.id = {0}_fts.rowid WHERE {0}_fts MATCH ?".format(
+                    cls.table)
+
+            # a single letter matches too much of the library to rank it
+            # all, so the first matches are returned as they are found
+            if min(len(word) for word in words) >= RANKED_PREFIX_LENGTH:
+                # ties, e.g. between names matching a single word, go to
+                # the shortest name, which is the closest to what was typed
+                select_string += " ORDER BY rank, length({0}.name)".format(
+                    cls.table)
+
+            select_string += " LIMIT ?"
+            parameters = [query, limit]
+        else:
+            select_string = "SELECT * FROM {0} WHERE {1} ORDER BY " \
+                "length(name) LIMIT ?".format(
+                    cls.table, " AND ".join(["name LIKE ?"] * len(words)))
+            parameters = ["%%%s%%" % word for word in words] + [limit]
+
+        return [cls.from_row(database, row) for row in
+                database.execute(select_string, parameters)]
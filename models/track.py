@@ -12,6 +12,11 @@ logging.basicConfig(format="%(asctime)s %(message)s", level=logging.DEBUG)
 
 class Track(BaseModel):
 
+    table = "track"
+    columns = ("id", "tracknumber", "name", "grouping", "filename", "format",
+               "codec", "bitrate", "duration")
+    sort_columns = ("id", "tracknumber", "name", "grouping", "filename")
+
     def __init__(self, db, id=None, **kwargs):
         self._db = db
 
@@ -21,7 +26,8 @@ class Track(BaseModel):
             for row in self._db.execute("SELECT * FROM track WHERE id = ?",
                                         (id,)):
                 for key in ["id", "tracknumber", "name", "grouping",
-                            "filename"]:
+                            "filename", "format", "codec", "bitrate",
+                            "duration"]:
                     setattr(self, key, row[key])
                     self.__data[key] = row[key]
         else:
@@ -29,11 +35,31 @@ class Track(BaseModel):
                 setattr(self, key, value)
                 self.__data[key] = value
 
+    @classmethod
+    def from_row(cls, database, row):
+        """Create a track from a row of the track table without querying it
+        again.
+
+        Args:
+            database (DbManager): The database.
+            row (sqlite3.Row): The row.
+
+        """
+        track = cls(database)
+
+        for key in ["id", "tracknumber", "name", "grouping", "filename",
+                    "format", "codec", "bitrate", "duration"]:
+            setattr(track, key, row[key])
+            track.__data[key] = row[key]
+
+        return track
+
     def delete(self):
         delete_sql = "DELETE FROM track WHERE id = ?"
 
         with self._db.conn:
             self._db.execute(delete_sql, (self.id,))
+            self._db.bump_generation()
 
             # If there is an old album, remove it if it no longer has any
             # tracks
@@ -281,6 +307,17 @@ class Track(BaseModel):
                   "WHERE id = ?", (track_number, track_name, track_grouping,
                                    self.id))
 
+        if hasattr(metadata, "info"):
+            track_stream = utils.stream_info(metadata)
+            for (key, value) in track_stream.items():
+                setattr(self, key, value)
+
+            c.execute("UPDATE track SET format = ?, codec = ?, bitrate = ?, "
+                      "duration = ? WHERE id = ?",
+                      (track_stream["format"], track_stream["codec"],
+                       track_stream["bitrate"], track_stream["duration"],
+                       self.id))
+
         # If there is an old album, remove it if it no longer has any tracks
         try:
             del self._album
@@ -338,6 +375,7 @@ class Track(BaseModel):
             setattr(self, "_artists", artists)
 
         c.close()
+        self._db.bump_generation()
         self._db.commit()
 
         return True
@@ -364,6 +402,7 @@ class Track(BaseModel):
 
             with self._db.conn:
                 self._db.execute(sql, dirty_attributes)
+                self._db.bump_generation()
 
     @classmethod
     def search(cls, database, **search_params):
@@ -414,9 +453,41 @@ class Track(BaseModel):
 
         return track
 
+    @classmethod
+    def store_stream_info(cls, database, row, metadata):
+        """Fill in the stream details a stored track is missing.
+
+        Tracks stored before the format, codec, bitrate and duration were
+        recorded have them filled in when the library is scanned again.
+
+        Args:
+            database (DbManager): The database.
+            row (sqlite3.Row): The track's row.
+            metadata (mutagen.FileType): The track's metadata.
+
+        """
+        if not hasattr(metadata, "info"):
+            return
+
+        track_stream = utils.stream_info(metadata)
+        missing = dict((key, value) for (key, value) in track_stream.items()
+                       if row[key] is None and value is not None)
+
+        if missing:
+            set_clause = utils.update_clause_from_dict(missing)
+            missing["id"] = row["id"]
+
+            with database.conn:
+                database.execute(" ".join(("UPDATE track", set_clause,
+                                           "WHERE id = :id")), missing)
+                database.bump_generation()
+
     @classmethod
     def store(cls, filename, metadata, database):
-        if Track.find_by_path(filename, database):
+        for row in database.execute("SELECT * FROM track WHERE filename = ? "
+                                    "LIMIT 1", (filename,)):
+            cls.store_stream_info(database, row, metadata)
+
             return True
 
         c = database.cursor()
@@ -579,6 +650,8 @@ class Track(BaseModel):
         except KeyError:
             pass
 
+        track_stream = utils.stream_info(metadata)
+
         track = None
         rows = c.execute("SELECT * FROM track WHERE filename = ?", (filename,))
         row = rows.fetchone()
@@ -588,13 +661,16 @@ class Track(BaseModel):
                           grouping=row["grouping"], filename=row["filename"])
         else:
             c.execute("INSERT INTO track (tracknumber, name, grouping, "
-                      "filename) VALUES(?, ?, ?, ?)",
+                      "filename, format, codec, bitrate, duration) VALUES(?, "
+                      "?, ?, ?, ?, ?, ?, ?)",
                       (track_number, track_name, track_grouping,
-                       filename))
+                       filename, track_stream["format"],
+                       track_stream["codec"], track_stream["bitrate"],
+                       track_stream["duration"]))
 
             track = Track(id=c.lastrowid, db=database, tracknumber=track_number,
                           name=track_name, grouping=track_grouping,
-                          filename=filename)
+                          filename=filename, **track_stream)
 
         if album:
             try:
@@ -610,11 +686,44 @@ class Track(BaseModel):
             except sqlite3.IntegrityError:
                 pass
 
+        database.bump_generation()
         database.commit()
         c.close()
 
         return track
 
+    @classmethod
+    def load_albums(cls, database, tracks):
+        """Load the albums of many tracks with one query.
+
+        Args:
+            database (DbManager): The database.
+            tracks (List[Track]): The tracks.
+
+        """
+        cls.load_related(
+            database, tracks, "_album",
+            "SELECT album_track.track_id AS owner_id, album.* FROM album "
+            "INNER JOIN album_track ON album.id = album_track.album_id WHERE "
+            "album_track.track_id IN (%s)",
+            lambda row: Album.from_row(database, row), many=False)
+
+    @classmethod
+    def load_artists(cls, database, tracks):
+        """Load the artists of many tracks with one query.
+
+        Args:
+            database (DbManager): The database.
+            tracks (List[Track]): The tracks.
+
+        """
+        cls.load_related(
+            database, tracks, "_artists",
+            "SELECT artist_track.track_id AS owner_id, artist.* FROM artist "
+            "INNER JOIN artist_track ON artist.id = artist_track.artist_id "
+            "WHERE artist_track.track_id IN (%s)",
+            lambda row: Artist.from_row(database, row))
+
     @classmethod
     def all(cls, database, order="track.id", direction="ASC", limit=None,
             offset=None):
@@ -627,16 +736,13 @@ class Track(BaseModel):
             "album_track.album_id = album.id ORDER BY %s %s" % (order,
                                                                 direction)
 
-        if limit and offset:
+        if limit is not None and offset is not None:
             select_string = " ".join((select_string,
                                       "LIMIT %s OFFSET %s" % (limit, offset)))
 
         result = database.execute(select_string)
 
         for row in result:
-            tracks.append(Track(id=row["id"], db=database,
-                                tracknumber=row["tracknumber"],
-                                name=row["name"], grouping=row["name"],
-                                filename=row["filename"]))
+            tracks.append(Track.from_row(database, row))
 
         return tracks
@@ -86,6 +86,13 @@ mach2Services.factory('TrackArtists', ['$resource', function($resource) {
   });
 }]);
 
+mach2Services.factory('Search', ['$resource', function($resource) {
+  return $resource('search', {}, {
+    query:  {
+      method: 'GET'
+    }
+  });
+}]);
 
 mach2Services.factory('TrackSearch', ['$resource', function($resource) {
   return $resource('tracks/:name', {}, {
@@ -0,0 +1,64 @@
+import io
+import time
+import zipfile
+
+from common.archive import ZIP32_LIMIT, archive_name, stream_zip
+
+
+def read_zip(files):
+    return zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(files))))
+
+
+def test_stream_zip():
+    mtime = time.mktime((2015, 6, 1, 12, 30, 10, 0, 0, -1))
+    archive = read_zip([("Album/01 - One.ogg", mtime, 6, [b"abc", b"def"]),
+                        (u"Album/02 - Twö.ogg", mtime, None, iter([]))])
+
+    assert archive.testzip() is None
+    assert archive.namelist() == ["Album/01 - One.ogg",
+                                  u"Album/02 - Twö.ogg"]
+    assert archive.read("Album/01 - One.ogg") == b"abcdef"
+
+    info = archive.getinfo("Album/01 - One.ogg")
+    assert info.compress_type == zipfile.ZIP_STORED
+    assert info.date_time == (2015, 6, 1, 12, 30, 10)
+
+
+def test_stream_zip64():
+    archive = read_zip([("big.flac", time.time(), ZIP32_LIMIT, [b"abc"])])
+
+    assert archive.testzip() is None
+    assert archive.read("big.flac") == b"abc"
+
+
+def test_stream_zip_closes_contents():
+    class Contents(object):
+        closed = False
+
+        def __iter__(self):
+            return iter([b"abc"])
+
+        def close(self):
+            self.closed = True
+
+    contents = Contents()
+    stream = stream_zip([("a", time.time(), None, contents)])
+    next(stream)
+    next(stream)
+    stream.close()
+
+    assert contents.closed
+
+    # closed before any of the entry has been read
+    contents = Contents()
+    stream = stream_zip([("a", time.time(), None, contents)])
+    next(stream)
+    stream.close()
+
+    assert contents.closed
+
+
+def test_archive_name():
+    assert archive_name("AC/DC") == "AC-DC"
+    assert archive_name("..") == "_"
+    assert archive_name(" ") == "_"
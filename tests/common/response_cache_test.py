@@ -0,0 +1,74 @@
+import gzip
+
+from werkzeug.datastructures import MultiDict
+
+from common.response_cache import ResponseCache
+
+
+def test_key():
+    key = ResponseCache.key("/tracks", MultiDict([("order", "name"),
+                                                  ("api_key", "secret"),
+                                                  ("conditions", "name"),
+                                                  ("conditions", "=")]))
+
+    assert key == ResponseCache.key(
+        "/tracks", MultiDict([("conditions", "name"), ("conditions", "="),
+                              ("order", "name")]))
+    assert key != ResponseCache.key(
+        "/tracks", MultiDict([("conditions", "="), ("conditions", "name"),
+                              ("order", "name")]))
+    assert key != ResponseCache.key("/albums", MultiDict([("order", "name")]))
+
+
+def test_get_put():
+    cache = ResponseCache(10000, compress_min_size=100)
+    body = b"[" + b"1," * 500 + b"1]"
+    headers = [("Content-Type", "application/json")]
+
+    assert cache.get("a", 1) is None
+
+    entry = cache.put("a", 1, body, headers)
+    assert gzip.decompress(entry.compressed) == body
+
+    entry = cache.get("a", 1)
+    assert entry.body == body
+    assert entry.headers == headers
+
+    small = cache.put("b", 1, b"[]", headers)
+    assert small.compressed is None
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_generation():
+    cache = ResponseCache(10000)
+    cache.put("a", 1, b"[]", [])
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["invalidations"] == 1
+
+    # built before the change, so it is not kept
+    cache.put("a", 1, b"[]", [])
+    assert cache.get("a", 2) is None
+
+
+def test_evict():
+    cache = ResponseCache(250, compress_min_size=1000)
+
+    for key in ("a", "b", "c"):
+        cache.put(key, 1, b"x" * 100, [])
+        cache.get("a", 1)
+
+    assert cache.get("a", 1) is not None
+    assert cache.get("b", 1) is None
+    assert cache.get("c", 1) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.size <= 250
+
+    # too large to keep at all
+    cache.put("d", 1, b"x" * 300, [])
+    assert cache.get("d", 1) is None
@@ -0,0 +1,107 @@
+import os
+
+from flask import Flask
+import pytest
+
+from common.responses import (RangeNotSatisfiable, not_modified, parse_range,
+                              send_file_range)
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+
+
+def test_send_file_range(test_file):
+    app = Flask(__name__)
+    size = os.path.getsize(test_file)
+
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    with app.test_request_context(headers={"Range": "bytes=10-19"}):
+        from flask import request
+
+        resp = send_file_range(request, test_file, "audio/ogg")
+
+        assert resp.status_code == 206
+        assert resp.headers["Content-Range"] == "bytes 10-19/%d" % size
+        assert resp.content_length == 10
+        assert b"".join(resp.response) == original[10:20]
+
+    with app.test_request_context(headers={"Range": "bytes=%d-" % size}):
+        from flask import request
+
+        assert send_file_range(request, test_file,
+                               "audio/ogg").status_code == 416
+
+    with app.test_request_context():
+        from flask import request
+
+        resp = send_file_range(request, test_file, "audio/ogg")
+
+        assert resp.status_code == 200
+        assert resp.headers["Accept-Ranges"] == "bytes"
+        assert b"".join(resp.response) == original
+
+
+def test_not_modified():
+    app = Flask(__name__)
+
+    with app.test_request_context(headers={"If-None-Match":
+                                           '"library-1:gzip"'}):
+        from flask import request
+
+        assert not_modified(request, "library-1").status_code == 304
+        assert not_modified(request, "library-1").headers["ETag"] == \
+            '"library-1:gzip"'
+        assert not_modified(request, "library-2") is None
+
+    with app.test_request_context(headers={
+            "If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"}):
+        from flask import request
+
+        assert not_modified(request, "library-1", 946684800).status_code == 304
+        assert not_modified(request, "library-1", 946684801) is None
+
+    with app.test_request_context(method="POST",
+                                  headers={"If-None-Match": "*"}):
+        from flask import request
+
+        assert not_modified(request, "library-1") is None
+
+
+def test_send_file_conditional(test_file):
+    app = Flask(__name__)
+
+    with app.test_request_context():
+        from flask import request
+
+        etag = send_file_range(request, test_file, "audio/ogg").get_etag()[0]
+
+    with app.test_request_context(headers={"If-None-Match": '"%s"' % etag}):
+        from flask import request
+
+        assert send_file_range(request, test_file,
+                               "audio/ogg").status_code == 304
+
+    with app.test_request_context(headers={"Range": "bytes=0-9",
+                                           "If-Range": '"%s"' % etag}):
+        from flask import request
+
+        assert send_file_range(request, test_file,
+                               "audio/ogg").status_code == 206
+
+    with app.test_request_context(headers={"Range": "bytes=0-9",
+                                           "If-Range": '"old"'}):
+        from flask import request
+
+        assert send_file_range(request, test_file,
+                               "audio/ogg").status_code == 200
@@ -0,0 +1,54 @@
+import json
+import zlib
+
+from flask import Flask
+
+from common.streaming import gzip_stream, json_array, json_columns
+
+
+def test_json_array():
+    app = Flask(__name__)
+
+    with app.app_context():
+        chunks = list(json_array(({"id": number} for number in range(100)),
+                                 chunk_size=100))
+
+    assert chunks[0] == b"["
+    assert len(chunks) > 3
+    assert json.loads(b"".join(chunks).decode("utf-8")) == [
+        {"id": number} for number in range(100)]
+
+    with app.app_context():
+        assert b"".join(json_array([])) == b"[]"
+
+
+def test_json_columns():
+    app = Flask(__name__)
+    rows = [(number, "name %d" % number, "unused") for number in range(25)]
+
+    with app.app_context():
+        # the columns move to temporary files as they grow
+        chunks = list(json_columns(["id", "name"], rows, chunk_rows=10,
+                                   spool_size=16, chunk_size=32))
+
+    assert len(chunks) > 3
+    assert chunks[0] == b'{"id":['
+    assert b" " not in b"".join(chunks[:3])
+    assert json.loads(b"".join(chunks).decode("utf-8")) == {
+        "id": list(range(25)),
+        "name": ["name %d" % number for number in range(25)]}
+
+    with app.app_context():
+        assert b"".join(json_columns(["id"], [])) == b'{"id":[]}'
+        assert b"".join(json_columns([], [])) == b"{}"
+
+
+def test_gzip_stream():
+    chunks = [b"[", b"1,2", b"]"]
+    compressed = list(gzip_stream(chunks))
+
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    # each chunk can be decoded as soon as it arrives
+    assert decompressor.decompress(compressed[0]) == b"["
+    assert decompressor.decompress(b"".join(compressed[1:])) == b"1,2]"
@@ -0,0 +1,55 @@
+import time
+
+from common.throttle import BandwidthShaper, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, 500)
+
+    assert bucket.reserve(500) == 0.0
+    assert 0.49 < bucket.reserve(500) <= 0.5
+
+
+def test_user_limit():
+    shaper = BandwidthShaper(user_rate=1000, burst=100)
+    first = shaper.shape([b"x" * 100], 1)
+    other = shaper.shape([b"x" * 100], 2)
+
+    assert shaper.reserve(100, 1) == 0.0
+    assert shaper.reserve(100, 1) > 0.0
+    assert shaper.reserve(100, 2) == 0.0
+
+    first.close()
+    other.close()
+    assert shaper.stats()["interactive"] == 0
+
+
+def test_bulk_gives_way():
+    shaper = BandwidthShaper(global_rate=1000, bulk_share=0.1, burst=100)
+    download = shaper.shape([], 1, interactive=False)
+
+    shaper.reserve(100, 1, interactive=False)
+    alone = shaper.reserve(100, 1, interactive=False)
+
+    playback = shaper.shape([], 2)
+    shaper.reserve(100, 1, interactive=False)
+    shared = shaper.reserve(100, 1, interactive=False)
+
+    assert alone < 0.2
+    assert shared > 0.9
+
+    playback.close()
+    download.close()
+    assert shaper.stats()["bulk"] == 0
+
+
+def test_shaped_stream():
+    shaper = BandwidthShaper(global_rate=10000, burst=1000)
+    stream = shaper.shape([b"x" * 1000, b"x" * 1000], 1)
+
+    started = time.time()
+    assert len(b"".join(stream)) == 2000
+    assert time.time() - started >= 0.09
+
+    stream.close()
+    assert shaper.stats()["delayed"] > 0
@@ -1,3 +1,6 @@
+import mutagen
+import pytest
+
 from common import utils
 
 
@@ -12,3 +15,33 @@ def test_update_clause_from_dict():
     test_data = {"name": "Flaf"}
 
     assert utils.update_clause_from_dict(test_data) == "SET name = :name"
+
+
+def test_stream_info(test_file):
+    metadata = mutagen.File(test_file, easy=True)
+
+    assert utils.stream_info(metadata) == {"format": "ogg",
+                                           "codec": "vorbis", "bitrate": 48,
+                                           "duration": 3.0}
+    assert utils.stream_info({}) == {"format": None, "codec": None,
+                                     "bitrate": None, "duration": None}
+
+
+def test_cursor():
+    cursor = utils.encode_cursor("name", "ASC", u"Näme", 3)
+
+    assert "=" not in cursor
+    assert utils.decode_cursor(cursor) == ["name", "ASC", u"Näme", 3]
+
+    with pytest.raises(ValueError):
+        utils.decode_cursor("not a cursor")
+
+    # valid JSON, but not a list
+    with pytest.raises(ValueError):
+        utils.decode_cursor("MQ")
+
+
+def test_match_query():
+    assert utils.search_words("Sigur R\u00f3s - ()") == ["sigur", "r\u00f3s"]
+    assert utils.match_query('Foo "bar') == '"foo"* "bar"*'
+    assert utils.match_query("*") is None
@@ -1,3 +1,7 @@
+import sqlite3
+
+import pytest
+
 from db.db_manager import DbManager
 
 
@@ -33,8 +37,9 @@ class TestDbManager:
 
         assert DbManager.create_track_table == "CREATE TABLE IF NOT EXISTS "\
             "track (id INTEGER, tracknumber INTEGER, name TEXT(2000000000), "\
-            "grouping TEXT(2000000000), filename TEXT(2000000000), "\
-            "CONSTRAINT TRACK_PK PRIMARY KEY (id))"
+            "grouping TEXT(2000000000), filename TEXT(2000000000), format "\
+            "TEXT, codec TEXT, bitrate INTEGER, duration REAL, CONSTRAINT "\
+            "TRACK_PK PRIMARY KEY (id))"
 
         assert DbManager.create_musicbrainz_artist_index == "CREATE UNIQUE "\
             "INDEX IF NOT EXISTS artist_musicbrainz_artistid ON "\
@@ -51,3 +56,111 @@ class TestDbManager:
 
         assert DbManager.create_track_number_index == "CREATE INDEX IF NOT "\
             "EXISTS track_tracknumber_IDX ON track(tracknumber)"
+
+    def test_sort_indexes(self, database):
+        database.upgrade_tables()
+
+        indexes = [row[1] for row in database.execute(
+            "SELECT * FROM sqlite_master WHERE type = 'index'")]
+
+        for index in ["album_date_IDX", "album_name_IDX", "artist_name_IDX",
+                      "artist_sortname_IDX"]:
+            assert index in indexes
+
+    def test_upgrade_tables(self, database):
+        database.upgrade_tables()
+
+        columns = [row[1] for row in database.execute(
+            "PRAGMA table_info(track)")]
+
+        for (column, dummy) in DbManager.added_columns["track"]:
+            assert column in columns
+
+    def test_generation(self, database):
+        generation, modified = database.generation()
+
+        with database.conn:
+            database.bump_generation()
+
+        assert database.generation()[0] == generation + 1
+        assert database.generation()[1] >= modified
+
+    def test_search_index(self, database):
+        database.upgrade_tables()
+
+        assert database.has_search_index
+
+        with database.conn:
+            database.execute("INSERT INTO artist (name, sortname) VALUES "
+                             "('Sigur R\u00f3s', 'Sigur Ros')")
+            artist_id = database.execute("SELECT last_insert_rowid()"
+                                         ).fetchone()[0]
+
+        def matches(query):
+            return [row[0] for row in database.execute(
+                "SELECT rowid FROM artist_fts WHERE artist_fts MATCH ?",
+                (query,))]
+
+        assert matches('"ros"*') == [artist_id]
+
+        with database.conn:
+            database.execute("UPDATE artist SET name = 'Mum', sortname = "
+                             "NULL WHERE id = ?", (artist_id,))
+
+        assert matches('"ros"*') == []
+        assert matches('"mum"') == [artist_id]
+
+        with database.conn:
+            database.execute("DELETE FROM artist WHERE id = ?", (artist_id,))
+
+        assert matches('"mum"') == []
+
+    def test_export_search_index(self, tmpdir):
+        new_db = DbManager(str(tmpdir.join("library.db")))
+
+        with new_db.conn:
+            new_db.execute("INSERT INTO track (name, filename) VALUES "
+                           "('Hello World', 'hello.ogg')")
+
+        new_db.export()
+
+        exported = DbManager(str(tmpdir.join("library.db")))
+
+        assert [row[0] for row in exported.execute(
+            "SELECT rowid FROM track_fts WHERE track_fts MATCH 'wor*'")] == [1]
+
+    def test_time_limit(self, database):
+        slow_query = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + "\
+            "1 FROM n) SELECT max(i) FROM n"
+
+        with pytest.raises(sqlite3.OperationalError):
+            with database.time_limit(0.01):
+                database.execute(slow_query).fetchone()
+
+        # the limit only applies inside the block
+        assert database.execute("SELECT count(*) FROM track").fetchone()
+
+    def test_library_changes(self, tmpdir):
+        new_db = DbManager(str(tmpdir.join("library.db")))
+
+        assert new_db.last_change() == 0
+        assert new_db.changes_since(0) == []
+
+        with new_db.conn:
+            new_db.execute("INSERT INTO artist (name) VALUES ('Artist')")
+            new_db.execute("UPDATE artist SET sortname = 'Artist'")
+            new_db.execute("UPDATE artist SET name = 'Renamed'")
+            new_db.execute("DELETE FROM artist")
+
+        # changing anything but the name is not recorded
+        assert new_db.changes_since(0) == [(1, "artist", 1),
+                                           (2, "artist", 1),
+                                           (3, "artist", 1)]
+        assert new_db.changes_since(2) == [(3, "artist", 1)]
+        assert new_db.last_change() == 3
+
+        with new_db.conn:
+            new_db.execute("DELETE FROM library_changes WHERE id = 1")
+
+        # the change after the one asked for is gone
+        assert new_db.changes_since(0) is None
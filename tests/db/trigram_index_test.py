@@ -0,0 +1,85 @@
+from db.db_manager import DbManager
+from db.trigram_index import (LibraryTrigramIndex, TrigramIndex, normalize,
+                              trigrams)
+
+
+def test_normalize():
+    assert normalize("Sigur Rós") == "sigur ros"
+    assert normalize("  AC/DC -- Live!") == "ac dc live"
+    assert normalize("...") == ""
+
+
+def test_trigrams():
+    assert trigrams("ab") == set(["  a", " ab", "ab "])
+    assert trigrams("ab ab") == trigrams("ab")
+    assert trigrams("") == set()
+
+
+def test_search():
+    index = TrigramIndex()
+    index.add(1, "The Beatles")
+    index.add(2, "Beach House")
+    index.add(3, "The Beatles")
+    index.add(4, "Björk")
+
+    assert [row_id for (row_id, dummy) in index.search("the beatels")] == [1, 3]
+    assert index.search("the beatles", limit=1) == [(1, 1.0)]
+    assert [row_id for (row_id, dummy) in index.search("bjork")] == [4]
+    assert index.search("zzz") == []
+    assert index.search("") == []
+
+    index.add(1, "Mum")
+    assert [row_id for (row_id, dummy) in index.search("the beatles")] == [3]
+    assert [row_id for (row_id, dummy) in index.search("mum")] == [1]
+
+    index.remove(3)
+    index.remove(3)
+    assert index.search("the beatles") == []
+    assert len(index) == 3
+
+
+def test_compact():
+    index = TrigramIndex()
+
+    for row_id in range(2000):
+        index.add(row_id, "name %d" % row_id)
+
+    for row_id in range(1, 2000):
+        index.remove(row_id)
+
+    assert len(index) == 1
+    assert index.search("name 0") == [(0, 1.0)]
+
+
+def test_library_index(tmpdir):
+    database = DbManager(str(tmpdir.join("library.db")))
+
+    with database.conn:
+        database.execute("INSERT INTO artist (name) VALUES ('Radiohead')")
+        database.execute("INSERT INTO album (name) VALUES ('Kid A')")
+
+    index = LibraryTrigramIndex(database)
+
+    assert index.search("artist", "radoihead") == [1]
+    assert index.search("album", "radiohead") == []
+
+    with database.conn:
+        database.execute("UPDATE artist SET name = 'Portishead'")
+        database.execute("INSERT INTO artist (name) VALUES ('Radiohead')")
+        database.execute("DELETE FROM album")
+
+    assert index.search("artist", "radiohead") == [2]
+    assert index.search("artist", "portishaed") == [1]
+    assert index.search("album", "kid a") == []
+    assert index.builds == 1
+
+    with database.conn:
+        database.execute("UPDATE artist SET name = 'Massive Attack' WHERE "
+                         "id = 2")
+        database.execute("INSERT INTO album (name) VALUES ('Mezzanine')")
+        database.execute("DELETE FROM library_changes WHERE id < (SELECT "
+                         "max(id) FROM library_changes)")
+
+    # the changes were dropped, so the library is indexed again
+    assert index.search("artist", "massive atack") == [2]
+    assert index.builds == 2
@@ -0,0 +1,49 @@
+"""Tests for the library module."""
+from os.path import dirname, join, realpath
+
+from db.db_manager import DbManager
+from library import MediaLibrary
+from transcode.cache import TranscodeCache
+from transcode.profiles import TranscodeProfile
+
+
+def test_transcode(tmpdir):
+    tests_dir = dirname(realpath(__file__))
+
+    # a path that does not exist yet gives an empty in-memory library
+    database = DbManager(str(tmpdir.join("library.db")))
+    with database.conn:
+        for name in ["test.ogg", "testnew.ogg", "missing.ogg"]:
+            database.execute("INSERT INTO track (filename) VALUES (?)",
+                             (join(tests_dir, name),))
+
+    cache = TranscodeCache(str(tmpdir.join("cache")), 1024 * 1024)
+    profile = TranscodeProfile("copy", "cat {filename}")
+    media_library = MediaLibrary(tests_dir, database)
+
+    counters = media_library.transcode([profile], cache, processes=2,
+                                       pipe_output="-")
+
+    assert counters["transcoded"] == 2
+    assert counters["failed"] == 1
+    assert cache.stats()["entries"] == 2
+
+    counters = media_library.transcode([profile], cache, processes=2,
+                                       pipe_output="-")
+
+    assert counters["transcoded"] == 0
+    assert counters["skipped"] == 2
+
+
+def test_transcoded_size(tmpdir):
+    database = DbManager(str(tmpdir.join("library.db")))
+    with database.conn:
+        database.execute("INSERT INTO track (filename, duration) VALUES "
+                         "('long.ogg', 100)")
+        database.execute("INSERT INTO track (filename) VALUES ('new.ogg')")
+
+    media_library = MediaLibrary(str(tmpdir), database)
+    profiles = [TranscodeProfile("low", "cat {filename}", bitrate=64),
+                TranscodeProfile("copy", "cat {filename}")]
+
+    assert media_library.transcoded_size(profiles) == 100 * 64000 // 8
@@ -1,12 +1,16 @@
 """Tests for the mach2 app."""
+import gzip
+import io
 import json
 import random
 import string
 import unittest
+import zipfile
 
 import pytest
 import six
 
+from common.utils import encode_cursor
 from mach2 import create_app
 
 
@@ -88,3 +92,274 @@ class Mach2TestCase(unittest.TestCase):
 
         user = json.loads(get_response.data.decode("utf-8"))
         assert user["transcode_command"] == six.u(transcode_string)
+
+    def test_transcode_profiles(self):
+        """Test listing and choosing transcode profiles."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/profiles")
+        profiles = json.loads(rv.data.decode("utf-8"))
+        assert profiles
+
+        put_response = self.app.put(
+            "/user", data=json.dumps(
+                dict(transcode_profile=profiles[0]["name"])),
+            content_type="application/json")
+
+        assert put_response.status_code == 200
+
+        user = json.loads(put_response.data.decode("utf-8"))
+        assert user["transcode_profile"] == profiles[0]["name"]
+
+        put_response = self.app.put(
+            "/user", data=json.dumps(dict(transcode_profile="nonexistent")),
+            content_type="application/json")
+
+        assert put_response.status_code == 400
+
+    def test_album_download(self):
+        """Test downloading an album as a ZIP archive."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/albums/1/download")
+        assert rv.status_code == 200
+        assert rv.mimetype == "application/zip"
+        assert "attachment" in rv.headers["Content-Disposition"]
+
+        archive = zipfile.ZipFile(io.BytesIO(rv.data))
+        assert archive.testzip() is None
+
+        rv = self.app.get("/albums/1/download?profile=nonexistent")
+        assert rv.status_code == 400
+
+    def test_include(self):
+        """Test including relationships in listings."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks?include=album,artists")
+        assert rv.status_code == 200
+
+        for track in json.loads(rv.data.decode("utf-8")):
+            assert "album" in track
+            assert "artists" in track
+
+        rv = self.app.get("/albums?include=nonexistent")
+        assert rv.status_code == 400
+
+    def test_cursor_pagination(self):
+        """Test paging through tracks with cursors."""
+        self.login("admin", "testpass")
+
+        track_ids = []
+        rv = self.app.get("/tracks?limit=2&order=name")
+
+        while True:
+            assert rv.status_code == 200
+            track_ids.extend(track["id"] for track in
+                             json.loads(rv.data.decode("utf-8")))
+
+            if "X-Next-Cursor" not in rv.headers:
+                break
+
+            rv = self.app.get("/tracks?limit=2&cursor=%s" %
+                              rv.headers["X-Next-Cursor"])
+
+        assert len(track_ids) == len(set(track_ids)) == 3
+
+        rv = self.app.get("/tracks?cursor=invalid")
+        assert rv.status_code == 400
+
+        for values in [(1, "ASC", 1, 1), ("name", None, "a", 1),
+                       ("name", "ASC", ["a"], 1), ("name", "ASC", "a", "1")]:
+            rv = self.app.get("/tracks?cursor=%s" % encode_cursor(*values))
+            assert rv.status_code == 400
+
+        # sorting by a joined table's column cannot be paged with a cursor
+        rv = self.app.get("/tracks?limit=10&order=album.name")
+        offset_rv = self.app.get("/tracks?limit=10&offset=0&order=album.name")
+
+        assert "X-Next-Cursor" not in rv.headers
+        assert json.loads(rv.data) == json.loads(offset_rv.data)
+
+    def test_fields(self):
+        """Test selecting the fields listings and details return."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks?fields=id,name&limit=2")
+        assert [sorted(track) for track in json.loads(rv.data)] == [
+            ["id", "name"], ["id", "name"]]
+        assert "X-Next-Cursor" in rv.headers
+
+        rv = self.app.get("/artists?fields=name")
+        assert json.loads(rv.data) == [{"name": "Artist 1"},
+                                       {"name": "Artist 2"}]
+
+        rv = self.app.get("/albums?fields=name&offset=0&limit=5")
+        assert json.loads(rv.data) == [{"name": "Album 1"}]
+
+        rv = self.app.get("/albums/1?fields=date")
+        assert list(json.loads(rv.data)) == ["date"]
+
+        rv = self.app.get("/tracks?fields=nonexistent")
+        assert rv.status_code == 400
+
+        rv = self.app.get("/tracks?fields=name&include=album")
+        assert rv.status_code == 400
+
+    def test_columns(self):
+        """Test sending listings as one array per field."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks?format=columns&fields=id,name")
+        assert rv.mimetype == "application/vnd.mach2.columns+json"
+
+        columns = json.loads(rv.data)
+        assert list(columns) == ["id", "name"]
+        assert columns["id"] == [1, 2, 3]
+
+        # each column is read in a pass of its own, in the same order
+        rv = self.app.get("/tracks?format=columns&fields=id,name&order=name"
+                          "&direction=desc")
+        columns = json.loads(rv.data)
+        rv = self.app.get("/tracks?fields=id,name&order=name&direction=desc")
+        assert [dict(id=track_id, name=name) for track_id, name in
+                zip(columns["id"], columns["name"])] == json.loads(rv.data)
+
+        rv = self.app.get("/artists?limit=1", headers={
+            "Accept": "application/vnd.mach2.columns+json"})
+        columns = json.loads(rv.data)
+        assert columns["name"] == ["Artist 1"]
+        assert sorted(columns) == ["id", "musicbrainz_artistid", "name",
+                                   "sortname"]
+        assert "X-Next-Cursor" in rv.headers
+        assert "Accept" in rv.headers["Vary"]
+
+        # the JSON listing is cached apart from the columns one
+        rv = self.app.get("/artists?limit=1")
+        assert rv.mimetype == "application/json"
+
+        rv = self.app.get("/albums?format=columns&include=artists")
+        assert rv.status_code == 400
+
+    def test_streamed_listing(self):
+        """Test streaming a whole listing, compressed."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks", headers={"Accept-Encoding": "gzip"})
+
+        assert rv.status_code == 200
+        assert "Content-Length" not in rv.headers
+        assert rv.headers["Content-Encoding"] == "gzip"
+
+        tracks = json.loads(gzip.decompress(rv.data).decode("utf-8"))
+        assert [track["id"] for track in tracks] == [1, 2, 3]
+
+        # sorting by a joined table's column is left to the joined query
+        rv = self.app.get("/tracks?order=album.name&direction=desc")
+        offset_rv = self.app.get(
+            "/tracks?order=album.name&direction=desc&offset=0&limit=10")
+
+        assert "Content-Length" in rv.headers
+        assert json.loads(rv.data) == json.loads(offset_rv.data)
+
+    def test_conditional_get(self):
+        """Test that unchanged library listings are not sent again."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/albums")
+        assert rv.status_code == 200
+        etag = rv.headers["ETag"]
+
+        rv = self.app.get("/albums", headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+        assert not rv.data
+
+    def test_response_cache(self):
+        """Test that library listings are served from the response cache."""
+        self.login("admin", "testpass")
+
+        # the whole listing is streamed, and cached once it has been sent
+        first = self.app.get("/albums?include=artists")
+        assert "Content-Length" not in first.headers
+        data = first.data
+
+        rv = self.app.get("/albums?include=artists&api_key=ignored")
+
+        assert rv.status_code == 200
+        assert rv.headers["Content-Length"] == str(len(data))
+        assert rv.headers["ETag"] == first.headers["ETag"]
+        assert rv.data == data
+
+        stats = json.loads(self.app.get("/stats").data)["response_cache"]
+        assert stats["entries"] == 1
+        assert stats["hits"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_search(self):
+        """Test searching by the start of names."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks/album%20tr?limit=1")
+        assert [track["id"] for track in json.loads(rv.data)] == [2]
+
+        rv = self.app.get("/albums/alb")
+        assert [album["id"] for album in json.loads(rv.data)] == [1]
+
+        rv = self.app.get("/artists/artist%202")
+        assert [artist["id"] for artist in json.loads(rv.data)] == [2]
+
+        rv = self.app.get("/artists/artist?limit=0")
+        assert rv.status_code == 400
+
+    def test_unified_search(self):
+        """Test searching artists, albums and tracks at once."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/search?q=alb&limit=1")
+        results = json.loads(rv.data)
+
+        assert results["complete"]
+        assert [album["id"] for album in results["albums"]] == [1]
+        assert len(results["tracks"]) == 1
+        assert results["artists"] == []
+
+        rv = self.app.get("/search?q=")
+        assert json.loads(rv.data) == dict(artists=[], albums=[], tracks=[],
+                                           complete=True)
+
+        rv = self.app.get("/search?q=alb&limit=-1")
+        assert rv.status_code == 400
+
+        # out of time, so what was found is returned and not cached
+        self.app.application.config["SEARCH_BUDGET"] = 0
+        rv = self.app.get("/search?q=track")
+
+        assert not json.loads(rv.data)["complete"]
+        assert rv.cache_control.no_store
+
+    def test_fuzzy_search(self):
+        """Test searching for names with typos in them."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/artists/artsit%201?fuzzy=1")
+        assert [artist["id"] for artist in json.loads(rv.data)][0] == 1
+
+        rv = self.app.get("/search?q=albmu%201&fuzzy=1")
+        results = json.loads(rv.data)
+        assert [album["id"] for album in results["albums"]] == [1]
+
+        self.app.application.config["FUZZY_INDEX"] = None
+        rv = self.app.get("/artists/artsit?fuzzy=1")
+        assert rv.status_code == 400
+
+    def test_track_playlists(self):
+        """Test the segmented streaming playlists."""
+        self.login("admin", "testpass")
+
+        rv = self.app.get("/tracks/1/master.m3u8")
+        assert rv.status_code == 200
+        assert rv.mimetype == "application/vnd.apple.mpegurl"
+        assert b"playlist.m3u8?profile=" in rv.data
+
+        rv = self.app.get("/tracks/1/playlist.m3u8?profile=nonexistent")
+        assert rv.status_code == 400
@@ -26,6 +26,23 @@ def test_tracks(database):
     assert album.tracks[1].filename == "album/2.mp3"
 
 
+def test_load_related(database):
+    albums = [Album(database, 1)]
+
+    Album.load_artists(database, albums)
+    Album.load_tracks(database, albums)
+
+    queries = []
+    database.conn.set_trace_callback(queries.append)
+    try:
+        assert [artist.name for artist in albums[0].artists] == ["Artist 2"]
+        assert [track.tracknumber for track in albums[0].tracks] == [1, 2]
+    finally:
+        database.conn.set_trace_callback(None)
+
+    assert not queries
+
+
 def test_delete(database):
     with database.conn:
         cursor = database.cursor()
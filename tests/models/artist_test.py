@@ -32,6 +32,18 @@ def test_tracks(database):
     assert artist2.tracks[1].filename == "album/2.mp3"
 
 
+def test_load_related(database):
+    artists = [Artist(database, 1), Artist(database, 2)]
+
+    Artist.load_albums(database, artists)
+    Artist.load_tracks(database, artists)
+
+    assert artists[0].albums == []
+    assert artists[1].albums[0].name == "Album 1"
+    assert [track.name for track in artists[1].tracks] == ["Album track 1",
+                                                           "Album track 2"]
+
+
 def test_delete(database):
     with database.conn:
         cursor = database.cursor()
@@ -1,4 +1,5 @@
 import mutagen
+import pytest
 
 from models.track import Track
 
@@ -16,6 +17,7 @@ def test_as_dict(database):
     track_dict = track.as_dict()
 
     assert "_db" not in track_dict.keys()
+    assert not [key for key in track_dict if key.startswith("_")]
     assert track_dict["id"] == 1
     assert track_dict["name"] == "Non album track"
     assert track_dict["filename"] == "1.mp3"
@@ -35,6 +37,113 @@ def test_artists(database):
     assert track.artists[0].name == "Artist 1"
 
 
+def test_load_related(database):
+    tracks = [Track(database, 1), Track(database, 2), Track(database, 3)]
+
+    queries = []
+    database.conn.set_trace_callback(queries.append)
+    try:
+        Track.load_albums(database, tracks)
+        Track.load_artists(database, tracks)
+
+        assert tracks[0].album is None
+        assert tracks[1].album.name == "Album 1"
+        assert tracks[1].album is tracks[2].album
+        assert tracks[0].artists
+    finally:
+        database.conn.set_trace_callback(None)
+
+    assert len(queries) == 2
+
+
+def test_page(database):
+    tracks, after = Track.page(database, order="tracknumber", limit=2)
+
+    assert [track.id for track in tracks] == [1, 2]
+    assert after == (1, 2)
+
+    tracks, after = Track.page(database, order="tracknumber", limit=2,
+                               after=after)
+
+    assert [track.id for track in tracks] == [3]
+    assert after is None
+
+    tracks, after = Track.page(database, order="track.tracknumber",
+                               direction="desc", limit=2)
+    tracks, after = Track.page(database, order="tracknumber",
+                               direction="desc", limit=2, after=after)
+
+    assert [track.id for track in tracks] == [1]
+
+    with pytest.raises(ValueError):
+        Track.page(database, order="filename; DROP TABLE track")
+
+
+def test_sort_column():
+    assert Track.sort_column("name") == "name"
+    assert Track.sort_column("track.name") == "name"
+    assert Track.sort_column("album.name") is None
+    assert Track.sort_column("codec") is None
+
+    with pytest.raises(ValueError):
+        Track.page(None, order="album.name")
+
+
+def test_iterate(database):
+    tracks = Track.iterate(database, order="tracknumber", direction="desc")
+
+    assert not isinstance(tracks, list)
+    assert [track.id for track in tracks] == [3, 2, 1]
+
+    with pytest.raises(ValueError):
+        Track.iterate(database, order="nope")
+
+
+def test_fields(database):
+    tracks, after = Track.page(database, order="tracknumber", limit=2,
+                               fields=["name"])
+
+    assert tracks == [{"name": "Non album track"},
+                      {"name": "Album track 1"}]
+    assert after == (1, 2)
+
+    tracks = Track.iterate(database, fields=["id", "tracknumber"])
+    assert [sorted(track) for track in tracks] == [["id", "tracknumber"]] * 3
+
+    assert Track.by_ids(database, [3, 1], ["id"]) == [{"id": 3}, {"id": 1}]
+
+    with pytest.raises(ValueError):
+        Track.page(database, fields=["name", "_db"])
+
+
+def test_match(database):
+    database.upgrade_tables()
+
+    tracks = Track.match(database, "alb TRA")
+    assert sorted(track.id for track in tracks) == [1, 2, 3]
+
+    tracks = Track.match(database, "album track 2")
+    assert [track.id for track in tracks] == [3]
+
+    tracks = Track.match(database, "track", limit=1)
+    assert len(tracks) == 1
+
+    assert Track.match(database, "nothing") == []
+
+    database.has_search_index = False
+    try:
+        tracks = Track.match(database, "album track 2")
+        assert [track.id for track in tracks] == [3]
+    finally:
+        database.has_search_index = True
+    assert Track.match(database, " -*\"") == []
+
+
+def test_all_offset(database):
+    assert [track.id for track in Track.all(database, limit=1,
+                                            offset=0)] == [1]
+
+
 def test_find_by_path(database):
     track1 = Track.find_by_path("album/2.mp3", database)
 
@@ -65,6 +174,10 @@ def test_store(database, test_file):
     assert test_track.name == "Silence"
     assert test_track.grouping == "Jazz"
     assert test_track.tracknumber == 3
+    assert test_track.format == "ogg"
+    assert test_track.codec == "vorbis"
+    assert test_track.bitrate == 48
+    assert test_track.duration == 3.0
 
     assert test_track.album.name == "Dummy album"
     assert test_track.album.date == "2003"
@@ -73,6 +186,29 @@ def test_store(database, test_file):
     assert test_track.artists[0].name == "Test Artist Flaf"
 
 
+def test_store_existing(database, test_file):
+    metadata = mutagen.File(test_file, easy=True)
+
+    # stored before the stream details were recorded
+    with database.conn:
+        database.execute("UPDATE track SET format = NULL, codec = NULL, "
+                         "bitrate = NULL, duration = NULL WHERE filename = ?",
+                         (test_file,))
+
+    assert Track.store(test_file, metadata, database) is True
+
+    row = database.execute("SELECT * FROM track WHERE filename = ?",
+                           (test_file,)).fetchone()
+    assert (row["format"], row["codec"], row["bitrate"],
+            row["duration"]) == ("ogg", "vorbis", 48, 3.0)
+
+    # nothing changes when they are all there
+    generation = database.generation()[0]
+    Track.store(test_file, metadata, database)
+
+    assert database.generation()[0] == generation
+
+
 def test_update(database, test_file):
     metadata = {"artist": ["New artist"], "title": ["New title"]}
 
@@ -87,10 +223,13 @@ def test_update(database, test_file):
 
 def test_save(database, test_file):
     test_track = Track.find_by_path(test_file, database)
+    generation = database.generation()[0]
 
     test_track.name = "Totally new name"
     test_track.save()
 
+    assert database.generation()[0] > generation
+
     new_track_to_test = Track.find_by_path(test_file, database)
 
     assert new_track_to_test.name == "Totally new name"
@@ -98,9 +237,12 @@ def test_save(database, test_file):
 
 def test_delete(database, test_file):
     test_track = Track.find_by_path(test_file, database)
+    generation = database.generation()[0]
 
     test_track.delete()
 
+    assert database.generation()[0] > generation
+
     should_not_exist = Track.find_by_path(test_file, database)
 
     assert should_not_exist is None
@@ -0,0 +1,63 @@
+from flask import Flask, request
+
+from transcode.adaptive import (MeteredStream, ThroughputTracker,
+                                bandwidth_hint, choose_profile)
+from transcode.profiles import TranscodeProfile
+
+
+LADDER = [TranscodeProfile("ogg-160", "", bitrate=160),
+          TranscodeProfile("opus-64", "", bitrate=64),
+          TranscodeProfile("mp3-128", "", bitrate=128),
+          TranscodeProfile(None, "custom")]
+
+
+def test_bandwidth_hint():
+    app = Flask(__name__)
+
+    with app.test_request_context("/?bandwidth=96"):
+        assert bandwidth_hint(request) == (96.0, "bandwidth parameter")
+
+    with app.test_request_context("/", headers={"Downlink": "1.5"}):
+        assert bandwidth_hint(request) == (1500.0, "Downlink header")
+
+    with app.test_request_context("/", headers={"Save-Data": "on",
+                                                "Downlink": "10"}):
+        assert bandwidth_hint(request) == (0.0, "Save-Data header")
+
+    with app.test_request_context("/", headers={"Downlink": "fast"}):
+        assert bandwidth_hint(request) == (None, None)
+
+
+def test_choose_profile():
+    assert choose_profile(LADDER, 150).name == "mp3-128"
+    assert choose_profile(LADDER, 1000).name == "ogg-160"
+    assert choose_profile(LADDER, 10).name == "opus-64"
+    assert choose_profile(LADDER, 1000, ceiling=LADDER[2]).name == "mp3-128"
+    assert choose_profile(LADDER[3:], 1000) is None
+
+
+def test_throughput_tracker():
+    tracker = ThroughputTracker(min_bytes=100, min_seconds=0.5, weight=0.5)
+
+    tracker.record(1, 50, 1.0)
+    tracker.record(1, 1000, 0.1)
+    assert tracker.get(1) is None
+
+    tracker.record(1, 125000, 1.0)
+    assert tracker.get(1) == 1000.0
+
+    tracker.record(1, 250000, 1.0)
+    assert tracker.get(1) == 1500.0
+    assert tracker.stats() == dict(users=1, measured=2)
+
+
+def test_metered_stream():
+    results = []
+    stream = MeteredStream([b"abc", b"de"],
+                           lambda sent, seconds: results.append(sent))
+
+    assert b"".join(stream) == b"abcde"
+    stream.close()
+    stream.close()
+
+    assert results == [5]
@@ -0,0 +1,116 @@
+import os
+
+from transcode.cache import TranscodeCache
+
+
+def _write_entry(cache, key, size):
+    temp_path = cache.temp_path(key)
+
+    with open(temp_path, "wb") as temp_file:
+        temp_file.write(b"\0" * size)
+
+    cache.put(key, temp_path)
+
+
+def test_key(test_file):
+    key = TranscodeCache.key(test_file, ["oggenc", "{filename}"])
+
+    assert key == TranscodeCache.key(test_file, ["oggenc", "{filename}"])
+    assert key != TranscodeCache.key(test_file, ["lame", "{filename}"])
+
+
+def test_get_and_put(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 1024)
+
+    assert cache.get("missing") is None
+    assert cache.misses == 1
+
+    _write_entry(cache, "present", 100)
+
+    assert cache.get("present") == os.path.join(str(tmpdir), "present")
+    assert cache.hits == 1
+    assert cache.size == 100
+
+
+def test_get_keeps_mtime(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 1024)
+    _write_entry(cache, "entry", 100)
+
+    path = cache.path("entry")
+    os.utime(path, (1000, 1000))
+
+    assert cache.get("entry") == path
+    assert os.stat(path).st_mtime == 1000
+    assert os.stat(path).st_atime > 1000
+
+
+def test_evict(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 250)
+
+    _write_entry(cache, "first", 100)
+    _write_entry(cache, "second", 100)
+
+    # using the first entry makes the second the least recently used
+    cache.get("first")
+
+    _write_entry(cache, "third", 100)
+
+    assert cache.get("second") is None
+    assert cache.get("first")
+    assert cache.get("third")
+    assert cache.evictions == 1
+    assert cache.size == 200
+
+
+def test_load(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 1024)
+    _write_entry(cache, "kept", 100)
+
+    with open(cache.temp_path("unfinished"), "wb") as temp_file:
+        temp_file.write(b"\0")
+
+    reloaded_cache = TranscodeCache(str(tmpdir), 1024)
+
+    assert reloaded_cache.get("kept")
+    assert reloaded_cache.stats()["entries"] == 1
+    assert os.listdir(str(tmpdir)) == ["kept"]
+
+
+def test_load_order(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 250)
+    _write_entry(cache, "first", 100)
+    _write_entry(cache, "second", 100)
+
+    os.utime(cache.path("first"), (1000, 1000))
+    os.utime(cache.path("second"), (2000, 2000))
+    cache.get("first")
+
+    # the least recently used entry is evicted first after a restart too
+    reloaded_cache = TranscodeCache(str(tmpdir), 250)
+    _write_entry(reloaded_cache, "third", 100)
+
+    assert sorted(os.listdir(str(tmpdir))) == ["first", "third"]
+
+
+def test_other_process(tmpdir):
+    cache = TranscodeCache(str(tmpdir), 250)
+    other_cache = TranscodeCache(str(tmpdir), 250)
+
+    _write_entry(other_cache, "first", 100)
+
+    # files written by another process are adopted and counted
+    assert cache.contains("first")
+    assert cache.get("first") == cache.path("first")
+    assert cache.size == 100
+
+    _write_entry(other_cache, "second", 100)
+    _write_entry(cache, "third", 100)
+
+    assert cache.get("second")
+    assert cache.size == 200
+    assert sorted(os.listdir(str(tmpdir))) == ["second", "third"]
+
+    os.remove(cache.path("second"))
+
+    assert not cache.contains("second")
+    assert cache.size == 100
@@ -0,0 +1,146 @@
+import os
+import subprocess
+import sys
+
+import gevent
+
+from transcode.flight import TranscodeFlights
+from transcode.scheduler import TranscodeScheduler
+
+
+def test_shared_transcode(test_file, tmpdir):
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    scheduler = TranscodeScheduler(1, 1, 0)
+    flights = TranscodeFlights()
+    output = str(tmpdir.join("output"))
+    returncodes = []
+
+    proc = subprocess.Popen(["cat", test_file], stdout=subprocess.PIPE)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    flight = flights.start("key", proc, slot, 512, output=output,
+                           finished=returncodes.append)
+    first_listener = flight.listen()
+    second_listener = flights.get("key").listen()
+
+    assert b"".join(first_listener) == original
+    assert b"".join(second_listener) == original
+    assert returncodes == [0]
+    assert flights.get("key") is None
+    assert flights.stats()["joined"] == 1
+    assert scheduler.stats()["running"] == 0
+
+
+def test_abandoned_transcode():
+    scheduler = TranscodeScheduler(1, 1, 0)
+    flights = TranscodeFlights()
+
+    proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    flight = flights.start("key", proc, slot, 512)
+    listeners = [flight.listen(), flight.listen()]
+
+    for listener in listeners:
+        assert next(listener)
+
+    listeners[0].close()
+    assert flights.get("key") is flight
+
+    listeners[1].close()
+    assert flights.get("key") is None
+    assert proc.poll() is not None
+    assert scheduler.stats()["reclaimed"] == 1
+
+
+def _paced_transcoder(tmpdir, data):
+    """Start a process writing data in 512 byte chunks, a chunk at a time."""
+    source = tmpdir.join("source")
+    source.write_binary(data)
+
+    return subprocess.Popen(
+        [sys.executable, "-c", "import sys, time\n"
+         "data = open(sys.argv[1], 'rb').read()\n"
+         "for start in range(0, len(data), 512):\n"
+         "    sys.stdout.buffer.write(data[start:start + 512])\n"
+         "    sys.stdout.flush()\n"
+         "    time.sleep(0.01)\n", str(source)], stdout=subprocess.PIPE)
+
+
+def test_late_listener(tmpdir):
+    original = os.urandom(512 * 20)
+
+    scheduler = TranscodeScheduler(1, 1, 0)
+    flights = TranscodeFlights()
+    output = str(tmpdir.join("output"))
+
+    proc = _paced_transcoder(tmpdir, original)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    # only the last two chunks are kept in memory
+    flight = flights.start("key", proc, slot, 512, output=output, window=2)
+    first_listener = flight.listen()
+    first_chunks = [next(first_listener) for dummy in range(5)]
+
+    # joins after the first chunks have been dropped, and reads them from
+    # the output file
+    second_listener = flights.get("key").listen()
+
+    # the transcode runs ahead while both listeners are away, so the first
+    # one falls behind and continues from the file
+    gevent.sleep(1)
+    assert flight.done
+
+    assert b"".join(second_listener) == original
+    assert b"".join(first_chunks + list(first_listener)) == original
+
+
+def test_held_back_transcode(tmpdir):
+    original = os.urandom(512 * 20)
+    source = tmpdir.join("source")
+    source.write_binary(original)
+
+    scheduler = TranscodeScheduler(1, 1, 0)
+    flights = TranscodeFlights()
+
+    proc = subprocess.Popen(["cat", str(source)], stdout=subprocess.PIPE)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    # without an output file, the transcoder waits for the slowest listener
+    flight = flights.start("key", proc, slot, 512, window=2)
+    listener = flight.listen()
+    first_chunk = next(listener)
+    gevent.sleep(0.1)
+
+    assert not flight.done
+    assert flight.count <= 4
+
+    # a late listener could not be sent the first chunks
+    assert flights.get("key") is None
+
+    assert first_chunk + b"".join(listener) == original
+    assert scheduler.stats()["running"] == 0
+
+
+def test_closed_unread(tmpdir):
+    scheduler = TranscodeScheduler(1, 1, 0)
+    flights = TranscodeFlights()
+    output = str(tmpdir.join("output"))
+
+    proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    # e.g. a HEAD request, closed before the reader has started
+    flights.start("key", proc, slot, 512, output=output).listen().close()
+
+    assert proc.poll() is not None
+    assert not os.path.exists(output)
+    assert flights.get("key") is None
+    assert scheduler.stats()["running"] == 0
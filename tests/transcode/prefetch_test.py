@@ -0,0 +1,52 @@
+import os
+
+from db.db_manager import DbManager
+from models.track import Track
+from transcode.cache import TranscodeCache
+from transcode.prefetch import Prefetcher
+from transcode.profiles import TranscodeProfile
+from transcode.scheduler import TranscodeScheduler
+
+
+def _album_library(tmpdir, test_file):
+    # a path that does not exist yet gives an empty in-memory library
+    library = DbManager(str(tmpdir.join("library.db")))
+
+    with library.conn:
+        library.execute("INSERT INTO album (id, name) VALUES (1, 'Album')")
+
+        for tracknumber in range(1, 5):
+            library.execute("INSERT INTO track (id, tracknumber, filename) "
+                            "VALUES (?, ?, ?)",
+                            (tracknumber, tracknumber, test_file))
+            library.execute("INSERT INTO album_track (album_id, track_id) "
+                            "VALUES (1, ?)", (tracknumber,))
+
+    return library
+
+
+def test_next_tracks(tmpdir, test_file):
+    library = _album_library(tmpdir, test_file)
+    prefetcher = Prefetcher(None, None, 2)
+
+    next_tracks = prefetcher.next_tracks(Track(library, 2))
+
+    assert [next_track.id for next_track in next_tracks] == [3, 4]
+    assert prefetcher.next_tracks(Track(library, 4)) == []
+
+
+def test_prefetch(tmpdir, test_file):
+    library = _album_library(tmpdir, test_file)
+    cache = TranscodeCache(str(tmpdir.join("cache")), 1024 * 1024)
+    scheduler = TranscodeScheduler(1, 1, 0)
+    profile = TranscodeProfile("copy", "cat {filename}")
+
+    prefetcher = Prefetcher(cache, scheduler, 1, pipe_output="-")
+    prefetcher.prefetch(Track(library, 1), profile).join()
+
+    key = TranscodeCache.key(test_file, profile.identity())
+
+    assert cache.contains(key)
+    assert os.path.getsize(cache.path(key)) == os.path.getsize(test_file)
+    assert prefetcher.stats()["transcoded"] == 1
+    assert scheduler.stats()["running"] == 0
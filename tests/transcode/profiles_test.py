@@ -0,0 +1,93 @@
+from six.moves import configparser
+
+from models.track import Track
+from transcode.profiles import TranscodeProfile
+
+
+def test_from_config(tmpdir):
+    config_file = tmpdir.join("mach2.ini")
+    config_file.write("""
+[DEFAULT]
+debug = True
+
+[transcode]
+mode = pipe
+
+[profile:ogg-96]
+codec = vorbis
+bitrate = 96
+container = ogg
+mimetype = audio/ogg
+command = oggenc -b {bitrate} -o {output} {filename}
+""")
+    config = configparser.ConfigParser()
+    config.read(str(config_file))
+
+    profiles = TranscodeProfile.from_config(config)
+
+    assert list(profiles.keys()) == ["ogg-96"]
+    assert profiles["ogg-96"].bitrate == 96
+    assert profiles["ogg-96"].mimetype == "audio/ogg"
+
+
+def test_command_items():
+    profile = TranscodeProfile("ogg-96",
+                               "oggenc -b {bitrate} -o {output} {filename}",
+                               bitrate=96)
+
+    assert profile.command_items("in.flac", "-") == ["oggenc", "-b", "96",
+                                                     "-o", "-", "in.flac"]
+    assert not profile.seekable
+
+
+def test_seek():
+    profile = TranscodeProfile("ogg-96",
+                               "ffmpeg -ss {start} -i {filename} {output}",
+                               bitrate=96)
+
+    assert profile.seekable
+    assert profile.command_items("in.flac", "-", start=90) == [
+        "ffmpeg", "-ss", "90.000", "-i", "in.flac", "-"]
+
+
+def test_segment():
+    profile = TranscodeProfile(
+        "ogg-96", "ffmpeg -ss {start} -i {filename} {output}", bitrate=96,
+        segment_command="ffmpeg -ss {start} -t {length} -i {filename} "
+        "{output}")
+
+    assert profile.segmentable
+    assert not TranscodeProfile("ogg-96", "oggenc").segmentable
+    assert profile.command_items("in.flac", "-", start=10, length=5) == [
+        "ffmpeg", "-ss", "10.000", "-t", "5.000", "-i", "in.flac", "-"]
+    assert profile.identity(10) != profile.identity(10, 5)
+
+
+def test_identity():
+    profile = TranscodeProfile("ogg-96", "oggenc -b {bitrate}", bitrate=96)
+    changed_profile = TranscodeProfile("ogg-96", "oggenc -b {bitrate}",
+                                       bitrate=128)
+
+    assert profile.identity() != changed_profile.identity()
+    assert profile.identity() == profile.identity(0.0)
+    assert profile.identity() != profile.identity(30)
+
+
+def test_from_command():
+    profile = TranscodeProfile.from_command("lame {filename} {output}")
+
+    assert profile.name is None
+    assert profile.mimetype == "application/octet-stream"
+
+
+def test_satisfied_by(database):
+    profile = TranscodeProfile("ogg-96", "oggenc -b {bitrate}",
+                               codec="vorbis", bitrate=96, container="ogg")
+
+    assert profile.satisfied_by(Track(database, format="ogg", codec="vorbis",
+                                      bitrate=64))
+    assert not profile.satisfied_by(Track(database, format="ogg",
+                                          codec="vorbis", bitrate=320))
+    assert not profile.satisfied_by(Track(database, format="flac",
+                                          codec="flac", bitrate=900))
+    assert not profile.satisfied_by(Track(database, filename="1.mp3"))
@@ -0,0 +1,71 @@
+import subprocess
+
+import pytest
+
+from transcode.scheduler import SchedulerBusy, TranscodeScheduler
+
+
+def test_acquire_and_release():
+    scheduler = TranscodeScheduler(2, 1, 0)
+
+    slot = scheduler.acquire(1)
+    assert scheduler.stats()["running"] == 1
+
+    slot.release()
+    slot.release()
+    assert scheduler.stats()["running"] == 0
+
+
+def test_user_limit():
+    scheduler = TranscodeScheduler(2, 1, 0.01)
+
+    scheduler.acquire(1)
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(1)
+
+    assert scheduler.acquire(2)
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_global_limit():
+    scheduler = TranscodeScheduler(1, 1, 0.01)
+
+    slot = scheduler.acquire(1)
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(2)
+
+    slot.release()
+
+    # the rejected user must not be left holding their own slot
+    assert scheduler.acquire(2)
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_hold():
+    scheduler = TranscodeScheduler(1, 1, 0)
+
+    slot = scheduler.acquire(1)
+    stream = slot.hold(iter([b"a", b"b"]))
+
+    assert next(stream) == b"a"
+    assert scheduler.stats()["running"] == 1
+
+    stream.close()
+    assert scheduler.stats()["running"] == 0
+
+
+def test_release_reclaims_transcoder():
+    scheduler = TranscodeScheduler(1, 1, 0)
+
+    proc = subprocess.Popen(["sleep", "30"])
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+
+    # closing the response before it was read stops the transcoder
+    slot.hold(iter([])).close()
+
+    assert proc.poll() is not None
+    assert scheduler.stats()["reclaimed"] == 1
+    assert scheduler.stats()["running"] == 0
@@ -0,0 +1,45 @@
+import pytest
+
+from transcode.profiles import TranscodeProfile
+from transcode.segments import (master_playlist, media_playlist,
+                                segment_bounds, segment_count)
+
+
+def test_segment_count():
+    assert segment_count(25.0, 10) == 3
+    assert segment_count(20.0, 10) == 2
+    assert segment_count(None, 10) == 0
+
+
+def test_segment_bounds():
+    assert segment_bounds(25.0, 10, 0) == (0.0, 10.0)
+    assert segment_bounds(25.0, 10, 2) == (20.0, 5.0)
+
+    with pytest.raises(IndexError):
+        segment_bounds(25.0, 10, 3)
+
+    with pytest.raises(IndexError):
+        segment_bounds(25.0, 10, -1)
+
+
+def test_media_playlist():
+    playlist = media_playlist(25.0, 10, lambda index: "segments/%d" % index)
+    lines = playlist.splitlines()
+
+    assert lines[0] == "#EXTM3U"
+    assert "#EXT-X-TARGETDURATION:10" in lines
+    assert lines[-1] == "#EXT-X-ENDLIST"
+    assert lines[-3:-1] == ["#EXTINF:5.000,", "segments/2"]
+    assert len([line for line in lines if line.startswith("#EXTINF")]) == 3
+
+
+def test_master_playlist():
+    low = TranscodeProfile("low", "low", bitrate=64)
+    high = TranscodeProfile("high", "high", bitrate=160)
+
+    lines = master_playlist([(low, "low.m3u8"),
+                             (high, "high.m3u8")]).splitlines()
+
+    assert lines == ["#EXTM3U",
+                     "#EXT-X-STREAM-INF:BANDWIDTH=64000", "low.m3u8",
+                     "#EXT-X-STREAM-INF:BANDWIDTH=160000", "high.m3u8"]
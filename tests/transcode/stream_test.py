@@ -0,0 +1,145 @@
+import os
+import subprocess
+
+import pytest
+
+from transcode.cache import TranscodeCache
+from transcode.profiles import TranscodeProfile
+from transcode.scheduler import TranscodeScheduler
+from transcode.stream import (stop_process, stream_file, stream_pipe,
+                              stream_transcode)
+
+
+def test_stream_pipe(test_file, tmpdir):
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    output = str(tmpdir.join("output"))
+    returncodes = []
+
+    proc = subprocess.Popen(["cat", test_file], stdout=subprocess.PIPE)
+    streamed = b"".join(stream_pipe(proc, 512, output=output,
+                                    finished=returncodes.append))
+
+    assert streamed == original
+    assert returncodes == [0]
+
+    with open(output, "rb") as output_file:
+        assert output_file.read() == original
+
+
+def test_stream_file(test_file, tmpdir):
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    output = str(tmpdir.join("output"))
+    open(output, "ab").close()
+    returncodes = []
+
+    proc = subprocess.Popen(["cp", test_file, output])
+    streamed = b"".join(stream_file(output, proc, 512,
+                                    finished=returncodes.append))
+
+    assert streamed == original
+    assert returncodes == [0]
+
+
+def test_stream_pipe_closed(tmpdir):
+    output = str(tmpdir.join("output"))
+
+    proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+    stream = stream_pipe(proc, 512, output=output)
+
+    assert next(stream)
+    stream.close()
+
+    assert not os.path.exists(output)
+
+    stop_process(proc)
+    assert proc.poll() is not None
+
+
+def test_stream_closed_unread(tmpdir):
+    output = str(tmpdir.join("output"))
+    open(output, "ab").close()
+    scheduler = TranscodeScheduler(1, 1, 1)
+
+    # e.g. a HEAD request, closed before the body is read
+    proc = subprocess.Popen(["sleep", "30"])
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+    slot.hold(stream_file(output, proc)).close()
+
+    assert not os.path.exists(output)
+    assert proc.poll() is not None
+
+    proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+    slot = scheduler.acquire(1)
+    slot.attach(proc)
+    slot.hold(stream_pipe(proc, output=output)).close()
+
+    assert proc.stdout.closed
+    assert proc.poll() is not None
+    assert scheduler.stats()["running"] == 0
+
+
+def test_stop_process():
+    proc = subprocess.Popen(["sleep", "30"])
+
+    assert stop_process(proc)
+    assert not stop_process(proc)
+
+
+def test_stream_transcode(test_file, tmpdir):
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    profile = TranscodeProfile("copy", "cat {filename}")
+    scheduler = TranscodeScheduler(1, 1, 1)
+    cache = TranscodeCache(str(tmpdir.join("cache")), 1024 * 1024)
+
+    slot = scheduler.acquire(1)
+    streamed = b"".join(stream_transcode(profile, test_file, slot,
+                                         cache=cache, chunk_size=512))
+    slot.release()
+
+    assert streamed == original
+    assert scheduler.stats()["running"] == 0
+    assert cache.stats()["entries"] == 1
+
+    # a cached track needs no slot
+    streamed = b"".join(stream_transcode(profile, test_file, None,
+                                         cache=cache))
+
+    assert streamed == original
+    assert cache.stats()["hits"] == 1
+
+
+def test_stream_transcode_file(test_file):
+    with open(test_file, "rb") as original_file:
+        original = original_file.read()
+
+    profile = TranscodeProfile("copy", "cp {filename} {output}")
+    slot = TranscodeScheduler(1, 1, 1).acquire(1)
+
+    streamed = b"".join(stream_transcode(profile, test_file, slot,
+                                         pipe_output=None))
+    slot.release()
+
+    assert streamed == original
+
+
+def test_stream_transcode_fails(test_file, tmpdir):
+    profile = TranscodeProfile("missing", "nonexistent-transcoder {filename}")
+    cache = TranscodeCache(str(tmpdir.join("cache")), 1024 * 1024)
+    slot = TranscodeScheduler(1, 1, 1).acquire(1)
+
+    # the transcoder is started before anything is streamed
+    with pytest.raises(OSError):
+        stream_transcode(profile, test_file, slot, cache=cache)
+
+    with pytest.raises(ValueError):
+        stream_transcode(profile, test_file, None, cache=cache)
+
+    slot.release()
+    assert not os.listdir(str(tmpdir.join("cache")))
@@ -0,0 +1,197 @@
+"""
+adaptive picks a transcode profile to fit the bandwidth a client has, from
+the hints the client sends or from how fast earlier responses were sent.
+"""
+import logging
+import time
+
+import gevent.lock
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def bandwidth_hint(req):
+    """Read the bandwidth a client says it has.
+
+    The "bandwidth" query parameter is in kbit/s. The Downlink client hint
+    header is in Mbit/s. A Save-Data header asks for the smallest output.
+
+    Args:
+        req (flask.Request): The request object.
+
+    Returns:
+        Tuple[float, str]: The bandwidth in kbit/s and where it came from,
+            or (None, None) if the client gave no hint.
+
+    """
+    bandwidth = req.args.get("bandwidth", type=float)
+    if bandwidth is not None and bandwidth > 0:
+        return bandwidth, "bandwidth parameter"
+
+    if req.headers.get("Save-Data", "").lower() == "on":
+        return 0.0, "Save-Data header"
+
+    try:
+        downlink = float(req.headers.get("Downlink", ""))
+    except ValueError:
+        downlink = None
+
+    if downlink is not None and downlink > 0:
+        return downlink * 1000, "Downlink header"
+
+    return None, None
+
+
+def choose_profile(profiles, bandwidth, ceiling=None):
+    """Pick the profile with the highest bitrate that fits the bandwidth.
+
+    Args:
+        profiles (Iterable[TranscodeProfile]): The profiles to choose from.
+            Profiles without a bitrate are ignored.
+        bandwidth (float): The bandwidth available in kbit/s.
+        ceiling (TranscodeProfile): A profile whose bitrate should not be
+            exceeded, e.g. the one the user picked.
+
+    Returns:
+        TranscodeProfile: The chosen profile, the lowest one if none fit, or
+            None if no profile has a bitrate.
+
+    """
+    ladder = sorted((profile for profile in profiles if profile.bitrate),
+                    key=lambda profile: profile.bitrate)
+
+    if ceiling and ceiling.bitrate:
+        ladder = ([profile for profile in ladder
+                   if profile.bitrate <= ceiling.bitrate] or ladder[:1])
+
+    if not ladder:
+        return None
+
+    fitting = [profile for profile in ladder if profile.bitrate <= bandwidth]
+
+    if fitting:
+        return fitting[-1]
+
+    return ladder[0]
+
+
+class ThroughputTracker(object):
+    """Remember how fast responses were sent to each user."""
+
+    def __init__(self, min_bytes=262144, min_seconds=0.5, weight=0.5):
+        """Create a throughput tracker.
+
+        Args:
+            min_bytes (int): Responses smaller than this are not measured.
+            min_seconds (float): Responses sent faster than this are not
+                measured, as the client's buffers hide the link's speed.
+            weight (float): The weight of a new measurement in the moving
+                average.
+
+        """
+        self.min_bytes = min_bytes
+        self.min_seconds = min_seconds
+        self.weight = weight
+        self.measured = 0
+        self.__throughput = {}
+        self.__lock = gevent.lock.RLock()
+
+    def record(self, user_id, sent_bytes, seconds):
+        """Record a finished response.
+
+        Args:
+            user_id: The id of the user the response was sent to.
+            sent_bytes (int): The number of bytes sent.
+            seconds (float): How long sending them took.
+
+        """
+        if sent_bytes < self.min_bytes or seconds < self.min_seconds:
+            return
+
+        kbps = sent_bytes * 8 / 1000.0 / seconds
+
+        with self.__lock:
+            previous = self.__throughput.get(user_id)
+            if previous is not None:
+                kbps = self.weight * kbps + (1 - self.weight) * previous
+
+            self.__throughput[user_id] = kbps
+            self.measured += 1
+
+    def get(self, user_id):
+        """Return a user's average throughput in kbit/s, or None."""
+        with self.__lock:
+            return self.__throughput.get(user_id)
+
+    def meter(self, stream, user_id):
+        """Wrap a response body to measure how fast it is sent.
+
+        Args:
+            stream (Iterable[bytes]): The response body.
+            user_id: The id of the user the response is sent to.
+
+        Returns:
+            MeteredStream: The wrapped response body.
+
+        """
+        return MeteredStream(stream, lambda sent_bytes, seconds: self.record(
+            user_id, sent_bytes, seconds))
+
+    def stats(self):
+        """Return the tracker's statistics as a dict."""
+        with self.__lock:
+            return dict(users=len(self.__throughput), measured=self.measured)
+
+
+class MeteredStream(object):
+    """A response body that reports how fast it was sent when closed."""
+
+    def __init__(self, stream, finished):
+        """Wrap a response body.
+
+        Args:
+            stream (Iterable[bytes]): The response body.
+            finished (Callable[[int, float], None]): Called with the bytes
+                sent and the seconds taken when the body is closed.
+
+        """
+        self.__stream = stream
+        self.__iterator = iter(stream)
+        self.__finished = finished
+        self.__started = None
+        self.__sent = 0
+        self.__closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.__started is None:
+            self.__started = time.time()
+
+        chunk = next(self.__iterator)
+        self.__sent += len(chunk)
+
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        """Close the wrapped body and report the throughput."""
+        if self.__closed:
+            return
+
+        self.__closed = True
+
+        if hasattr(self.__stream, "close"):
+            self.__stream.close()
+
+        if self.__started is not None:
+            self.__finished(self.__sent, time.time() - self.__started)
+
+
+def log_choice(user_id, profile, reason):
+    """Log the profile chosen for a user and why."""
+    _LOGGER.info("Chose profile %s for user %s: %s",
+                 profile.name if profile else "original", user_id, reason)
@@ -0,0 +1,208 @@
+"""
+cache exposes a TranscodeCache class to store transcoded tracks on disk so
+they can be served again without running the transcoder.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TranscodeCache(object):
+    """A content-addressed, size-bounded cache of transcoded files.
+
+    Entries are keyed on the identity of the source file (path, size and
+    modification time) and the transcode command used to produce them, and
+    are evicted least recently used first once the cache grows past its
+    byte budget.
+
+    """
+
+    suffix = ".part"
+
+    def __init__(self, directory, max_size):
+        """Create the transcode cache.
+
+        Args:
+            directory (str): The directory to store transcoded files in.
+            max_size (int): The maximum size of the cache in bytes.
+
+        """
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__entries = OrderedDict()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.__load()
+
+    def __load(self):
+        """Index the files already in the cache directory, least recently
+        used first."""
+        entries = []
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+
+            if name.endswith(self.suffix):
+                # left behind by a transcode that never finished
+                os.remove(path)
+                continue
+
+            file_info = os.stat(path)
+            entries.append((file_info.st_atime, name, file_info.st_size))
+
+        for dummy, name, size in sorted(entries):
+            self.__entries[name] = size
+            self.size += size
+
+        self.evict()
+
+    @staticmethod
+    def key(filename, command):
+        """Create the cache key for a source file and transcode command.
+
+        Args:
+            filename (str): The path of the source file.
+            command (List[str]): The transcode command, before the filename
+                and output have been substituted.
+
+        Returns:
+            str: The cache key.
+
+        """
+        file_info = os.stat(filename)
+        identity = json.dumps([filename, file_info.st_size,
+                               file_info.st_mtime, list(command)])
+
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        """Return the path of a cache entry."""
+        return os.path.join(self.directory, key)
+
+    def __check(self, key):
+        """Bring an entry in line with the cache directory, which other
+        processes, like library.py transcode, write to and evict from too.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            bool: Whether the entry is cached.
+
+        """
+        try:
+            file_info = os.stat(self.path(key))
+        except OSError:
+            if key in self.__entries:
+                self.size -= self.__entries.pop(key)
+
+            return False
+
+        if key not in self.__entries:
+            # written by another process since the cache was loaded
+            self.__entries[key] = file_info.st_size
+            self.size += file_info.st_size
+            self.evict()
+
+        return key in self.__entries
+
+    def get(self, key):
+        """Look up a cache entry.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The path of the cached file, or None if it is not cached.
+
+        """
+        path = self.path(key)
+
+        if self.__check(key):
+            # mark the entry as the most recently used, by its access time,
+            # since the entity tag it is served with comes from its
+            # modification time
+            self.__entries[key] = self.__entries.pop(key)
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            self.hits += 1
+
+            return path
+
+        self.misses += 1
+
+        return None
+
+    def contains(self, key):
+        """Check for a cache entry without counting it as a hit or miss.
+
+        Args:
+            key (str): The cache key.
+
+        """
+        return self.__check(key)
+
+    def temp_path(self, key):
+        """Return a unique path to write a new cache entry to.
+
+        Args:
+            key (str): The cache key.
+
+        """
+        return os.path.join(self.directory, "".join(
+            (key, ".", uuid.uuid4().hex, self.suffix)))
+
+    def put(self, key, temp_path):
+        """Move a completely written file into the cache.
+
+        Args:
+            key (str): The cache key.
+            temp_path (str): The path returned by temp_path().
+
+        """
+        size = os.path.getsize(temp_path)
+
+        if size > self.max_size:
+            os.remove(temp_path)
+            return
+
+        os.rename(temp_path, self.path(key))
+
+        if key in self.__entries:
+            self.size -= self.__entries.pop(key)
+
+        self.__entries[key] = size
+        self.size += size
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until under budget."""
+        while self.size > self.max_size and self.__entries:
+            key, size = self.__entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+            try:
+                os.remove(self.path(key))
+            except OSError as exc:
+                _LOGGER.error(exc)
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        return dict(entries=len(self.__entries), size=self.size,
+                    max_size=self.max_size, hits=self.hits,
+                    misses=self.misses, evictions=self.evictions)
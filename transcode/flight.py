@@ -0,0 +1,305 @@
+"""
+flight exposes a TranscodeFlights registry so that concurrent requests for
+the same transcode share a single transcoder process.
+"""
+from collections import deque
+
+import gevent
+from gevent.event import Event
+
+from transcode.stream import stream_pipe
+
+
+class Flight(object):
+    """A transcode in progress whose output is shared by its listeners.
+
+    The transcoder's output is read by a separate greenlet, and its latest
+    chunks are kept in memory for the listeners keeping up with it. When the
+    output is also written to a file, listeners joining late or falling
+    behind read it from the file until they catch up, so a slow listener
+    does not hold up the others. Otherwise the transcoder is held back until
+    the slowest listener has read the oldest chunk, and only listeners that
+    have missed none of the output can join. Either way memory use does not
+    grow with the length of the track. If every listener leaves before the
+    transcode ends, the transcoder is stopped.
+
+    """
+
+    def __init__(self, registry, key, proc, slot, chunk_size=8192,
+                 output=None, finished=None, window=64):
+        """Start reading a transcoder's output.
+
+        Args:
+            registry (TranscodeFlights): The registry the flight belongs to.
+            key (str): The key of the transcode, as used by the cache.
+            proc (subprocess.Popen): The transcoder, started with
+                stdout=subprocess.PIPE.
+            slot (TranscodeSlot): The scheduler slot held by the transcoder.
+            chunk_size (int): The size of the chunks to read.
+            output (str): If set, a path to also write the transcoded data
+                to.
+            finished (Callable[[int], None]): Called with the transcoder's
+                return code once all its output has been read.
+            window (int): How many of the latest chunks to keep in memory.
+
+        """
+        self.key = key
+        self.output = output
+        self.chunk_size = chunk_size
+        self.listeners = 0
+        self.done = False
+        self.aborted = False
+        # the number of chunks and bytes read so far
+        self.count = 0
+        self.size = 0
+
+        if output:
+            # listeners open it before the transcoder has written to it
+            open(output, "ab").close()
+
+        self.__registry = registry
+        self.__slot = slot
+        self.__window = window
+        self.__chunks = deque()
+        self.__listening = set()
+        self.__new_data = Event()
+        self.__progress = Event()
+        self.__stream = stream_pipe(proc, chunk_size, output=output,
+                                    finished=finished)
+        self.__greenlet = gevent.spawn(self.__run)
+
+    @property
+    def joinable(self):
+        """Whether a new listener can still be sent the whole output."""
+        return bool(self.output) or self.count == len(self.__chunks)
+
+    def __run(self):
+        try:
+            for chunk in self.__stream:
+                self.__chunks.append(chunk)
+                self.count += 1
+                self.size += len(chunk)
+                self.__notify()
+
+                if len(self.__chunks) > self.__window:
+                    if not self.output:
+                        self.__wait_for_listeners()
+
+                    self.__chunks.popleft()
+        finally:
+            self.__finish()
+
+    def __wait_for_listeners(self):
+        first = self.count - len(self.__chunks)
+
+        while any(listener.index == first for listener in self.__listening):
+            self.__progress.clear()
+            self.__progress.wait()
+
+    def __finish(self):
+        if self.done:
+            return
+
+        self.done = True
+        try:
+            self.__stream.close()
+        finally:
+            self.__notify()
+            self.__registry.remove(self)
+            self.__slot.release(abandoned=self.aborted)
+
+    def __notify(self):
+        # swap in a new event first, so listeners that wake up wait on it
+        new_data = self.__new_data
+        self.__new_data = Event()
+        new_data.set()
+
+    def chunk(self, index):
+        """Wait for a chunk of the transcoder's output.
+
+        Args:
+            index (int): The position of the chunk.
+
+        Returns:
+            bytes: The chunk, or None if the output ended before it.
+
+        Raises:
+            IndexError: If the chunk is no longer kept in memory.
+
+        """
+        while True:
+            first = self.count - len(self.__chunks)
+
+            if index < first:
+                raise IndexError(index)
+
+            if index < self.count:
+                return self.__chunks[index - first]
+
+            if self.done:
+                return None
+
+            self.__new_data.wait()
+
+    def listen(self):
+        """Add a listener to the flight.
+
+        Returns:
+            FlightListener: The response stream for the new listener.
+
+        """
+        listener = FlightListener(self)
+
+        self.listeners += 1
+        self.__listening.add(listener)
+
+        return listener
+
+    def advance(self):
+        """Tell the flight a listener has read a chunk from memory."""
+        self.__progress.set()
+
+    def leave(self, listener):
+        """Remove a listener, stopping the transcode if it was the last.
+
+        Args:
+            listener (FlightListener): The listener.
+
+        """
+        self.listeners -= 1
+        self.__listening.discard(listener)
+        self.__progress.set()
+
+        if self.listeners == 0 and not self.done:
+            self.aborted = True
+            self.__registry.remove(self)
+            self.__greenlet.kill()
+
+            # a greenlet killed before it started does not run __run at all
+            self.__finish()
+
+
+class FlightListener(object):
+    """A response stream reading a flight's output from the beginning.
+
+    It reads the chunks kept in memory while it keeps up with the
+    transcoder, and the flight's output file otherwise.
+
+    """
+
+    def __init__(self, flight):
+        self.__flight = flight
+        self.__file = None
+        if flight.output:
+            self.__file = open(flight.output, "rb")
+
+        # the next chunk to read from memory, or None to read the file
+        self.index = 0
+        self.__position = 0
+        self.__closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        flight = self.__flight
+
+        if self.index is None and self.__position == flight.size:
+            # caught up, so the next chunk is the next one read
+            self.index = flight.count
+
+        if self.index is not None:
+            try:
+                chunk = flight.chunk(self.index)
+                self.index += 1
+                flight.advance()
+            except IndexError:
+                # the file was last read up to where the listener caught up
+                self.index = None
+                self.__file.seek(self.__position)
+
+        if self.index is None:
+            chunk = self.__file.read(min(flight.chunk_size,
+                                         flight.size - self.__position))
+
+        if chunk is None:
+            self.close()
+            raise StopIteration()
+
+        self.__position += len(chunk)
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        """Stop listening. Safe to call repeatedly."""
+        if not self.__closed:
+            self.__closed = True
+
+            if self.__file:
+                self.__file.close()
+
+            self.__flight.leave(self)
+
+
+class TranscodeFlights(object):
+    """Keeps track of the transcodes in progress, by key."""
+
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+
+        self.__flights = {}
+
+    def get(self, key):
+        """Find a transcode in progress.
+
+        Args:
+            key (str): The key of the transcode.
+
+        Returns:
+            Flight: The flight, or None if no transcode is in progress.
+
+        """
+        flight = self.__flights.get(key)
+
+        if (flight and not flight.done and not flight.aborted and
+                flight.joinable):
+            self.joined += 1
+            return flight
+
+        return None
+
+    def start(self, key, proc, slot, chunk_size=8192, output=None,
+              finished=None, window=64):
+        """Register a new transcode. The arguments are those of Flight.
+
+        Returns:
+            Flight: The new flight.
+
+        """
+        flight = Flight(self, key, proc, slot, chunk_size=chunk_size,
+                        output=output, finished=finished, window=window)
+        self.__flights[key] = flight
+        self.started += 1
+
+        return flight
+
+    def remove(self, flight):
+        """Remove a flight, if it is still registered.
+
+        Args:
+            flight (Flight): The flight.
+
+        """
+        if self.__flights.get(flight.key) is flight:
+            del self.__flights[flight.key]
+
+    def stats(self):
+        """Return the registry counters as a dict."""
+        listeners = 0
+        for flight in self.__flights.values():
+            listeners += flight.listeners
+
+        return dict(active=len(self.__flights), listeners=listeners,
+                    started=self.started, joined=self.joined)
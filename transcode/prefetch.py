@@ -0,0 +1,152 @@
+"""
+prefetch exposes a Prefetcher class to transcode the tracks following the one
+being played into the transcode cache ahead of time.
+"""
+import logging
+import os
+
+import gevent
+
+from transcode.cache import TranscodeCache
+from transcode.scheduler import SchedulerBusy
+from transcode.stream import remove_output, start_transcode, wait_process
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def readahead(filename):
+    """Hint to the kernel that a file is about to be read.
+
+    Args:
+        filename (str): The path of the file.
+
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+class Prefetcher(object):
+    """Transcodes the next tracks of an album while a track is playing.
+
+    Prefetch transcoders run at a lower CPU priority, and only take a
+    scheduler slot when one is free straight away, so they never hold up
+    the tracks users are waiting for.
+
+    """
+
+    # the scheduler user all prefetches share, so that the per-user limit
+    # caps how many run at once
+    scheduler_user = "prefetch"
+
+    def __init__(self, cache, scheduler, count, niceness=10, pipe_output=None):
+        """Create the prefetcher.
+
+        Args:
+            cache (TranscodeCache): The cache to transcode into.
+            scheduler (TranscodeScheduler): The transcoder scheduler.
+            count (int): How many of the following tracks to transcode.
+            niceness (int): How much to lower the transcoders' priority by.
+            pipe_output (str): If set, transcoders write to stdout and
+                {output} is replaced by this placeholder.
+
+        """
+        self.cache = cache
+        self.scheduler = scheduler
+        self.count = count
+        self.niceness = niceness
+        self.pipe_output = pipe_output
+        self.transcoded = 0
+
+        self.__pending = set()
+
+    def next_tracks(self, track):
+        """Find the tracks that follow a track on its album.
+
+        Args:
+            track (Track): The track being played.
+
+        Returns:
+            List[Track]: Up to count tracks, in album order.
+
+        """
+        album = track.album
+        if not album:
+            return []
+
+        album_tracks = album.tracks
+        for (index, album_track) in enumerate(album_tracks):
+            if album_track.id == track.id:
+                return album_tracks[index + 1:index + 1 + self.count]
+
+        return []
+
+    def prefetch(self, track, profile):
+        """Start transcoding the tracks after a track in the background.
+
+        Args:
+            track (Track): The track being played.
+            profile (TranscodeProfile): The profile it is played with.
+
+        """
+        return gevent.spawn(self.__prefetch, track, profile)
+
+    def __prefetch(self, track, profile):
+        for next_track in self.next_tracks(track):
+            readahead(next_track.filename)
+
+            try:
+                key = TranscodeCache.key(next_track.filename,
+                                         profile.identity())
+            except OSError:
+                continue
+
+            if key in self.__pending or self.cache.contains(key):
+                continue
+
+            try:
+                slot = self.scheduler.acquire(self.scheduler_user, timeout=0)
+            except SchedulerBusy:
+                break
+
+            self.__pending.add(key)
+            try:
+                self.__transcode(next_track, profile, key, slot)
+            finally:
+                self.__pending.discard(key)
+                slot.release()
+
+    def __transcode(self, track, profile, key, slot):
+        temp_filename = self.cache.temp_path(key)
+
+        try:
+            proc = start_transcode(profile, track.filename, temp_filename,
+                                   pipe_output=self.pipe_output,
+                                   niceness=self.niceness)
+        except OSError as exc:
+            _LOGGER.error(exc)
+            remove_output(temp_filename)
+            return
+
+        slot.attach(proc)
+
+        if wait_process(proc) == 0:
+            self.cache.put(key, temp_filename)
+            self.transcoded += 1
+        else:
+            _LOGGER.error("Prefetching %s failed", track.filename)
+            remove_output(temp_filename)
+
+    def stats(self):
+        """Return the prefetcher counters as a dict."""
+        return dict(pending=len(self.__pending), transcoded=self.transcoded)
@@ -0,0 +1,195 @@
+"""
+profiles exposes a TranscodeProfile class describing an output format the
+server can transcode tracks to.
+"""
+from collections import OrderedDict
+
+
+class TranscodeProfile(object):
+    """A named transcode output format and the command that produces it."""
+
+    section_prefix = "profile:"
+
+    def __init__(self, name, command, codec=None, bitrate=None,
+                 container=None, mimetype="application/octet-stream",
+                 segment_command=None):
+        """Create a transcode profile.
+
+        Args:
+            name (str): The name of the profile, or None for a user's own
+                transcode command.
+            command (str): The command template. {filename}, {output},
+                {bitrate} and {start} are substituted when the command is
+                run.
+            codec (str): The audio codec of the output, e.g. "vorbis".
+            bitrate (int): The bitrate of the output in kbit/s.
+            container (str): The container format of the output, e.g. "ogg".
+            mimetype (str): The content type of the output.
+            segment_command (str): The command template used to transcode a
+                single segment of a track. It is given {start} and {length}
+                as well.
+
+        """
+        self.name = name
+        self.command = command
+        self.codec = codec
+        self.bitrate = bitrate
+        self.container = container
+        self.mimetype = mimetype
+        self.segment_command = segment_command
+
+    @classmethod
+    def from_command(cls, command):
+        """Create an unnamed profile from a free-form transcode command.
+
+        Args:
+            command (str): The command template.
+
+        """
+        return cls(None, command)
+
+    @classmethod
+    def from_config(cls, config):
+        """Read every profile defined in a config file.
+
+        Profiles are sections named "profile:<name>".
+
+        Args:
+            config (configparser.ConfigParser): The parsed config.
+
+        Returns:
+            OrderedDict[str, TranscodeProfile]: The profiles by name.
+
+        """
+        profiles = OrderedDict()
+
+        for section in config.sections():
+            if not section.startswith(cls.section_prefix):
+                continue
+
+            name = section[len(cls.section_prefix):]
+
+            segment_command = None
+            if config.has_option(section, "segment_command"):
+                segment_command = config.get(section, "segment_command")
+
+            profiles[name] = cls(
+                name, config.get(section, "command"),
+                codec=config.get(section, "codec"),
+                bitrate=config.getint(section, "bitrate"),
+                container=config.get(section, "container"),
+                mimetype=config.get(section, "mimetype"),
+                segment_command=segment_command)
+
+        return profiles
+
+    @property
+    def tokens(self):
+        """The command template split into arguments."""
+        return self.command.split()
+
+    def identity(self, start=0, length=None):
+        """Return the values that determine the profile's output.
+
+        Used as part of the transcode cache key, so that changing any of
+        them invalidates the files transcoded with the old settings.
+
+        Args:
+            start (float): The offset in seconds the transcode starts at.
+            length (float): The length in seconds of a segment, or None for
+                the rest of the track.
+
+        """
+        identity = [self.name, self.codec, self.bitrate, self.container,
+                    self.tokens]
+
+        if start:
+            identity.append(start)
+
+        if length:
+            identity.extend(["segment", self.segment_command.split(), length])
+
+        return identity
+
+    def allows_bitrate(self, bitrate):
+        """Check whether a stream's bitrate is within the profile's.
+
+        Args:
+            bitrate (int): The bitrate of the stream in kbit/s.
+
+        """
+        if not self.bitrate:
+            return True
+
+        return bool(bitrate) and bitrate <= self.bitrate
+
+    def satisfied_by(self, source):
+        """Check whether a source file already matches the profile's output.
+
+        Args:
+            source (Track): The track to check. Its format, codec and bitrate
+                are recorded when the library is scanned.
+
+        Returns:
+            bool: True if the file can be sent without transcoding.
+
+        """
+        source_codec = getattr(source, "codec", None)
+        source_format = getattr(source, "format", None)
+
+        if not self.codec or not source_codec:
+            return False
+
+        return (source_codec == self.codec and
+                source_format == self.container and
+                self.allows_bitrate(getattr(source, "bitrate", None)))
+
+    @property
+    def seekable(self):
+        """Whether the command can start transcoding at a time offset."""
+        return "{start}" in self.command
+
+    @property
+    def segmentable(self):
+        """Whether the profile can transcode fixed-length segments."""
+        return bool(self.segment_command and
+                    "{start}" in self.segment_command and
+                    "{length}" in self.segment_command)
+
+    def command_items(self, filename, output, start=0, length=None):
+        """Build the command to transcode a file.
+
+        Args:
+            filename (str): The path of the source file.
+            output (str): The path, or pipe placeholder, to write to.
+            start (float): The offset in seconds to start transcoding at.
+            length (float): The length in seconds of the segment to
+                transcode. The segment command is used when it is given.
+
+        Returns:
+            List[str]: The command and its arguments.
+
+        """
+        tokens = self.tokens
+        if length:
+            tokens = self.segment_command.split()
+
+        command_items = []
+        for token in tokens:
+            if token == "{filename}":
+                command_items.append(filename)
+            elif token == "{output}":
+                command_items.append(output)
+            else:
+                command_items.append(
+                    token.replace("{bitrate}", str(self.bitrate)).replace(
+                        "{start}", "%.3f" % start).replace(
+                            "{length}", "%.3f" % (length or 0)))
+
+        return command_items
+
+    def as_dict(self):
+        """Return the profile as a dict."""
+        return dict(name=self.name, codec=self.codec, bitrate=self.bitrate,
+                    container=self.container, mimetype=self.mimetype,
+                    segmentable=self.segmentable)
@@ -0,0 +1,201 @@
+"""
+scheduler exposes a TranscodeScheduler class to limit how many transcoders
+run at once, both in total and for each user.
+"""
+import time
+
+from gevent.lock import BoundedSemaphore
+
+from transcode.stream import stop_process
+
+
+class SchedulerBusy(Exception):
+    """Raised when no transcoder slot became free in time."""
+    pass
+
+
+class TranscodeSlot(object):
+    """A running transcoder's claim on the scheduler."""
+
+    def __init__(self, scheduler, user_id):
+        self.__scheduler = scheduler
+        self.__user_id = user_id
+        self.__released = False
+        self.proc = None
+
+    def attach(self, proc):
+        """Tie a transcoder process to the slot.
+
+        Args:
+            proc (subprocess.Popen): The transcoder.
+
+        """
+        self.proc = proc
+
+    def release(self, abandoned=False):
+        """Give the slot back to the scheduler. Safe to call repeatedly.
+
+        A transcoder still running at this point has lost its listener, so
+        it is stopped.
+
+        Args:
+            abandoned (bool): Whether the transcoder's output was not read to
+                the end.
+
+        """
+        if not self.__released:
+            self.__released = True
+
+            reclaimed = False
+            if self.proc:
+                reclaimed = stop_process(self.proc) or abandoned
+
+            self.__scheduler.release(self.__user_id, reclaimed)
+
+    def hold(self, stream):
+        """Keep the slot until a response stream finishes or is closed.
+
+        Args:
+            stream (Iterable[bytes]): The response stream.
+
+        Returns:
+            HeldStream: The stream, to be used as the response body.
+
+        """
+        return HeldStream(self, stream)
+
+
+class HeldStream(object):
+    """A response stream that releases its transcoder slot when closed.
+
+    WSGI servers close the response when the client disconnects, even if it
+    has not been iterated yet.
+
+    """
+
+    def __init__(self, slot, stream):
+        self.__slot = slot
+        self.__stream = stream
+        self.__iterator = iter(stream)
+        self.__finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.__iterator)
+        except StopIteration:
+            self.__finished = True
+            self.close()
+            raise
+
+    next = __next__
+
+    def close(self):
+        """Close the underlying stream and release the slot."""
+        try:
+            close = getattr(self.__stream, "close", None)
+            if close:
+                close()
+        finally:
+            self.__slot.release(abandoned=not self.__finished)
+
+
+class TranscodeScheduler(object):
+    """Admits transcoders up to a global and a per-user limit.
+
+    Requests over either limit wait in line for up to queue_timeout seconds
+    before they are turned away.
+
+    """
+
+    def __init__(self, max_processes, max_processes_per_user, queue_timeout):
+        """Create the scheduler.
+
+        Args:
+            max_processes (int): The most transcoders to run at once.
+            max_processes_per_user (int): The most transcoders to run at once
+                for a single user.
+            queue_timeout (float): How long, in seconds, a request may wait
+                for a free slot.
+
+        """
+        self.max_processes = max_processes
+        self.max_processes_per_user = max_processes_per_user
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.reclaimed = 0
+
+        self.__slots = BoundedSemaphore(max_processes)
+        self.__user_slots = {}
+
+    def __user_semaphore(self, user_id):
+        if user_id not in self.__user_slots:
+            self.__user_slots[user_id] = BoundedSemaphore(
+                self.max_processes_per_user)
+
+        return self.__user_slots[user_id]
+
+    def acquire(self, user_id, timeout=None):
+        """Wait for a transcoder slot.
+
+        Args:
+            user_id (int): The ID of the user requesting the transcode.
+            timeout (obj:`float`, optional): How long, in seconds, to wait.
+                Defaults to None, which waits for queue_timeout.
+
+        Returns:
+            TranscodeSlot: The slot, to be released when the transcoder exits.
+
+        Raises:
+            SchedulerBusy: If no slot became free within queue_timeout.
+
+        """
+        if timeout is None:
+            timeout = self.queue_timeout
+
+        deadline = time.time() + timeout
+        user_slots = self.__user_semaphore(user_id)
+
+        self.waiting += 1
+        try:
+            if not user_slots.acquire(timeout=timeout):
+                self.rejected += 1
+                raise SchedulerBusy(user_id)
+
+            if not self.__slots.acquire(
+                    timeout=max(deadline - time.time(), 0)):
+                user_slots.release()
+                self.rejected += 1
+                raise SchedulerBusy(user_id)
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+
+        return TranscodeSlot(self, user_id)
+
+    def release(self, user_id, reclaimed=False):
+        """Free a slot taken by acquire().
+
+        Args:
+            user_id (int): The ID of the user the slot was acquired for.
+            reclaimed (bool): Whether the slot's transcoder had to be stopped
+                because its listener went away.
+
+        """
+        self.running -= 1
+        if reclaimed:
+            self.reclaimed += 1
+        self.__slots.release()
+        self.__user_slots[user_id].release()
+
+    def stats(self):
+        """Return the scheduler counters as a dict."""
+        return dict(running=self.running, queue_depth=self.waiting,
+                    rejected=self.rejected, reclaimed=self.reclaimed,
+                    max_processes=self.max_processes,
+                    max_processes_per_user=self.max_processes_per_user)
@@ -0,0 +1,100 @@
+"""
+segments splits tracks into fixed-length segments and builds the HLS-style
+playlists that list them.
+"""
+import math
+
+
+PLAYLIST_MIMETYPE = "application/vnd.apple.mpegurl"
+
+
+def segment_count(duration, segment_length):
+    """Return the number of segments a track is split into.
+
+    Args:
+        duration (float): The length of the track in seconds.
+        segment_length (float): The length of each segment in seconds.
+
+    """
+    if not duration:
+        return 0
+
+    return int(math.ceil(duration / float(segment_length)))
+
+
+def segment_bounds(duration, segment_length, index):
+    """Return the offset and length of a segment.
+
+    The last segment is shorter than the others unless the track's length
+    is a multiple of the segment length.
+
+    Args:
+        duration (float): The length of the track in seconds.
+        segment_length (float): The length of each segment in seconds.
+        index (int): The number of the segment, starting from 0.
+
+    Returns:
+        Tuple[float, float]: The start and length of the segment in seconds.
+
+    Raises:
+        IndexError: If the track has no segment with that number.
+
+    """
+    if index < 0 or index >= segment_count(duration, segment_length):
+        raise IndexError("No segment %d" % index)
+
+    start = float(index * segment_length)
+
+    return start, min(float(segment_length), duration - start)
+
+
+def media_playlist(duration, segment_length, segment_url):
+    """Build the playlist of a track's segments.
+
+    Args:
+        duration (float): The length of the track in seconds.
+        segment_length (float): The length of each segment in seconds.
+        segment_url (Callable[[int], str]): Returns the URL of a segment
+            from its number.
+
+    Returns:
+        str: The playlist.
+
+    """
+    lines = ["#EXTM3U",
+             "#EXT-X-VERSION:3",
+             "#EXT-X-PLAYLIST-TYPE:VOD",
+             "#EXT-X-TARGETDURATION:%d" % int(math.ceil(segment_length)),
+             "#EXT-X-MEDIA-SEQUENCE:0"]
+
+    for index in range(segment_count(duration, segment_length)):
+        length = segment_bounds(duration, segment_length, index)[1]
+        lines.append("#EXTINF:%.3f," % length)
+        lines.append(segment_url(index))
+
+    lines.append("#EXT-X-ENDLIST")
+
+    return "\n".join(lines) + "\n"
+
+
+def master_playlist(variants):
+    """Build a playlist listing the same track at several bitrates.
+
+    Clients switch between the variants at segment boundaries.
+
+    Args:
+        variants (List[Tuple[TranscodeProfile, str]]): Each profile and the
+            URL of its media playlist.
+
+    Returns:
+        str: The playlist.
+
+    """
+    lines = ["#EXTM3U"]
+
+    for profile, url in variants:
+        lines.append("#EXT-X-STREAM-INF:BANDWIDTH=%d" %
+                     ((profile.bitrate or 0) * 1000))
+        lines.append(url)
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,381 @@
+"""
+stream exposes generators to stream a running transcoder's output to the
+client without blocking the gevent hub.
+"""
+import errno
+import fcntl
+import os
+import subprocess
+import tempfile
+import time
+
+import gevent
+from gevent.socket import wait_read
+
+from common.responses import read_file
+from transcode.cache import TranscodeCache
+
+
+def set_nonblocking(fileobj):
+    """Put a file object's descriptor into non-blocking mode.
+
+    Args:
+        fileobj (file): The file object.
+
+    """
+    fd = fileobj.fileno()
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def read_pipe(pipe, chunk_size=8192):
+    """Read a pipe until EOF, yielding to other greenlets while it is empty.
+
+    Args:
+        pipe (file): The read end of a pipe.
+        chunk_size (int): The maximum number of bytes to read at once.
+
+    """
+    set_nonblocking(pipe)
+    fd = pipe.fileno()
+
+    while True:
+        try:
+            chunk = os.read(fd, chunk_size)
+        except OSError as exc:
+            if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                wait_read(fd)
+                continue
+            raise
+
+        if not chunk:
+            break
+
+        yield chunk
+
+
+def remove_output(filename):
+    """Remove a partially written output file, if it exists.
+
+    Args:
+        filename (str): The path of the file.
+
+    """
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def start_transcode(profile, filename, output, pipe_output=None, niceness=0):
+    """Start a transcoder writing a whole track to a file.
+
+    Args:
+        profile (TranscodeProfile): The profile to transcode with.
+        filename (str): The path of the source file.
+        output (str): The path to write the transcoded track to.
+        pipe_output (str): If set, the transcoder writes to stdout and
+            {output} is replaced by this placeholder.
+        niceness (int): How much to lower the transcoder's priority by.
+
+    Returns:
+        subprocess.Popen: The transcoder.
+
+    Raises:
+        OSError: If the transcoder could not be started.
+
+    """
+    def lower_priority():
+        if niceness:
+            os.nice(niceness)
+
+    with open(output, "wb") as output_file:
+        if pipe_output:
+            return subprocess.Popen(
+                profile.command_items(filename, pipe_output),
+                stdout=output_file, preexec_fn=lower_priority)
+
+        return subprocess.Popen(profile.command_items(filename, output),
+                                preexec_fn=lower_priority)
+
+
+def wait_process(proc, poll_interval=0.05):
+    """Wait for a process to exit, yielding to other greenlets meanwhile.
+
+    Args:
+        proc (subprocess.Popen): The process.
+        poll_interval (float): How often, in seconds, to check if it exited.
+
+    Returns:
+        int: The process's return code.
+
+    """
+    while proc.poll() is None:
+        gevent.sleep(poll_interval)
+
+    return proc.returncode
+
+
+def stop_process(proc, timeout=2.0, poll_interval=0.05):
+    """Stop a transcoder that is still running.
+
+    The process is asked to terminate, and killed if it has not exited
+    within the timeout.
+
+    Args:
+        proc (subprocess.Popen): The transcoder.
+        timeout (float): How long, in seconds, to wait for it to exit.
+        poll_interval (float): How often, in seconds, to check if it exited.
+
+    Returns:
+        bool: True if the process was still running and had to be stopped.
+
+    """
+    if proc.poll() is not None:
+        return False
+
+    try:
+        proc.terminate()
+    except OSError:
+        # it exited in the meantime
+        return False
+
+    deadline = time.time() + timeout
+    while proc.poll() is None and time.time() < deadline:
+        gevent.sleep(poll_interval)
+
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+    return True
+
+
+class OutputStream(object):
+    """A transcoder's output stream that cleans up when it is closed early.
+
+    Closing a generator that has not started does not run its finally
+    clauses, and WSGI servers close responses without reading them, e.g.
+    for HEAD requests. The clean up is run whenever the stream is closed
+    before its end, whether or not it was read.
+
+    """
+
+    def __init__(self, chunks, abandon):
+        """Wrap a stream.
+
+        Args:
+            chunks (Iterator[bytes]): The stream.
+            abandon (Callable[[], None]): Cleans up after the stream if it is
+                closed before its end. It may be called after the stream has
+                cleaned up itself.
+
+        """
+        self.__chunks = chunks
+        self.__abandon = abandon
+        self.__finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.__chunks)
+        except StopIteration:
+            self.__finished = True
+            raise
+
+    next = __next__
+
+    def close(self):
+        """Close the stream, cleaning up if it did not end. Safe to call
+        repeatedly."""
+        try:
+            self.__chunks.close()
+        finally:
+            if not self.__finished:
+                self.__finished = True
+                self.__abandon()
+
+
+def stream_pipe(proc, chunk_size=8192, output=None, finished=None):
+    """Stream a transcoder writing to its stdout.
+
+    If the stream is closed before the transcoder's output ends, the pipe is
+    closed and the partially written output file is removed.
+
+    Args:
+        proc (subprocess.Popen): The transcoder, started with
+            stdout=subprocess.PIPE.
+        chunk_size (int): The size of the chunks to send.
+        output (str): If set, a path to also write the transcoded data to.
+        finished (Callable[[int], None]): Called with the transcoder's return
+            code once all its output has been sent.
+
+    Returns:
+        OutputStream: The transcoded data.
+
+    """
+    def abandon():
+        proc.stdout.close()
+
+        if output:
+            remove_output(output)
+
+    return OutputStream(_pipe_chunks(proc, chunk_size, output, finished),
+                        abandon)
+
+
+def _pipe_chunks(proc, chunk_size, output, finished):
+    completed = False
+    output_file = None
+
+    try:
+        if output:
+            output_file = open(output, "wb")
+
+        for chunk in read_pipe(proc.stdout, chunk_size):
+            if output_file:
+                # written through, so it can be read while it is transcoded
+                output_file.write(chunk)
+                output_file.flush()
+
+            yield chunk
+
+        completed = True
+    finally:
+        proc.stdout.close()
+
+        if output_file:
+            output_file.close()
+
+        if output and not completed:
+            remove_output(output)
+
+    returncode = proc.wait()
+
+    if finished:
+        finished(returncode)
+
+
+def stream_file(filename, proc, chunk_size=8192, finished=None,
+                poll_interval=0.05):
+    """Stream a file while a transcoder is still writing to it.
+
+    If the stream is closed before the transcoder's output ends, the
+    partially written file is removed.
+
+    Args:
+        filename (str): The file the transcoder is writing to.
+        proc (subprocess.Popen): The transcoder.
+        chunk_size (int): The size of the chunks to send.
+        finished (Callable[[int], None]): Called with the transcoder's return
+            code once all its output has been sent.
+        poll_interval (float): How long to wait, in seconds, when the reader
+            has caught up with the transcoder.
+
+    Returns:
+        OutputStream: The transcoded data.
+
+    """
+    return OutputStream(
+        _file_chunks(filename, proc, chunk_size, finished, poll_interval),
+        lambda: remove_output(filename))
+
+
+def _file_chunks(filename, proc, chunk_size, finished, poll_interval):
+    completed = False
+
+    try:
+        with open(filename, "rb") as streamed_file:
+            while True:
+                running = proc.poll() is None
+                chunk = streamed_file.read(chunk_size)
+
+                if chunk:
+                    yield chunk
+                elif running:
+                    gevent.sleep(poll_interval)
+                else:
+                    break
+
+        completed = True
+    finally:
+        if not completed:
+            remove_output(filename)
+
+    if finished:
+        finished(proc.returncode)
+
+
+def stream_transcode(profile, filename, slot, cache=None, chunk_size=8192,
+                     pipe_output="-"):
+    """Start streaming a whole transcoded track, from the cache if it is
+    there.
+
+    Otherwise the transcoder is started before this returns, so a failure
+    to start it can be handled before anything has been sent. It runs in a
+    slot the caller acquired and keeps, e.g. for a whole archive, and its
+    output is kept in the cache once it completes.
+
+    Args:
+        profile (TranscodeProfile): The profile to transcode with.
+        filename (str): The path of the source file.
+        slot (TranscodeSlot): The scheduler slot to run the transcoder in,
+            or None if the track was found in the cache beforehand.
+        cache (TranscodeCache): The transcode cache, if any.
+        chunk_size (int): The size of the chunks to send.
+        pipe_output (str): If set, the transcoder writes to stdout and
+            {output} is replaced by this placeholder. Otherwise it writes to
+            a file, which is streamed as it grows.
+
+    Returns:
+        Iterable[bytes]: The transcoded track.
+
+    Raises:
+        ValueError: If there is no slot and the track is not cached.
+        OSError: If the transcoder could not be started.
+
+    """
+    def finished(returncode):
+        if cache and returncode == 0:
+            cache.put(key, temp_filename)
+        elif temp_filename:
+            remove_output(temp_filename)
+
+    key = TranscodeCache.key(filename, profile.identity())
+    temp_filename = None
+
+    if cache:
+        cached_filename = cache.get(key)
+
+        if cached_filename:
+            return read_file(cached_filename, chunk_size)
+
+    if slot is None:
+        raise ValueError("%s is no longer cached" % filename)
+
+    if cache:
+        temp_filename = cache.temp_path(key)
+
+    if pipe_output:
+        proc = subprocess.Popen(profile.command_items(filename, pipe_output),
+                                stdout=subprocess.PIPE)
+        slot.attach(proc)
+
+        return stream_pipe(proc, chunk_size, output=temp_filename,
+                           finished=finished)
+
+    if not temp_filename:
+        temp_fd, temp_filename = tempfile.mkstemp()
+        os.close(temp_fd)
+
+    try:
+        proc = start_transcode(profile, filename, temp_filename)
+    except OSError:
+        remove_output(temp_filename)
+        raise
+
+    slot.attach(proc)
+
+    return stream_file(temp_filename, proc, chunk_size, finished=finished)